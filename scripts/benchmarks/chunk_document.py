@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmarks `chunk_document`, which splits the knowledge documents into the
+chunks used as context by `ilab generate`.
+
+Builds a synthetic markdown corpus of --size MB (headings, paragraphs, lists
+and an occasional very long line) split in documents of --document-size KB,
+then measures the time to chunk it with the default 1000 words per chunk.
+With --baseline, langchain's RecursiveCharacterTextSplitter, which the
+chunker replaces, is measured as well (it has to be installed separately),
+and both are checked to give the same chunks.
+
+Usage: python scripts/benchmarks/chunk_document.py [--size 100] [--document-size 256] [--baseline]
+"""
+
+# Standard
+import argparse
+import random
+import time
+
+# First Party
+from instructlab import utils
+
+WORDS = (
+    "the phoenix is a mythical bird that cyclically regenerates or is otherwise "
+    "born again associated with the sun it obtains new life by rising from the "
+    "ashes of its predecessor"
+).split()
+
+
+def _paragraph(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 200)))
+
+
+def make_document(rng, size):
+    parts = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            part = f"## {_paragraph(rng)[:60]}\n\n"
+        elif kind < 0.3:
+            part = "\n".join(f"- {_paragraph(rng)[:80]}" for _ in range(5)) + "\n\n"
+        elif kind < 0.31:
+            # a table or a minified block without any line break
+            part = "|".join(_paragraph(rng) for _ in range(30)) + "\n\n"
+        else:
+            part = _paragraph(rng) + "\n\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def baseline_chunks(documents, chunk_size, chunk_overlap):
+    """The previous implementation, kept for comparison."""
+    # pylint: disable=C0415
+    # Third Party
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        separators=["\n\n", "\n", " "],
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    content = []
+    for docs in documents:
+        temp = text_splitter.create_documents([docs])
+        content.extend([item.page_content for item in temp])
+    return content
+
+
+def engine_chunks(documents, chunk_size, chunk_overlap):
+    return list(utils.iter_chunks(documents, chunk_size, chunk_overlap))
+
+
+def measure(name, func, documents, chunk_size):
+    start = time.perf_counter()
+    chunks = func(documents, chunk_size, utils.DEFAULT_CHUNK_OVERLAP)
+    duration = time.perf_counter() - start
+    print(f"{name:>8}: {duration:.2f}s, {len(chunks)} chunks")
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--size", type=int, default=100, help="corpus size in MB")
+    parser.add_argument("--document-size", type=int, default=256, help="in KB")
+    parser.add_argument("--chunk-word-count", type=int, default=1000)
+    parser.add_argument(
+        "--baseline", action="store_true", help="also measure the previous approach"
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    start = time.perf_counter()
+    documents = [
+        make_document(rng, args.document_size * 1024)
+        for _ in range(args.size * 1024 // args.document_size)
+    ]
+    print(
+        f"{len(documents)} documents, {sum(map(len, documents)) / 2**20:.0f} MB "
+        f"built in {time.perf_counter() - start:.1f}s"
+    )
+    chunk_size = utils.num_chars_from_tokens(
+        utils.num_tokens_from_words(args.chunk_word_count)
+    )
+    chunks = measure("engine", engine_chunks, documents, chunk_size)
+    if args.baseline:
+        baseline = measure("baseline", baseline_chunks, documents, chunk_size)
+        if baseline != chunks:
+            raise SystemExit("baseline and engine disagree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmarks the whole `ilab generate` loop against a local mock teacher.
+
+Starts the mock teacher of scripts/benchmarks/mock_teacher.py in-process and
+runs `generate_data` on a taxonomy of --skills copies of
+tests/testdata/skill_valid_answer.yaml, once per combination of
+--num-instructions and --num-cpus, and reports the throughput of each run
+from its metrics file. With --save the results are written as JSON, and
+with --compare the throughput of a previous run's results is shown next to
+the current one, so changes to the pipeline can be compared run over run.
+
+Usage: python scripts/benchmarks/generate.py [--num-instructions 100 500] [--num-cpus 1 4] [--latency 0.05] [--save results.json] [--compare results.json]
+"""
+
+# Standard
+import argparse
+import glob
+import json
+import logging
+import os
+import tempfile
+import time
+
+# Third Party
+import git
+
+# First Party
+from instructlab.generator.generate_data import generate_data
+
+# Local
+from mock_teacher import MockTeacher, add_arguments
+
+SKILL = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "..",
+    "tests",
+    "testdata",
+    "skill_valid_answer.yaml",
+)
+
+
+def make_taxonomy(root, skills):
+    repo = git.Repo.init(root, initial_branch="main")
+    with open(os.path.join(root, "README.md"), "w", encoding="utf-8"):
+        pass
+    repo.index.add(["README.md"])
+    repo.index.commit("Initial commit")
+    with open(SKILL, encoding="utf-8") as f:
+        skill = f.read()
+    for idx in range(skills):
+        skill_dir = os.path.join(root, "compositional_skills", f"skill{idx}")
+        os.makedirs(skill_dir)
+        with open(os.path.join(skill_dir, "qna.yaml"), "w", encoding="utf-8") as f:
+            f.write(skill)
+
+
+def run(teacher, taxonomy, output_dir, args, num_instructions, num_cpus):
+    start = time.perf_counter()
+    generate_data(
+        logger=logging.getLogger("benchmark"),
+        api_base=teacher.api_base,
+        api_key="",
+        tls_insecure=True,
+        model_family="merlinite",
+        model_name=teacher.model,
+        output_dir=output_dir,
+        taxonomy=taxonomy,
+        taxonomy_base="main",
+        prompt_file_path="prompt.txt",
+        num_cpus=num_cpus,
+        num_instructions_to_generate=num_instructions,
+        request_batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+        rouge_threshold=0.9,
+        console_output=False,
+        chunk_word_count=1000,
+        server_ctx_size=4096,
+        dedup_backend=args.dedup_backend,
+    )
+    duration = time.perf_counter() - start
+    (metrics_file,) = glob.glob(os.path.join(output_dir, "metrics_*.jsonl"))
+    with open(metrics_file, encoding="utf-8") as f:
+        summary = json.loads(f.readlines()[-1])
+    return {
+        "num_instructions": num_instructions,
+        "num_cpus": num_cpus,
+        "duration": round(duration, 3),
+        "samples": summary["kept"],
+        "samples_per_sec": round(summary["kept"] / duration, 3),
+        "requests": summary["requests"],
+        "tokens_per_sec": summary["tokens_per_sec"],
+        "dedup_time": summary["timings"]["dedup_time"]["total"],
+        "result_wait": summary["timings"]["result_wait"]["total"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--num-instructions", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--num-cpus", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--skills", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--dedup-backend", default="index")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="results of a previous run to compare to")
+    add_arguments(parser)
+    parser.set_defaults(latency=0.05)
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = {(r["num_instructions"], r["num_cpus"]): r for r in json.load(f)}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, MockTeacher.from_args(args) as teacher:
+        taxonomy = os.path.join(tmp, "taxonomy")
+        make_taxonomy(taxonomy, args.skills)
+        print(
+            f"{'instructions':>12} {'cpus':>4} {'time':>8} {'samples/s':>10} "
+            f"{'tokens/s':>10} {'dedup':>7} {'wait':>7}"
+        )
+        for num_instructions in args.num_instructions:
+            for num_cpus in args.num_cpus:
+                output_dir = os.path.join(
+                    tmp, f"generated_{num_instructions}_{num_cpus}"
+                )
+                result = run(
+                    teacher, taxonomy, output_dir, args, num_instructions, num_cpus
+                )
+                results.append(result)
+                line = (
+                    f"{num_instructions:>12} {num_cpus:>4} {result['duration']:>7.2f}s "
+                    f"{result['samples_per_sec']:>10.1f} {result['tokens_per_sec']:>10.1f} "
+                    f"{result['dedup_time']:>6.2f}s {result['result_wait']:>6.2f}s"
+                )
+                before = previous.get((num_instructions, num_cpus))
+                if before:
+                    change = result["samples_per_sec"] / before["samples_per_sec"] - 1
+                    line += f"  ({change:+.1%} samples/s)"
+                print(line)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+A local stand-in for the teacher model server of `ilab generate`.
+
+Serves the OpenAI models and chat completions endpoints, and the tokenize
+count extension of llama-cpp-python servers, with canned responses in the
+"* Task N" format that `ilab generate` parses. Responses continue the task
+numbering of the prompt and honor the stop sequences of the request, as a
+real teacher does. The instructions are made of words drawn from a generator
+seeded with --seed and the number of the response, so a run gets the same
+responses in the same order and they pass the ROUGE filter. Every response
+takes --latency seconds, plus its completion tokens at --tokens-per-second.
+Tokens are counted as whitespace separated words.
+
+Usage: python scripts/benchmarks/mock_teacher.py [--port 8000] [--latency 0.1] [--tokens-per-second 0]
+Then:  ilab generate --endpoint-url http://127.0.0.1:8000/v1 --model mock-teacher
+"""
+
+# Standard
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+DEFAULT_MODEL = "mock-teacher"
+
+SYLLABLES = (
+    "ba be bi bo bu da de di do du ka ke ki ko ku la le li lo lu ma me mi mo mu "
+    "na ne ni no nu pa pe pi po pu ra re ri ro ru sa se si so su ta te ti to tu"
+).split()
+
+_TASK_RE = re.compile(r"\* Task (\d+)")
+
+
+def _word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+
+def _sentence(rng, low, high):
+    return " ".join(_word(rng) for _ in range(rng.randint(low, high)))
+
+
+def make_response(rng, first_task, tasks, discard_rate=0.0):
+    """Tasks numbered from first_task, without the header of the first one."""
+    parts = []
+    for number in range(first_task, first_task + tasks):
+        header = f"* Task {number}\n" if number != first_task else ""
+        if rng.random() < discard_rate:
+            # no output section, discarded by the parser
+            parts.append(f"{header}** Instruction\n{_sentence(rng, 8, 16)}\n\n")
+            continue
+        parts.append(
+            f"{header}** Instruction\n{_sentence(rng, 8, 16).capitalize()}.\n"
+            f"** Input\n<noinput>\n"
+            f"** Output\n{_sentence(rng, 20, 80).capitalize()}.\n\n"
+        )
+    return "".join(parts)
+
+
+def count_tokens(text):
+    return len(text.split())
+
+
+class MockTeacher(ThreadingHTTPServer):  # pylint: disable=too-many-instance-attributes
+    """HTTP server of the canned teacher responses.
+
+    Used as a context manager, the server runs in a background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        model=DEFAULT_MODEL,
+        latency=0.0,
+        tokens_per_second=0.0,
+        tasks=3,
+        discard_rate=0.0,
+        seed=0,
+    ):
+        super().__init__((host, port), _Handler)
+        self.model = model
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.tasks = tasks
+        self.discard_rate = discard_rate
+        self.seed = seed
+        self._responses = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_args(cls, args, host="127.0.0.1", port=0):
+        """A server configured by the options of add_arguments."""
+        return cls(
+            host,
+            port,
+            model=args.model,
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            tasks=args.tasks,
+            discard_rate=args.discard_rate,
+            seed=args.seed,
+        )
+
+    @property
+    def api_base(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def next_rng(self):
+        return random.Random(f"{self.seed}-{next(self._responses)}")
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, as the teacher clients reuse their connections
+    protocol_version = "HTTP/1.1"
+    server: MockTeacher
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self):
+        self._send(404, {"error": {"message": f"{self.path} not found"}})
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.rstrip("/") != "/v1/models":
+            self._not_found()
+            return
+        self._send(
+            200,
+            {
+                "object": "list",
+                "data": [
+                    {
+                        "id": self.server.model,
+                        "object": "model",
+                        "created": 0,
+                        "owned_by": "mock",
+                    }
+                ],
+            },
+        )
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/extras/tokenize/count":
+            self._send(200, {"count": count_tokens(request.get("input", ""))})
+        elif self.path == "/v1/chat/completions":
+            self._chat_completion(request)
+        else:
+            self._not_found()
+
+    def _chat_completion(self, request):
+        start = time.perf_counter()
+        server = self.server
+        if request.get("model") != server.model:
+            self._send(
+                404,
+                {
+                    "error": {
+                        "message": f"The model {request.get('model')} does not exist"
+                    }
+                },
+            )
+            return
+        prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+        numbers = _TASK_RE.findall(prompt)
+        first_task = int(numbers[-1]) if numbers else 1
+        content = make_response(
+            server.next_rng(), first_task, server.tasks, server.discard_rate
+        )
+        finish_reason = "length"
+        for stop in request.get("stop") or []:
+            idx = content.find(stop)
+            if idx != -1:
+                content = content[:idx]
+                finish_reason = "stop"
+        completion_tokens = count_tokens(content)
+        delay = server.latency
+        if server.tokens_per_second > 0:
+            delay += completion_tokens / server.tokens_per_second
+        time.sleep(max(0.0, delay - (time.perf_counter() - start)))
+        prompt_tokens = count_tokens(prompt)
+        self._send(
+            200,
+            {
+                "id": f"chatcmpl-{time.monotonic_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": server.model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": finish_reason,
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+
+def add_arguments(parser):
+    """Options of the responses of the mock teacher."""
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument(
+        "--latency", type=float, default=0.1, help="seconds per response"
+    )
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=0.0,
+        help="completion token rate, 0 for no token delay",
+    )
+    parser.add_argument(
+        "--tasks", type=int, default=3, help="tasks per response, before stopping"
+    )
+    parser.add_argument(
+        "--discard-rate",
+        type=float,
+        default=0.0,
+        help="fraction of malformed tasks",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = MockTeacher.from_args(args, args.host, args.port)
+    print(f"Serving {args.model} at {server.api_base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmarks the post-processing of teacher responses in `ilab generate`.
+
+Parses the corpus of raw teacher responses in
+tests/testdata/teacher_responses.jsonl, repeated to the requested number of
+responses, in request batches. With --baseline the previous approach (a
+regex compiled per denylist word and instruction, and the discard log
+reopened for every discarded instruction) is measured as well, and both
+are checked to give the same instructions.
+
+Usage: python scripts/benchmarks/post_process.py [--responses 10000] [--batch-size 5] [--baseline]
+"""
+
+# Standard
+from types import SimpleNamespace
+import argparse
+import json
+import os
+import re
+import string
+import tempfile
+import time
+
+# First Party
+from instructlab.generator import generate_data
+
+CORPUS = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "..",
+    "tests",
+    "testdata",
+    "teacher_responses.jsonl",
+)
+
+
+def load_corpus(path, count):
+    with open(path, encoding="utf-8") as f:
+        contents = [json.loads(line)["content"] for line in f]
+    return [
+        SimpleNamespace(message=SimpleNamespace(content=contents[i % len(contents)]))
+        for i in range(count)
+    ]
+
+
+def baseline_post_process(num_prompt_instructions, response, discarded_file):
+    """The previous implementation, kept for comparison."""
+    raw_instructions = re.split(
+        r"\* Task \d+",
+        f"* Task {num_prompt_instructions + 1}\n" + response.message.content,
+    )
+    instructions = []
+    discarded = 0
+    for inst in raw_instructions:
+        if not inst.strip():
+            continue
+        splitted_data = re.split(r"\*\*\s+(Instruction|Input|Output):?", inst)
+        if len(splitted_data) != 7:
+            generate_data.writeline2file(discarded_file, repr(inst))
+            discarded += 1
+            continue
+        inst = splitted_data[2].strip()
+        prompt_input = splitted_data[4].strip()
+        prompt_input = "" if prompt_input.lower() == "<noinput>" else prompt_input
+        prompt_output = splitted_data[6].strip()
+        if (
+            len(inst.split()) <= 3
+            or len(inst.split()) > 150
+            or any(
+                re.compile(r"\b({0})\b".format(w), flags=re.IGNORECASE).search(inst)
+                for w in generate_data._WORD_DENYLIST
+            )
+            or inst.startswith("Write a program")
+            or inst[0] in string.punctuation
+            or not inst[0].isascii()
+        ):
+            generate_data.writeline2file(discarded_file, repr(splitted_data))
+            discarded += 1
+            continue
+        instructions.append(
+            {"instruction": inst, "input": prompt_input, "output": prompt_output}
+        )
+    return instructions, discarded
+
+
+def run_baseline(responses, batch_size, discarded_file):
+    instructions = []
+    for start in range(0, len(responses), batch_size):
+        for response in responses[start : start + batch_size]:
+            instructions += baseline_post_process(2, response, discarded_file)[0]
+    return instructions
+
+
+def run_batched(responses, batch_size, discarded_file):
+    instructions = []
+    for start in range(0, len(responses), batch_size):
+        instructions += generate_data.post_process_gpt3_responses(
+            2, responses[start : start + batch_size], discarded_file
+        )[0]
+    return instructions
+
+
+def measure(name, func, responses, batch_size):
+    # re caches compiled patterns, clear it so the baseline pays for them as
+    # it would once the cache overflows in a long run
+    re.purge()
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        instructions = func(responses, batch_size, os.path.join(tmp, "discarded.log"))
+        duration = time.perf_counter() - start
+    print(
+        f"{name:>8}: {duration:.3f}s, "
+        f"{duration / len(responses) * 1e6:.1f}us per response, "
+        f"{len(instructions)} instructions kept"
+    )
+    return instructions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--responses", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument(
+        "--baseline", action="store_true", help="also measure the previous approach"
+    )
+    args = parser.parse_args()
+
+    responses = load_corpus(args.corpus, args.responses)
+    batched = measure("batched", run_batched, responses, args.batch_size)
+    if args.baseline:
+        baseline = measure("baseline", run_baseline, responses, args.batch_size)
+        if baseline != batched:
+            raise SystemExit("baseline and batched post-processing disagree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmarks the ROUGE-L near-duplicate filter used by `ilab generate`.
+
+Measures per-candidate latency of the dedup backends against a synthetic
+corpus of accepted instructions, and the recall of each backend against the
+brute-force decisions. Half of the candidates are light mutations of corpus
+entries so that both duplicates and novel instructions are exercised. With
+--baseline the previous approach (a new process pool for every candidate) is
+measured as well.
+
+Usage: python scripts/benchmarks/rouge_dedup.py [--sizes 1000 10000 50000] [--num-cpus 10]
+"""
+
+# Standard
+import argparse
+import functools
+import multiprocessing
+import random
+import statistics
+import time
+
+# Third Party
+from rouge_score import rouge_scorer
+
+# First Party
+from instructlab.config import DEFAULT_MULTIPROCESSING_START_METHOD
+from instructlab.generator.similarity import SIMILARITY_BACKENDS, get_similarity_backend
+
+WORDS = [f"w{i}" for i in range(2000)]
+
+
+def make_instructions(count, rng):
+    return [
+        [rng.choice(WORDS) for _ in range(rng.randint(8, 25))] for _ in range(count)
+    ]
+
+
+def make_candidates(corpus, count, rng):
+    candidates = make_instructions(count // 2, rng)
+    for _ in range(count - len(candidates)):
+        tokens = list(rng.choice(corpus))
+        tokens[rng.randrange(len(tokens))] = rng.choice(WORDS)
+        candidates.append(tokens)
+    rng.shuffle(candidates)
+    return candidates
+
+
+def bench_backend(backend, corpus, candidates, num_cpus, threshold):
+    start = time.perf_counter()
+    with get_similarity_backend(backend, corpus, num_workers=num_cpus) as engine:
+        # wait for any workers to come up before timing candidates
+        engine.is_duplicate([], threshold)
+        startup = time.perf_counter() - start
+        latencies = []
+        decisions = []
+        for tokens in candidates:
+            start = time.perf_counter()
+            decisions.append(engine.is_duplicate(tokens, threshold))
+            latencies.append(time.perf_counter() - start)
+    return startup, latencies, decisions
+
+
+def bench_baseline(corpus, candidates, num_cpus):
+    mpctx = multiprocessing.get_context(DEFAULT_MULTIPROCESSING_START_METHOD)
+    latencies = []
+    for tokens in candidates:
+        start = time.perf_counter()
+        with mpctx.Pool(num_cpus) as pool:
+            scores = pool.map(
+                functools.partial(rouge_scorer._score_lcs, tokens), corpus
+            )
+        pool.join()
+        max(score.fmeasure for score in scores)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(label, latencies, extra=""):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{label:<28} mean {statistics.mean(latencies) * 1000:9.2f} ms"
+        f"  p50 {statistics.median(latencies) * 1000:9.2f} ms"
+        f"  p95 {p95 * 1000:9.2f} ms{extra}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=SIMILARITY_BACKENDS,
+        default=SIMILARITY_BACKENDS,
+    )
+    parser.add_argument("--num-cpus", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--rouge-threshold", type=float, default=0.9)
+    parser.add_argument("--baseline", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        corpus = make_instructions(size, rng)
+        candidates = make_candidates(corpus, args.candidates, rng)
+        # brute force decisions are the reference for recall
+        expected = [
+            max(rouge_scorer._score_lcs(c, t).fmeasure for t in corpus)
+            > args.rouge_threshold
+            for c in candidates
+        ]
+        print(f"corpus {size}: {sum(expected)}/{len(candidates)} duplicates")
+        for backend in args.backends:
+            startup, latencies, decisions = bench_backend(
+                backend, corpus, candidates, args.num_cpus, args.rouge_threshold
+            )
+            found = sum(1 for e, d in zip(expected, decisions) if e and d)
+            recall = found / sum(expected) if any(expected) else 1.0
+            mismatches = sum(1 for e, d in zip(expected, decisions) if e != d)
+            report(
+                f"  {backend} (startup {startup * 1000:.0f} ms)",
+                latencies,
+                f"  recall {recall:.3f}  mismatches {mismatches}",
+            )
+        if args.baseline:
+            report(
+                f"  pool per candidate ({args.num_cpus})",
+                bench_baseline(corpus, candidates, args.num_cpus),
+            )
+
+
+if __name__ == "__main__":
+    main()
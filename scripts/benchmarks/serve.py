@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmarks `ilab serve` under concurrent chat completion load.
+
+Starts the server on --model-path (a tiny GGUF model is enough) once per
+--parallel-slots value, or uses the server at --endpoint-url, and sends
+--requests chat completions from each of --clients concurrent clients that
+keep their connections alive. Reports the completed and rejected (503)
+requests, the latency percentiles of the completed ones and the completion
+tokens per second.
+
+Usage: python scripts/benchmarks/serve.py --model-path tiny.gguf [--parallel-slots 1 4] [--clients 8] [--requests 4] [--max-tokens 64]
+"""
+
+# Standard
+import argparse
+import asyncio
+import logging
+import math
+import multiprocessing
+import socket
+import statistics
+import time
+
+# Third Party
+import httpx
+
+# First Party
+from instructlab.config import DEFAULT_MULTIPROCESSING_START_METHOD
+from instructlab.server import server
+
+
+def free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, parallel_slots):
+    host = "127.0.0.1"
+    port = free_port(host)
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.ERROR)
+    process = multiprocessing.get_context(DEFAULT_MULTIPROCESSING_START_METHOD).Process(
+        target=server,
+        kwargs={
+            "logger": logger,
+            "model_path": args.model_path,
+            "gpu_layers": 0,
+            "max_ctx_size": args.max_ctx_size,
+            "model_family": "merlinite",
+            "threads": args.threads,
+            "host": host,
+            "port": port,
+            "parallel_slots": parallel_slots,
+            "max_queue": args.max_queue,
+        },
+        daemon=True,
+    )
+    process.start()
+    api_base = f"http://{host}:{port}/v1"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{api_base}/models", timeout=1).raise_for_status()
+            return process, api_base
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit("the server did not start")
+
+
+async def client(http, api_base, model, args, results):
+    for idx in range(args.requests):
+        start = time.perf_counter()
+        response = await http.post(
+            f"{api_base}/chat/completions",
+            json={
+                "model": model,
+                "messages": [{"role": "user", "content": f"Question {idx}: why?"}],
+                "max_tokens": args.max_tokens,
+                "temperature": 0,
+            },
+        )
+        latency = time.perf_counter() - start
+        if response.status_code == 200:
+            tokens = response.json()["usage"]["completion_tokens"]
+            results.append(("ok", latency, tokens))
+        elif response.status_code == 503:
+            results.append(("rejected", latency, 0))
+        else:
+            results.append(("error", latency, 0))
+
+
+async def load(api_base, args):
+    async with httpx.AsyncClient(
+        timeout=600, limits=httpx.Limits(max_connections=args.clients)
+    ) as http:
+        models = (await http.get(f"{api_base}/models")).json()["data"]
+        results = []
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[
+                client(http, api_base, models[0]["id"], args, results)
+                for _ in range(args.clients)
+            ]
+        )
+        return results, time.perf_counter() - start
+
+
+def report(name, results, duration):
+    ok = sorted(latency for status, latency, _ in results if status == "ok")
+    tokens = sum(tokens for _, _, tokens in results)
+    rejected = sum(status == "rejected" for status, _, _ in results)
+    errors = sum(status == "error" for status, _, _ in results)
+    p50 = statistics.median(ok) if ok else 0.0
+    p95 = ok[math.ceil(len(ok) * 0.95) - 1] if ok else 0.0
+    print(
+        f"{name:>10} {len(ok):>5} {rejected:>8} {errors:>6} {p50:>7.2f}s "
+        f"{p95:>7.2f}s {tokens / duration:>9.1f} {duration:>7.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--model-path")
+    parser.add_argument("--endpoint-url", help="benchmark a running server instead")
+    parser.add_argument("--parallel-slots", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--max-ctx-size", type=int, default=1024)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=4, help="per client")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    args = parser.parse_args()
+    if not args.model_path and not args.endpoint_url:
+        parser.error("--model-path or --endpoint-url is required")
+
+    print(
+        f"{'server':>10} {'ok':>5} {'rejected':>8} {'errors':>6} {'p50':>8} "
+        f"{'p95':>8} {'tokens/s':>9} {'time':>8}"
+    )
+    if args.endpoint_url:
+        report("external", *asyncio.run(load(args.endpoint_url, args)))
+        return
+    for parallel_slots in args.parallel_slots:
+        process, api_base = start_server(args, parallel_slots)
+        try:
+            report(f"{parallel_slots} slots", *asyncio.run(load(api_base, args)))
+        finally:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmarks `get_taxonomy_diff`, which finds the taxonomy files changed since
+the base branch for `ilab diff` and `ilab generate`.
+
+Builds a synthetic taxonomy repository with --files YAML files on
+origin/main and a local branch --commits commits ahead of it, then measures
+the time to list the changed files. With --baseline the previous approach
+(one `git branch -a --contains` per commit walked back from HEAD) is
+measured as well, and both are checked to list the same files.
+
+Usage: python scripts/benchmarks/taxonomy_diff.py [--files 10000] [--commits 1000] [--baseline]
+"""
+
+# Standard
+import argparse
+import re
+import subprocess
+import tempfile
+import time
+
+# Third Party
+import git
+
+# First Party
+from instructlab import utils
+
+YAML = """\
+created_by: benchmark
+version: 2
+task_description: Skill {0}
+seed_examples:
+- question: What is skill {0}?
+  answer: It is skill number {0}.
+"""
+
+
+def _path(i):
+    return f"compositional_skills/area{i // 100}/skill{i}/qna.yaml"
+
+
+def _blob(data):
+    data = data.encode("utf-8")
+    return b"data %d\n%s\n" % (len(data), data)
+
+
+def make_repo(path, num_files, num_commits):
+    """Write the repository with a single git fast-import."""
+    stream = [b"commit refs/remotes/origin/main\n"]
+    stream.append(b"committer bench <bench@example.com> 0 +0000\n")
+    stream.append(_blob("base"))
+    for i in range(num_files):
+        stream.append(b"M 644 inline %s\n" % _path(i).encode())
+        stream.append(_blob(YAML.format(i)))
+    for c in range(num_commits):
+        stream.append(b"commit refs/heads/feature\n")
+        stream.append(b"committer bench <bench@example.com> %d +0000\n" % (c + 1))
+        stream.append(_blob(f"change {c}"))
+        if c == 0:
+            stream.append(b"from refs/remotes/origin/main\n")
+        i = c * 7 % num_files
+        stream.append(b"M 644 inline %s\n" % _path(i).encode())
+        stream.append(_blob(YAML.format(i) + f"# revision {c}\n"))
+    subprocess.run(["git", "init", "-q", path], check=True)
+    subprocess.run(
+        ["git", "fast-import", "--quiet"], cwd=path, input=b"".join(stream), check=True
+    )
+    subprocess.run(["git", "checkout", "-q", "-f", "feature"], cwd=path, check=True)
+    for i in range(3):
+        new_dir = f"{path}/compositional_skills/new{i}"
+        subprocess.run(["mkdir", "-p", new_dir], check=True)
+        with open(f"{new_dir}/qna.yaml", "w", encoding="utf-8") as f:
+            f.write(YAML.format(f"new{i}"))
+
+
+def baseline_taxonomy_diff(repo="taxonomy", base="origin/main"):
+    """The previous implementation, kept for comparison."""
+    repo = git.Repo(repo)
+    untracked_files = [u for u in repo.untracked_files if utils.istaxonomyfile(u)]
+    re_git_branch = re.compile(f"remotes/{base}$", re.MULTILINE)
+    head_commit = None
+    current_commit = repo.commit("HEAD")
+    while not head_commit:
+        branches = repo.git.branch("-a", "--contains", current_commit.hexsha)
+        if re_git_branch.findall(branches):
+            head_commit = current_commit
+            break
+        current_commit = current_commit.parents[0]
+    modified_files = [
+        d.b_path
+        for d in head_commit.diff(None)
+        if not d.deleted_file and utils.istaxonomyfile(d.b_path)
+    ]
+    return sorted(set(untracked_files + modified_files))
+
+
+def measure(name, func, path):
+    start = time.perf_counter()
+    files = func(path, "origin/main")
+    duration = time.perf_counter() - start
+    print(f"{name:>8}: {duration:.3f}s, {len(files)} changed files")
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--commits", type=int, default=1000)
+    parser.add_argument(
+        "--baseline", action="store_true", help="also measure the previous approach"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        make_repo(path, args.files, args.commits)
+        print(
+            f"repository with {args.files} files and {args.commits} commits "
+            f"ahead of origin/main built in {time.perf_counter() - start:.1f}s"
+        )
+        files = measure("engine", utils.get_taxonomy_diff, path)
+        if args.baseline:
+            baseline = measure("baseline", baseline_taxonomy_diff, path)
+            if baseline != files:
+                raise SystemExit("baseline and engine disagree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+import fnmatch
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import threading
+
+# Third Party
+from git import Repo, exc
+from git.db import GitDB
+
+# Local
+from . import utils
+
+_COMMIT_SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+# abbreviated or full commit SHAs, which never move unlike branches and tags
+_COMMIT_ID_RE = re.compile(r"^[0-9a-f]{4,40}$")
+_SYMLINK_MODE = "120000"
+# same as the SYMLOOP_MAX of Linux
+_MAX_SYMLINKS = 40
+
+DEFAULT_FETCH_WORKERS = 8
+"""Document repositories fetched at the same time"""
+
+DEFAULT_TAXONOMY_CACHE_SIZE = 128 * 1024 * 1024
+"""Bytes the taxonomy check cache may take on disk before old entries are evicted"""
+
+
+def _store(path: str, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        # a missing cache entry only costs a recomputation
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def content_key(*parts) -> str:
+    """Content address of json serializable parts."""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class DocumentCache:
+    """A content-addressed cache of knowledge documents and their chunks.
+
+    Documents are keyed by (repo, commit, patterns), chunk lists by the
+    content of the documents and the chunking parameters. Entries are kept
+    in memory, so seeds and taxonomy files sharing documents fetch and chunk
+    them once, and in cache_dir, if given, so later runs skip both the
+    network and the chunking.
+
+    With a cache_dir, the document repositories are kept there as bare
+    repositories that only hold the pinned commits: commits are fetched
+    shallow and without blobs, and only the blobs of the documents are
+    fetched afterwards. Later runs fetch into them when a commit is missing.
+
+    Documents are only stored on disk when pinned to a full commit SHA,
+    since a branch or tag may move between runs.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self._memory: Dict[str, Dict[str, List[str]]] = {
+            "documents": {},
+            "chunks": {},
+        }
+        self._lock = threading.Lock()
+        self._repo_locks: Dict[str, threading.Lock] = {}
+        # (repo, commit) -> commit SHA, branches and tags are resolved once
+        self._commits: Dict[tuple, Optional[str]] = {}
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.cache_dir, kind, key[:2], f"{key}.json")
+
+    def _get(
+        self, kind: str, key: str, persist: bool, compute: Callable[[], List[str]]
+    ) -> List[str]:
+        memory = self._memory[kind]
+        with self._lock:
+            if key in memory:
+                return memory[key]
+        value = None
+        persist = persist and self.cache_dir is not None
+        if persist:
+            try:
+                with open(self._path(kind, key), "r", encoding="utf-8") as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                value = None
+        if value is None:
+            value = compute()
+            if persist:
+                _store(self._path(kind, key), value)
+        with self._lock:
+            memory[key] = value
+        return value
+
+    def _has(self, kind: str, key: str, persist: bool) -> bool:
+        with self._lock:
+            if key in self._memory[kind]:
+                return True
+        return (
+            persist
+            and self.cache_dir is not None
+            and os.path.isfile(self._path(kind, key))
+        )
+
+    def get_documents(self, logger, source: Dict) -> List[str]:
+        """Same as utils.get_documents, through the cache."""
+        repo_url = source.get("repo")
+        commit_hash = source.get("commit")
+        file_patterns = source.get("patterns")
+        key = content_key(repo_url, commit_hash, file_patterns)
+        persist = bool(_COMMIT_SHA_RE.match(str(commit_hash)))
+
+        def fetch():
+            if self.cache_dir is None:
+                return utils.get_documents(logger=logger, source=source)
+            with self._repo_lock(repo_url):
+                repo = self._bare_repo(logger, repo_url)
+                commits = self._fetch_commits(logger, repo, repo_url, [commit_hash])
+                if commit_hash not in commits:
+                    raise exc.GitCommandError(
+                        ["git", "rev-parse", commit_hash],
+                        128,
+                        f"fatal: {commit_hash} not found in {repo_url}",
+                    )
+                return self._read_documents(
+                    logger, repo, commits[commit_hash], file_patterns
+                )
+
+        return self._get("documents", key, persist, fetch)
+
+    def prefetch(self, logger, sources: Iterable[Dict]):
+        """Fetch the documents of many sources, distinct repositories concurrently.
+
+        Sources sharing a repository are fetched in a single fetch of their
+        commits. Failures are only logged, get_documents raises them again
+        when the documents are read.
+        """
+        by_repo: Dict[str, List[Dict]] = {}
+        keys = set()
+        for source in sources:
+            commit_hash = source.get("commit")
+            key = content_key(source.get("repo"), commit_hash, source.get("patterns"))
+            persist = bool(_COMMIT_SHA_RE.match(str(commit_hash)))
+            if key in keys or self._has("documents", key, persist):
+                continue
+            keys.add(key)
+            by_repo.setdefault(source.get("repo"), []).append(source)
+        if not by_repo:
+            return
+        with ThreadPoolExecutor(
+            max_workers=min(len(by_repo), DEFAULT_FETCH_WORKERS)
+        ) as executor:
+            for future in [
+                executor.submit(self._prefetch_repo, logger, repo_url, repo_sources)
+                for repo_url, repo_sources in by_repo.items()
+            ]:
+                future.result()
+
+    def _prefetch_repo(self, logger, repo_url: str, sources: List[Dict]):
+        try:
+            if self.cache_dir is not None:
+                with self._repo_lock(repo_url):
+                    repo = self._bare_repo(logger, repo_url)
+                    self._fetch_commits(
+                        logger, repo, repo_url, [s.get("commit") for s in sources]
+                    )
+            for source in sources:
+                self.get_documents(logger, source)
+        except (OSError, ValueError, exc.GitError, SystemExit) as e:
+            logger.debug(f"Prefetching the documents of {repo_url} failed: {e}")
+
+    def _repo_lock(self, repo_url: str) -> threading.Lock:
+        with self._lock:
+            return self._repo_locks.setdefault(repo_url, threading.Lock())
+
+    def _bare_repo(self, logger, repo_url: str) -> Repo:
+        """The cached bare repository of the URL, created empty if missing."""
+        repos_dir = os.path.join(self.cache_dir, "repos")
+        path = os.path.join(repos_dir, f"{content_key(repo_url)[:16]}.git")
+        if os.path.isdir(path):
+            return Repo(path)
+        logger.debug(f"Creating the document cache of {repo_url}")
+        os.makedirs(repos_dir, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=repos_dir)
+        try:
+            repo = Repo.init(temp_dir, bare=True)
+            repo.create_remote("origin", repo_url)
+            with repo.config_writer() as config:
+                # a partial clone, blobs are fetched on demand
+                config.set_value("core", "repositoryformatversion", "1")
+                config.set_value("extensions", "partialClone", "origin")
+                config.set_value('remote "origin"', "promisor", "true")
+                config.set_value('remote "origin"', "partialclonefilter", "blob:none")
+            os.replace(temp_dir, path)
+        except OSError:
+            # another process created it first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return Repo(path)
+
+    def _fetch_commits(
+        self, logger, repo: Repo, repo_url: str, commits: List[str]
+    ) -> Dict[str, str]:
+        """Fetch the commits missing from the repository and resolve them to SHAs.
+
+        Commits that cannot be found are left out.
+        """
+        resolved = {}
+        missing = []
+        for commit in dict.fromkeys(commits):
+            if (repo_url, commit) in self._commits:
+                # not found in the refs already fetched in this run if None
+                sha = self._commits[(repo_url, commit)]
+                if sha is not None:
+                    resolved[commit] = sha
+                continue
+            sha = None
+            if _COMMIT_ID_RE.match(commit):
+                sha = _resolve_commit(repo, commit)
+            if sha is None:
+                missing.append(commit)
+            else:
+                resolved[commit] = sha
+        shas = [commit for commit in missing if _COMMIT_SHA_RE.match(commit)]
+        if shas:
+            logger.debug(f"Fetching {', '.join(shas)} of {repo_url}")
+            try:
+                repo.git.fetch("--depth=1", "origin", *shas)
+            except exc.GitCommandError:
+                # servers may refuse to fetch a commit by its SHA
+                pass
+        unresolved = []
+        for commit in missing:
+            sha = _resolve_commit(repo, commit) if commit in shas else None
+            if sha is None:
+                unresolved.append(commit)
+            else:
+                resolved[commit] = sha
+        if unresolved:
+            # branches and tags need the refs, abbreviated SHAs the history
+            logger.debug(f"Fetching the branches and tags of {repo_url}")
+            if not any(_COMMIT_ID_RE.match(commit) for commit in unresolved):
+                depth = ["--depth=1"]
+            elif os.path.exists(os.path.join(repo.git_dir, "shallow")):
+                depth = ["--unshallow"]
+            else:
+                depth = []
+            repo.git.fetch(
+                *depth,
+                "origin",
+                "+refs/heads/*:refs/remotes/origin/*",
+                "+refs/tags/*:refs/tags/*",
+            )
+            for commit in unresolved:
+                sha = _resolve_commit(repo, commit) or _resolve_commit(
+                    repo, f"refs/remotes/origin/{commit}"
+                )
+                if sha is not None:
+                    resolved[commit] = sha
+        with self._lock:
+            for commit in unresolved:
+                self._commits[(repo_url, commit)] = resolved.get(commit)
+            for commit, sha in resolved.items():
+                self._commits[(repo_url, commit)] = sha
+        return resolved
+
+    def _read_documents(
+        self, logger, repo: Repo, sha: str, file_patterns: List[str]
+    ) -> List[str]:
+        """Same as utils.read_documents, from the commit of the bare repository.
+
+        Symbolic links are followed within the commit, links leaving it and
+        links to directories are not.
+        """
+        logger.debug("Processing files...")
+        blobs = {}
+        for entry in repo.git.ls_tree("-r", "-z", sha).split("\0"):
+            if not entry:
+                continue
+            info, path = entry.split("\t", 1)
+            mode, kind, oid = info.split()
+            if kind == "blob":
+                blobs[path] = (mode, oid)
+        documents = [path for path in blobs if path.endswith(".md")]
+        paths = [
+            path
+            for pattern in file_patterns
+            for path in sorted(_glob(pattern, documents))
+        ]
+        targets = self._follow_links(repo, sha, blobs, paths)
+        matches = [blobs[targets[path]][1] for path in paths if targets[path]]
+        if not matches:
+            raise SystemExit("Couldn't find knowledge documents")
+        self._fetch_blobs(repo, sha, matches)
+        file_contents = []
+        for oid in matches:
+            data = repo.odb.stream(bytes.fromhex(oid)).read().decode("utf-8")
+            # the documents are read in text mode from a checkout
+            file_contents.append(data.replace("\r\n", "\n").replace("\r", "\n"))
+        return file_contents
+
+    def _follow_links(
+        self, repo: Repo, sha: str, blobs: Dict, paths: List[str]
+    ) -> Dict[str, Optional[str]]:
+        """The file each path points to in the commit, None if there is none."""
+        targets: Dict[str, Optional[str]] = {path: path for path in paths}
+        for _ in range(_MAX_SYMLINKS):
+            links = {
+                path: blobs[target][1]
+                for path, target in targets.items()
+                if target is not None and blobs[target][0] == _SYMLINK_MODE
+            }
+            if not links:
+                return targets
+            self._fetch_blobs(repo, sha, links.values())
+            for path, oid in links.items():
+                link = repo.odb.stream(bytes.fromhex(oid)).read().decode("utf-8")
+                target = posixpath.normpath(
+                    posixpath.join(posixpath.dirname(targets[path]), link)
+                )
+                targets[path] = target if target in blobs else None
+        # too many levels of symbolic links
+        return {
+            path: None if target and blobs[target][0] == _SYMLINK_MODE else target
+            for path, target in targets.items()
+        }
+
+    def _fetch_blobs(self, repo: Repo, sha: str, oids: Iterable[str]):
+        """Fetch the blobs of the commit that the partial clone is missing."""
+        missing = {
+            line[1:]
+            for line in repo.git.rev_list(
+                "--objects", "--missing=print", "--no-walk", sha
+            ).splitlines()
+            if line.startswith("?")
+        }.intersection(oids)
+        if missing:
+            # fetched in one request instead of one per blob on access
+            repo.git.execute(
+                [
+                    "git",
+                    "-c",
+                    "fetch.negotiationAlgorithm=noop",
+                    "fetch",
+                    "origin",
+                    "--no-tags",
+                    "--no-write-fetch-head",
+                    "--recurse-submodules=no",
+                    "--filter=blob:none",
+                    "--stdin",
+                ],
+                istream=_lines_stream(missing),
+            )
+
+    def chunk_document(
+        self, documents: List[str], server_ctx_size, chunk_word_count, tokenizer=None
+    ) -> List[str]:
+        """Same as utils.chunk_document, through the cache."""
+        if utils.num_tokens_from_words(chunk_word_count) > int(server_ctx_size - 1024):
+            # raises, the context size is not part of the key
+            return utils.chunk_document(
+                documents, server_ctx_size, chunk_word_count, tokenizer
+            )
+        tokenization = "chars" if tokenizer is None else tokenizer.cache_key
+        persist = tokenization is not None
+        if not persist:
+            tokenization = f"id:{id(tokenizer)}"
+        key = content_key(
+            content_key(documents),
+            utils.num_tokens_from_words(chunk_word_count),
+            utils.DEFAULT_CHUNK_OVERLAP,
+            tokenization,
+        )
+        return self._get(
+            "chunks",
+            key,
+            persist,
+            lambda: utils.chunk_document(
+                documents, server_ctx_size, chunk_word_count, tokenizer
+            ),
+        )
+
+
+def _resolve_commit(repo: Repo, commit: str) -> Optional[str]:
+    if _COMMIT_SHA_RE.match(commit):
+        # git would fetch a missing object from the promisor remote, with
+        # the whole history of the commit
+        objects = GitDB(os.path.join(repo.git_dir, "objects"))
+        if not objects.has_object(bytes.fromhex(commit)):
+            return None
+    try:
+        return repo.git.rev_parse("--verify", "--quiet", f"{commit}^{{commit}}")
+    except exc.GitCommandError:
+        return None
+
+
+def _glob(pattern: str, paths: Iterable[str]) -> List[str]:
+    """Paths matching the glob pattern, as glob.glob would match them in a checkout."""
+    parts = [part for part in pattern.split("/") if part not in ("", ".")]
+    matches = []
+    for path in paths:
+        names = path.split("/")
+        if len(names) == len(parts) and all(
+            fnmatch.fnmatchcase(name, part)
+            # hidden files are only matched explicitly
+            and (part.startswith(".") or not name.startswith("."))
+            for name, part in zip(names, parts)
+        ):
+            matches.append(path)
+    return matches
+
+
+def _lines_stream(lines: Iterable[str]):
+    stream = tempfile.TemporaryFile()
+    stream.write("".join(f"{line}\n" for line in lines).encode("ascii"))
+    stream.seek(0)
+    return stream
+
+
+class TaxonomyCache:
+    """An on-disk cache of taxonomy file checks.
+
+    Entries are keyed by utils.taxonomy_check_key, which covers the git blob
+    hash of the file, the schemas and the YAML rules, and hold the outcome of
+    parsing, linting and validating the file. Reading a taxonomy with
+    unchanged files then skips all three.
+
+    Once the entries take more than max_size bytes, the least recently used
+    ones are evicted.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_TAXONOMY_CACHE_SIZE):
+        self.cache_dir = os.path.join(cache_dir, "taxonomy")
+        self.max_size = max_size
+        self._stored = False
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # the modification time orders the entries for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def put(self, key: str, value: dict):
+        _store(self._path(key), value)
+        self._stored = True
+
+    def prune(self):
+        """Evict the least recently used entries beyond the size limit."""
+        if not self._stored:
+            return
+        self._stored = False
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
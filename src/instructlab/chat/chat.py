@@ -9,7 +9,6 @@ import sys
 import time
 
 # Third Party
-from openai import OpenAI
 from prompt_toolkit import PromptSession
 from prompt_toolkit.formatted_text import FormattedText
 from prompt_toolkit.history import FileHistory
@@ -22,6 +21,7 @@ import httpx
 import openai
 
 # Local
+from ..client import ClientSession
 from ..config import DEFAULT_CONNECTION_TIMEOUT, DEFAULT_MODEL_OLD
 from ..utils import get_sysprompt
 
@@ -471,22 +471,17 @@ def chat_cli(
     tls_client_cert: Optional[str] = None,
     tls_client_key: Optional[str] = None,
     tls_client_passwd: Optional[str] = None,
+    client_session: Optional[ClientSession] = None,
 ):
     """Starts a CLI-based chat with the server"""
-    orig_cert = (tls_client_cert, tls_client_key, tls_client_passwd)
-    cert = tuple(item for item in orig_cert if item)
-    verify = not tls_insecure
-    client = OpenAI(
-        base_url=api_base,
-        api_key=api_key,
-        timeout=DEFAULT_CONNECTION_TIMEOUT,
-        http_client=httpx.Client(cert=cert, verify=verify),
-    )
+    if client_session is None:
+        tls = (tls_insecure, tls_client_cert, tls_client_key, tls_client_passwd)
+        client_session = ClientSession.from_options(
+            api_base, api_key, tls, timeout=DEFAULT_CONNECTION_TIMEOUT
+        )
+    client = client_session.client
     # ensure the model specified exists on the server. with backends like vllm, this is crucial.
-    model_list = client.models.list().data
-    model_ids = []
-    for m in model_list:
-        model_ids.append(m.id)
+    model_ids = client_session.served_model_ids()
     if not any(model == m for m in model_ids):
         if model == DEFAULT_MODEL_OLD:
             logger.info(
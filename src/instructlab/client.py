@@ -2,7 +2,9 @@
 # pylint: disable=duplicate-code
 
 # Standard
-from typing import Optional
+from typing import List, Optional, Tuple
+import threading
+import time
 
 # Third Party
 from openai import OpenAI, OpenAIError
@@ -16,6 +18,211 @@ class ClientException(Exception):
     """An exception raised when invoking client operations."""
 
 
+# token count endpoints and the name of their text field
+_TOKENIZE_ENDPOINTS = {
+    # llama-cpp-python
+    "/extras/tokenize/count": "input",
+    # vLLM
+    "/tokenize": "prompt",
+}
+
+
+class ClientSession:  # pylint: disable=too-many-instance-attributes
+    """A reusable connection to an OpenAI-compatible server.
+
+    The session owns a single httpx client, so keep-alive connections (and
+    their TLS handshakes) are pooled across requests. The list of served
+    models is fetched once and cached. Connection and latency counters are
+    available from `stats()`.
+
+    The session is thread-safe and can be shared by concurrent requests.
+    """
+
+    def __init__(
+        self,
+        api_base,
+        tls_insecure=False,
+        api_key=DEFAULT_API_KEY,
+        tls_client_cert: Optional[str] = None,
+        tls_client_key: Optional[str] = None,
+        tls_client_passwd: Optional[str] = None,
+        timeout: Optional[httpx.Timeout] = None,
+        max_connections: Optional[int] = None,
+    ):
+        if not api_key:
+            # we need to explicitly set non-empty api-key, to ensure we
+            # connect to our local server
+            api_key = DEFAULT_API_KEY
+        orig_cert = (tls_client_cert, tls_client_key, tls_client_passwd)
+        cert = tuple(item for item in orig_cert if item)
+        verify = not tls_insecure
+        limits = httpx.Limits()
+        if max_connections:
+            limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            )
+        self.api_base = api_base
+        self._api_key = api_key
+        self._tokenize_endpoint: Optional[str] = None
+        self._lock = threading.Lock()
+        self._model_ids: Optional[List[str]] = None
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "connections": 0,
+            "tls_handshakes": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+        self._http_client = httpx.Client(
+            cert=cert,
+            verify=verify,
+            limits=limits,
+            event_hooks={"request": [self._trace_request]},
+        )
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        self.client = OpenAI(
+            base_url=api_base,
+            api_key=api_key,
+            http_client=self._http_client,
+            **kwargs,
+        )
+
+    @classmethod
+    def from_options(
+        cls,
+        api_base,
+        api_key,
+        tls: Tuple[bool, Optional[str], Optional[str], Optional[str]],
+        **kwargs,
+    ) -> "ClientSession":
+        """A session with the TLS options the commands take.
+
+        tls is (tls_insecure, tls_client_cert, tls_client_key,
+        tls_client_passwd), kwargs are the other arguments of ClientSession.
+        """
+        tls_insecure, tls_client_cert, tls_client_key, tls_client_passwd = tls
+        return cls(
+            api_base=api_base,
+            tls_insecure=tls_insecure,
+            api_key=api_key,
+            tls_client_cert=tls_client_cert,
+            tls_client_key=tls_client_key,
+            tls_client_passwd=tls_client_passwd,
+            **kwargs,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the pooled connections."""
+        self._http_client.close()
+
+    def _trace_request(self, request: httpx.Request):
+        # httpcore reports connection level events through the trace extension
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name, _info):
+        if event_name == "connection.connect_tcp.complete":
+            self._count("connections")
+        elif event_name == "connection.start_tls.complete":
+            self._count("tls_handshakes")
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _record(self, start, failed=False, usage=None):
+        latency = time.perf_counter() - start
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["latency_total"] += latency
+            self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+            if failed:
+                self._stats["errors"] += 1
+            if usage is not None:
+                self._stats["prompt_tokens"] += usage.prompt_tokens or 0
+                self._stats["completion_tokens"] += usage.completion_tokens or 0
+
+    def list_models(self):
+        """List models from the server, uncached."""
+        start = time.perf_counter()
+        try:
+            models = self.client.models.list()
+        except OpenAIError:
+            self._record(start, failed=True)
+            raise
+        self._record(start)
+        with self._lock:
+            self._model_ids = [model.id for model in models.data]
+        return models
+
+    def served_model_ids(self) -> List[str]:
+        """IDs of the models served by the server, fetched once per session."""
+        if self._model_ids is None:
+            self.list_models()
+        return list(self._model_ids)
+
+    def chat_completion(self, **kwargs):
+        """Create a chat completion, recording its latency and token usage."""
+        start = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(**kwargs)
+        except OpenAIError:
+            self._record(start, failed=True)
+            raise
+        self._record(start, usage=getattr(response, "usage", None))
+        return response
+
+    def count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        """Count the tokens of a text with the tokenizer of the served model.
+
+        Uses the tokenize extension of llama-cpp-python servers, or the
+        tokenize endpoint of vLLM servers.
+        """
+        root = self.api_base.rstrip("/").removesuffix("/v1")
+        endpoints = [self._tokenize_endpoint] if self._tokenize_endpoint else []
+        endpoints += [e for e in _TOKENIZE_ENDPOINTS if e not in endpoints]
+        for endpoint in endpoints:
+            payload = {_TOKENIZE_ENDPOINTS[endpoint]: text}
+            if model:
+                payload["model"] = model
+            try:
+                response = self._http_client.post(
+                    root + endpoint,
+                    json=payload,
+                    headers={"Authorization": f"Bearer {self._api_key}"},
+                )
+            except httpx.HTTPError as exc:
+                raise ClientException(f"Connection Error {exc}") from exc
+            if response.status_code == httpx.codes.NOT_FOUND:
+                continue
+            if response.is_error:
+                raise ClientException(
+                    f"Tokenizing failed with {response.status_code}: {response.text}"
+                )
+            self._tokenize_endpoint = endpoint
+            return response.json()["count"]
+        raise ClientException(f"The server at {root} does not support tokenizing")
+
+    def stats(self):
+        """Snapshot of the connection and latency counters."""
+        with self._lock:
+            stats = dict(self._stats)
+        requests = stats["requests"]
+        stats["latency_avg"] = stats["latency_total"] / requests if requests else 0.0
+        return stats
+
+
 def list_models(
     api_base,
     tls_insecure,
@@ -23,18 +230,21 @@ def list_models(
     tls_client_cert: Optional[str] = None,
     tls_client_key: Optional[str] = None,
     tls_client_passwd: Optional[str] = None,
+    session: Optional[ClientSession] = None,
 ):
     """List models from OpenAI-compatible server"""
     try:
-        orig_cert = (tls_client_cert, tls_client_key, tls_client_passwd)
-        cert = tuple(item for item in orig_cert if item)
-        verify = not tls_insecure
-        client = OpenAI(
-            base_url=api_base,
+        if session is not None:
+            return session.list_models()
+        with ClientSession(
+            api_base=api_base,
+            tls_insecure=tls_insecure,
             api_key=api_key,
+            tls_client_cert=tls_client_cert,
+            tls_client_key=tls_client_key,
+            tls_client_passwd=tls_client_passwd,
             timeout=DEFAULT_CONNECTION_TIMEOUT,
-            http_client=httpx.Client(cert=cert, verify=verify),
-        )
-        return client.models.list()
+        ) as client_session:
+            return client_session.list_models()
     except OpenAIError as exc:
         raise ClientException(f"Connection Error {exc}") from exc
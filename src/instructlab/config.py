@@ -1,14 +1,16 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # Standard
-from os import path
+from os import environ, path
 from re import match
-from typing import Optional
+from typing import List, Optional
 
 # Third Party
 from pydantic import (
     BaseModel,
     ConfigDict,
+    NonNegativeFloat,
+    NonNegativeInt,
     PositiveInt,
     StrictStr,
     ValidationError,
@@ -34,10 +36,25 @@ DEFAULT_CHUNK_WORD_COUNT = 1000
 DEFAULT_NUM_INSTRUCTIONS = 100
 DEFAULT_PROMPT_FILE = "prompt.txt"
 DEFAULT_GENERATED_FILES_OUTPUT_DIR = "generated"
+DEFAULT_CACHE_DIR = path.join(
+    environ.get("XDG_CACHE_HOME") or path.join(path.expanduser("~"), ".cache"),
+    "instructlab",
+)
 DEFAULT_CONNECTION_TIMEOUT = httpx.Timeout(timeout=30.0)
 # use spawn start method, fork is not thread-safe
 DEFAULT_MULTIPROCESSING_START_METHOD = "spawn"
 DEFAULT_LINEAGE_ID = "uuid_1234"
+# seconds an idle client connection to the server is kept open
+DEFAULT_KEEP_ALIVE = 5
+# requests that may wait for a decode slot of the server
+DEFAULT_MAX_QUEUE = 64
+# seconds the model daemon of chat and generate stays up without requests, 0
+# starts a temporary server for each command instead
+DEFAULT_IDLE_TIMEOUT = 0
+DEFAULT_DAEMON_DIR = path.join(DEFAULT_CACHE_DIR, "daemons")
+# seconds between two stats lines logged by the server, 0 to not log them
+DEFAULT_STATS_INTERVAL = 0
+
 
 class ConfigException(Exception):
     """An exception that a configuration file has an error."""
@@ -125,6 +142,17 @@ class _serve(BaseModel):
     host_port: StrictStr = "127.0.0.1:8000"
     gpu_layers: int = -1
     max_ctx_size: PositiveInt = 4096
+    parallel_slots: PositiveInt = 1
+    max_queue: NonNegativeInt = DEFAULT_MAX_QUEUE
+    keep_alive: NonNegativeInt = DEFAULT_KEEP_ALIVE
+    # seconds a model daemon shared by chat and generate stays up idle, 0
+    # starts a temporary server for each command instead of a daemon
+    idle_timeout: NonNegativeInt = DEFAULT_IDLE_TIMEOUT
+    # models served next to model_path, by the model field of the requests
+    extra_models: List[StrictStr] = []
+    # GiB the loaded models may use, 0 for no limit
+    memory_budget: NonNegativeFloat = 0.0
+    stats_interval: NonNegativeInt = DEFAULT_STATS_INTERVAL
 
     def api_base(self):
         """Returns server API URL, based on the configured host and port"""
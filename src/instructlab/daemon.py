@@ -0,0 +1,276 @@
+# SPDX-License-Identifier: Apache-2.0
+
+"""A model server shared by the commands that need one.
+
+`ilab chat` and `ilab generate` attach to a daemon serving their model,
+starting it when none is running, so the model is loaded once for all the
+commands run within its idle timeout. A daemon is found through its state
+file in DEFAULT_DAEMON_DIR, named after the model and server settings, and
+writes it once it accepts requests. The attached commands register their
+pid next to it, the daemon exits once none of them is alive and it served
+no request for idle_timeout seconds.
+"""
+
+# Standard
+from contextlib import contextmanager
+from typing import Optional
+import atexit
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import select
+import subprocess
+import sys
+
+# Local
+from .client import ClientException, list_models
+from .config import DEFAULT_DAEMON_DIR, get_api_base, get_model_family
+
+
+class DaemonException(Exception):
+    """An exception raised when the model daemon cannot be started."""
+
+
+def daemon_key(serve_config, model_family) -> str:
+    """Name of the daemon serving the model with the settings of serve_config."""
+    settings = {
+        "model_path": os.path.realpath(serve_config.model_path),
+        "model_family": get_model_family(model_family, serve_config.model_path),
+        "host": serve_config.host_port.rsplit(":", 1)[0],
+        "gpu_layers": serve_config.gpu_layers,
+        "max_ctx_size": serve_config.max_ctx_size,
+        "parallel_slots": serve_config.parallel_slots,
+    }
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return f"{os.path.basename(serve_config.model_path)}-{digest.hexdigest()[:12]}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_state(state_file: str) -> Optional[dict]:
+    """State of the daemon of state_file, None if it is not running."""
+    try:
+        with open(state_file, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    pid = state.get("pid") if isinstance(state, dict) else None
+    if not isinstance(pid, int) or pid <= 0 or not _pid_alive(pid):
+        return None
+    return state
+
+
+def write_state(state_file: str, state: dict):
+    tmp = f"{state_file}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_file)
+
+
+def remove_state(state_file: str, pid: int):
+    """Remove the state file if it is still the one of the daemon pid."""
+    state = read_state(state_file)
+    if state is not None and state["pid"] == pid:
+        os.unlink(state_file)
+
+
+def clients_dir(state_file: str) -> str:
+    return f"{state_file[: -len('.json')]}.clients"
+
+
+def register_client(state_file: str, pid: Optional[int] = None):
+    """Keep the daemon of state_file up while the process pid is alive."""
+    pid = os.getpid() if pid is None else pid
+    directory = clients_dir(state_file)
+    os.makedirs(directory, exist_ok=True)
+    client_file = os.path.join(directory, str(pid))
+    with open(client_file, "w", encoding="utf-8"):
+        pass
+    if pid == os.getpid():
+        atexit.register(_unlink, client_file)
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def has_clients(state_file: str) -> bool:
+    """Whether a process registered with register_client is alive."""
+    directory = clients_dir(state_file)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return False
+    alive = False
+    for name in names:
+        if name.isdigit() and _pid_alive(int(name)):
+            alive = True
+        else:
+            # clients that exited without unregistering
+            _unlink(os.path.join(directory, name))
+    return alive
+
+
+@contextmanager
+def _locked(state_file: str):
+    # serializes the commands looking for and starting the same daemon
+    with open(f"{state_file[: -len('.json')]}.lock", "w", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def attach_daemon(
+    logger,
+    serve_config,
+    model_family,
+    startup_timeout,
+    tls_insecure=False,
+    tls_client_cert=None,
+    tls_client_key=None,
+    tls_client_passwd=None,
+    directory=DEFAULT_DAEMON_DIR,
+) -> str:
+    """Return the URL of the daemon serving the model, starting it if needed.
+
+    The current process is registered as a client of the daemon until it
+    exits.
+    """
+    os.makedirs(directory, exist_ok=True)
+    state_file = os.path.join(
+        directory, f"{daemon_key(serve_config, model_family)}.json"
+    )
+    with _locked(state_file):
+        state = read_state(state_file)
+        api_base = None
+        if state is not None:
+            try:
+                # pylint: disable=duplicate-code
+                list_models(
+                    api_base=state["api_base"],
+                    tls_insecure=tls_insecure,
+                    tls_client_cert=tls_client_cert,
+                    tls_client_key=tls_client_key,
+                    tls_client_passwd=tls_client_passwd,
+                )
+                # pylint: enable=duplicate-code
+                api_base = state["api_base"]
+                logger.info(f"Attached to the model daemon at {api_base}")
+            except ClientException:
+                # exiting after its idle timeout
+                logger.debug(
+                    f"The model daemon at {state['api_base']} is not answering"
+                )
+        if api_base is None:
+            logger.info(
+                f"Starting a model daemon for {serve_config.model_path}, "
+                f"exiting after {serve_config.idle_timeout}s idle, "
+                f"its log is {state_file[: -len('.json')]}.log..."
+            )
+            api_base = start_daemon(
+                state_file, serve_config, model_family, startup_timeout
+            )
+            logger.info(f"Model daemon started at {api_base}")
+        register_client(state_file)
+    return api_base
+
+
+def start_daemon(state_file, serve_config, model_family, startup_timeout) -> str:
+    """Start a daemon writing state_file, return its URL once it is ready."""
+    kwargs = {
+        # commands run from other directories attach to it
+        "model_path": os.path.realpath(serve_config.model_path),
+        "gpu_layers": serve_config.gpu_layers,
+        "max_ctx_size": serve_config.max_ctx_size,
+        "model_family": model_family,
+        "host": serve_config.host_port.rsplit(":", 1)[0],
+        "parallel_slots": serve_config.parallel_slots,
+        "max_queue": serve_config.max_queue,
+        "keep_alive": serve_config.keep_alive,
+        "idle_timeout": serve_config.idle_timeout,
+    }
+    log_file = f"{state_file[: -len('.json')]}.log"
+    with open(log_file, "ab") as log:
+        # in a session of its own, the daemon outlives the command and
+        # doesn't get the signals of its terminal
+        process = subprocess.Popen(  # pylint: disable=consider-using-with
+            [sys.executable, "-m", __name__, state_file, json.dumps(kwargs)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=log,
+            start_new_session=True,
+        )
+    with process.stdout:
+        # the daemon writes its URL on stdout once it is ready
+        ready, _, _ = select.select([process.stdout], [], [], startup_timeout)
+        line = process.stdout.readline().decode("utf-8").strip() if ready else ""
+    if line:
+        return line
+    if ready:
+        raise DaemonException(
+            f"The model daemon exited with code {process.wait()} before it was ready, see {log_file}"
+        )
+    process.terminate()
+    process.wait()
+    raise DaemonException(
+        f"The model daemon was not ready after {startup_timeout:g}s, see {log_file}"
+    )
+
+
+def main(argv=None):
+    # pylint: disable=import-outside-toplevel
+    # Local
+    from .server import ServerException, server
+
+    state_file, kwargs = argv if argv is not None else sys.argv[1:]
+    kwargs = json.loads(kwargs)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    logger = logging.getLogger(__name__)
+    # stdout only reports the URL, the output of the server goes to the log
+    ready = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    pid = os.getpid()
+
+    def on_ready(port):
+        api_base = get_api_base(f"{kwargs['host']}:{port}")
+        write_state(state_file, {"pid": pid, "api_base": api_base, **kwargs})
+        logger.info("Serving %s at %s", kwargs["model_path"], api_base)
+        ready.write(f"{api_base}\n")
+        ready.close()
+
+    try:
+        server(
+            logger,
+            in_use=lambda: has_clients(state_file),
+            on_ready=on_ready,
+            port=0,
+            **kwargs,
+        )
+    except ServerException as exc:
+        logger.error(str(exc))
+        return 1
+    finally:
+        remove_state(state_file, pid)
+    logger.info("Model daemon stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
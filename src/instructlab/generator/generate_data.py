@@ -1,12 +1,12 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # Standard
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from functools import partial
 from pathlib import Path
 from typing import Optional
-import json
-import multiprocessing
+import collections
+import math
 import os
 import random
 import re
@@ -20,14 +20,26 @@ import click
 import tqdm
 
 # Local
-from ..config import DEFAULT_MULTIPROCESSING_START_METHOD, get_model_family
-from ..utils import (
-    chunk_document,
-    max_seed_example_tokens,
-    num_chars_from_tokens,
-    read_taxonomy,
-)
+from ..cache import DocumentCache, TaxonomyCache
+from ..client import ClientSession
+from ..config import get_model_family
+from ..tokenizer import TokenizerException, get_tokenizer
+from ..utils import max_seed_example_tokens, num_chars_from_tokens, read_taxonomy
 from . import utils
+from .metrics import DEFAULT_METRICS_INTERVAL, GenerateMetrics, format_summary
+from .output import (
+    DEFAULT_CHECKPOINT_INTERVAL,
+    OUTPUT_FORMAT_JSONL,
+    OUTPUT_FORMAT_PARQUET,
+    GenerateOutputWriter,
+    find_manifest,
+    load_checkpoint,
+    load_documents,
+    load_manifest,
+    load_regen,
+)
+from .pools import SCHEDULE_ROUND_ROBIN, TaxonomyPools
+from .similarity import get_similarity_backend
 from .utils import GenerateException
 
 DEFAULT_PROMPT_TEMPLATE_MERLINITE = """\
@@ -115,6 +127,14 @@ _WORD_DENYLIST = [
     "diagram",
 ]
 
+# all the words in one pattern, compiled once
+_WORD_DENYLIST_RE = re.compile(
+    r"\b({0})\b".format("|".join(re.escape(word) for word in _WORD_DENYLIST)),
+    flags=re.IGNORECASE,
+)
+_TASK_SPLIT_RE = re.compile(r"\* Task \d+")
+_FIELD_SPLIT_RE = re.compile(r"\*\*\s+(Instruction|Input|Output):?")
+
 
 def check_prompt_file(prompt_file_path, model_family):
     """Check for prompt file."""
@@ -135,16 +155,37 @@ def check_prompt_file(prompt_file_path, model_family):
     return prompt_template
 
 
-def encode_prompt(prompt_instructions, prompt):
+def encode_prompt(prompt_instructions, prompt, rng=random):
     """Encode multiple prompt instructions into a single string.
     If documents exist, randomly select one."""
-    idx = 0
     document = None
     document_list = prompt_instructions[0].get("document")
 
     if document_list:
-        document = random.choice(document_list)
+        document = rng.choice(document_list)
 
+    return _render_prompt(prompt_instructions, prompt, document)
+
+
+def fit_prompt(prompt_instructions, prompt, tokenizer, max_prompt_tokens, rng=random):
+    """Encode multiple prompt instructions into a string of at most max_prompt_tokens.
+    If documents exist, try them in random order until the prompt fits.
+    Returns None if it does not fit with any document."""
+    documents = [None]
+    document_list = prompt_instructions[0].get("document")
+
+    if document_list:
+        documents = rng.sample(document_list, len(document_list))
+
+    for document in documents:
+        encoded = _render_prompt(prompt_instructions, prompt, document)
+        if tokenizer.count(encoded) <= max_prompt_tokens:
+            return encoded
+    return None
+
+
+def _render_prompt(prompt_instructions, prompt, document):
+    idx = 0
     prompt = Template(prompt).render(
         taxonomy=prompt_instructions[0]["taxonomy_path"],
         task_description=prompt_instructions[0]["task_description"],
@@ -175,89 +216,101 @@ def encode_prompt(prompt_instructions, prompt):
 
 
 def writeline2file(logfile, line):
+    writelines2file(logfile, [line])
+
+
+def writelines2file(logfile, lines):
+    if not lines:
+        return
     t = datetime.now().replace(microsecond=0).isoformat()
     with open(logfile, "a", encoding="utf-8") as fp:
-        fp.write(f"{t} - {line}\n")
+        fp.writelines(f"{t} - {line}\n" for line in lines)
 
 
 def post_process_gpt3_response(num_prompt_instructions, response, discarded_file):
+    return post_process_gpt3_responses(
+        num_prompt_instructions, [response], discarded_file
+    )
+
+
+def post_process_gpt3_responses(num_prompt_instructions, responses, discarded_file):
+    """Parse the instructions out of all the responses of a request batch.
+
+    Returns the instructions and the number of discarded ones. The reasons
+    for discarding are logged to discarded_file with a single write.
+    """
+    instructions = []
+    discarded_lines = []
+    for response in responses:
+        instructions += _parse_response(
+            num_prompt_instructions, response, discarded_lines
+        )
+    writelines2file(discarded_file, discarded_lines)
+    return instructions, len(discarded_lines)
+
+
+def _parse_response(num_prompt_instructions, response, discarded_lines):
     if response is None:
-        return [], 0
+        return []
     raw_instructions = (
         f"* Task {num_prompt_instructions + 1}\n" + response.message.content
     )
-    raw_instructions = re.split(r"\* Task \d+", raw_instructions)
+    raw_instructions = _TASK_SPLIT_RE.split(raw_instructions)
     instructions = []
-    discarded = 0
     for inst in raw_instructions:
         if not inst.strip():
             continue
 
-        splitted_data = re.split(r"\*\*\s+(Instruction|Input|Output):?", inst)
+        splitted_data = _FIELD_SPLIT_RE.split(inst)
         if len(splitted_data) != 7:
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(didn't match expected format): " + repr(inst),
+            discarded_lines.append(
+                "Discarded instruction(didn't match expected format): " + repr(inst)
             )
-            discarded += 1
             continue
         inst = splitted_data[2].strip()
         prompt_input = splitted_data[4].strip()
         prompt_input = "" if prompt_input.lower() == "<noinput>" else prompt_input
         prompt_output = splitted_data[6].strip()
         # filter out too short or too long instructions
-        if len(inst.split()) <= 3 or len(inst.split()) > 150:
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(wrong number of words): " + repr(splitted_data),
+        num_words = len(inst.split())
+        if num_words <= 3 or num_words > 150:
+            discarded_lines.append(
+                "Discarded instruction(wrong number of words): " + repr(splitted_data)
             )
-            discarded += 1
             continue
         # filter based on keywords that are not suitable for language models.
-        if any(find_word_in_string(word, inst) for word in _WORD_DENYLIST):
-            writeline2file(
-                discarded_file,
+        if _WORD_DENYLIST_RE.search(inst):
+            discarded_lines.append(
                 "Discarded instruction(contained a word from the denylist): "
-                + repr(splitted_data),
+                + repr(splitted_data)
             )
-            discarded += 1
             continue
         # We found that the model tends to add "write a program" to some existing instructions
         # which lead to a lot of such instructions and it's confusing whether the model needs
         # to write a program or directly output the result, so here we filter them out.
         # NOTE: this is not a comprehensive filtering for all programming instructions.
         if inst.startswith("Write a program"):
-            writeline2file(
-                discarded_file,
+            discarded_lines.append(
                 "Discarded instruction(began with 'Write a program'): "
-                + repr(splitted_data),
+                + repr(splitted_data)
             )
-            discarded += 1
             continue
         # filter those starting with punctuation
         if inst[0] in string.punctuation:
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(began with punctuation): " + repr(splitted_data),
+            discarded_lines.append(
+                "Discarded instruction(began with punctuation): " + repr(splitted_data)
             )
-            discarded += 1
             continue
         # filter those starting with non-english character
         if not inst[0].isascii():
-            writeline2file(
-                discarded_file,
-                "Discarded instruction(began with non-ascii): " + repr(splitted_data),
+            discarded_lines.append(
+                "Discarded instruction(began with non-ascii): " + repr(splitted_data)
             )
-            discarded += 1
             continue
         instructions.append(
             {"instruction": inst, "input": prompt_input, "output": prompt_output}
         )
-    return instructions, discarded
-
-
-def find_word_in_string(w, s):
-    return re.compile(r"\b({0})\b".format(w), flags=re.IGNORECASE).search(s)
+    return instructions
 
 
 def get_instructions_from_model(
@@ -277,12 +330,20 @@ def get_instructions_from_model(
     tls_client_cert,
     tls_client_key,
     tls_client_passwd,
+    rng=random,
+    max_in_flight=1,
+    session=None,
+    tokenizer=None,
+    max_prompt_tokens=None,
+    metrics=None,
 ):
+    if metrics is not None:
+        metrics.start()
     batch_inputs = []
     for _ in range(request_batch_size):
         # only sampling from the seed tasks
         try:
-            prompt_instructions = random.sample(
+            prompt_instructions = rng.sample(
                 instruction_data_pool, num_prompt_instructions
             )
         except ValueError as exc:
@@ -291,8 +352,32 @@ def get_instructions_from_model(
                 f"yaml is formatted correctly, and there is enough "
                 f"new data({num_prompt_instructions}+ Q&A))"
             ) from exc
-        prompt = encode_prompt(prompt_instructions, prompt_template)
+        if tokenizer is None or max_prompt_tokens is None:
+            prompt = encode_prompt(prompt_instructions, prompt_template, rng)
+        else:
+            try:
+                prompt = fit_prompt(
+                    prompt_instructions,
+                    prompt_template,
+                    tokenizer,
+                    max_prompt_tokens,
+                    rng,
+                )
+            except TokenizerException as exc:
+                raise GenerateException(
+                    f"Counting prompt tokens failed: {exc}"
+                ) from exc
+            if prompt is None:
+                # sending it would only fail with the server's maximum context
+                # length error, and fail the other prompts of the batch with it
+                logger.warning(
+                    f"Skipping a prompt for {prompt_instructions[0]['taxonomy_path']} "
+                    f"that exceeds {max_prompt_tokens} tokens with any document chunk."
+                )
+                continue
         batch_inputs.append(prompt)
+    if not batch_inputs:
+        return [], 0
     decoding_args = utils.OpenAIDecodingArguments(
         temperature=temperature,
         n=1,
@@ -315,6 +400,9 @@ def get_instructions_from_model(
             tls_client_passwd=tls_client_passwd,
             batch_size=request_batch_size,
             decoding_args=decoding_args,
+            max_in_flight=max_in_flight,
+            session=session,
+            response_hook=None if metrics is None else metrics.record_response,
         )
     except GenerateException as exc:
         # Attempt to log and gracefully recover from exceeding the server's
@@ -335,67 +423,65 @@ def get_instructions_from_model(
     request_duration = time.time() - request_start
 
     post_process_start = time.time()
-    instruction_data = []
-    for result in results:
-        new_instructions, discarded = post_process_gpt3_response(
-            num_prompt_instructions, result, output_file_discarded
-        )
-        # make sure the generated instruction carried over extra fields
-        prompt_ins_0 = prompt_instructions[0]
-        for new_ins in new_instructions:
-            new_ins["taxonomy_path"] = prompt_ins_0["taxonomy_path"]
-            new_ins["task_description"] = prompt_ins_0["task_description"]
-            new_ins["document"] = prompt_ins_0["document"]
-        instruction_data += new_instructions
+    instruction_data, discarded = post_process_gpt3_responses(
+        num_prompt_instructions, results, output_file_discarded
+    )
+    # make sure the generated instruction carried over extra fields
+    prompt_ins_0 = prompt_instructions[0]
+    for new_ins in instruction_data:
+        new_ins["taxonomy_path"] = prompt_ins_0["taxonomy_path"]
+        new_ins["task_description"] = prompt_ins_0["task_description"]
+        new_ins["document"] = prompt_ins_0["document"]
 
     post_process_duration = time.time() - post_process_start
     logger.debug(
         f"Request {request_idx} took {request_duration:.2f}s, "
         f"post-processing took {post_process_duration:.2f}s"
     )
+    if metrics is not None:
+        metrics.timings["http_latency"] = request_duration
+        metrics.timings["parse_time"] = post_process_duration
+        metrics.counters["generated"] = len(instruction_data)
+        metrics.counters["discarded"] = discarded
 
     return instruction_data, discarded
 
 
-def generate_data(
+def _load_seed_data(
     logger,
-    api_base,
-    tls_insecure,
-    model_family: str,
-    yaml_rules: Optional[str] = None,
-    output_dir: Optional[str] = None,
-    taxonomy: Optional[str] = None,
-    taxonomy_base: Optional[str] = None,
-    prompt_file_path: Optional[str] = None,
-    model_name: Optional[str] = None,
-    num_cpus: Optional[int] = None,
-    num_instructions_to_generate: Optional[int] = None,
-    num_prompt_instructions=2,
-    request_batch_size=5,
-    temperature=1.0,
-    top_p=1.0,
-    rouge_threshold: Optional[float] = None,
-    console_output=True,
-    api_key: Optional[str] = None,
-    chunk_word_count=None,
-    server_ctx_size=None,
-    tls_client_cert: Optional[str] = None,
-    tls_client_key: Optional[str] = None,
-    tls_client_passwd: Optional[str] = None,
+    taxonomy,
+    taxonomy_base,
+    yaml_rules,
+    prompt_file_path,
+    model_family,
+    model_name,
+    server_ctx_size,
+    chunk_word_count,
+    train_entry,
+    tokenizer=None,
+    document_cache=None,
+    taxonomy_cache=None,
 ):
-    seed_instruction_data = []
-    machine_seed_instruction_data = []
-    generate_start = time.time()
-
-    if not os.path.exists(output_dir):
-        os.mkdir(output_dir)
-
+    """Read and check the seed examples of the taxonomy.
+
+    Returns the seed examples (with their documents chunked), the prompt
+    template, the maximum number of tokens of a seed example and the test
+    split. Documents are fetched and chunked through the document cache, the
+    checks of unchanged taxonomy files are taken from the taxonomy cache.
+    """
+    if document_cache is None:
+        document_cache = DocumentCache()
     # check taxonomy first then seed_tasks_path
     # throw an error if both not found
     # pylint: disable=broad-exception-caught,raise-missing-from
     if taxonomy and os.path.exists(taxonomy):
         seed_instruction_data = read_taxonomy(
-            logger, taxonomy, taxonomy_base, yaml_rules
+            logger,
+            taxonomy,
+            taxonomy_base,
+            yaml_rules,
+            document_cache,
+            taxonomy_cache,
         )
     else:
         raise SystemExit(f"Error: taxonomy ({taxonomy}) does not exist.")
@@ -403,49 +489,62 @@ def generate_data(
     prompt_template = check_prompt_file(
         prompt_file_path, get_model_family(model_family, model_name)
     )
-    max_seed_tokens = max_seed_example_tokens(server_ctx_size, len(prompt_template))
-    max_seed_chars = num_chars_from_tokens(max_seed_tokens)
-    for seed_example in seed_instruction_data:
-        if (
-            len(seed_example["instruction"])
-            + len(seed_example["input"])
-            + len(seed_example["output"])
-            >= max_seed_chars
-        ):
-            raise SystemExit(
-                f"Error: An example in the taxonomy path {seed_example['taxonomy_path']} is too long for the server context size of {server_ctx_size}. Ensure the total number of characters across the combined question, answer, and context is less than {max_seed_chars} for each example or use a server with a larger context size."
+    try:
+        if tokenizer is None:
+            max_seed_tokens = max_seed_example_tokens(
+                server_ctx_size, len(prompt_template)
             )
+            max_seed_chars = num_chars_from_tokens(max_seed_tokens)
+            for seed_example in seed_instruction_data:
+                if (
+                    len(seed_example["instruction"])
+                    + len(seed_example["input"])
+                    + len(seed_example["output"])
+                    >= max_seed_chars
+                ):
+                    raise SystemExit(
+                        f"Error: An example in the taxonomy path {seed_example['taxonomy_path']} is too long for the server context size of {server_ctx_size}. Ensure the total number of characters across the combined question, answer, and context is less than {max_seed_chars} for each example or use a server with a larger context size."
+                    )
+        else:
+            max_seed_tokens = max_seed_example_tokens(
+                server_ctx_size,
+                len(prompt_template),
+                prompt_num_tokens=tokenizer.count(prompt_template),
+            )
+            for seed_example in seed_instruction_data:
+                if (
+                    tokenizer.count(
+                        seed_example["instruction"]
+                        + seed_example["input"]
+                        + seed_example["output"]
+                    )
+                    >= max_seed_tokens
+                ):
+                    raise SystemExit(
+                        f"Error: An example in the taxonomy path {seed_example['taxonomy_path']} is too long for the server context size of {server_ctx_size}. Ensure the total number of tokens across the combined question, answer, and context is less than {max_seed_tokens} for each example or use a server with a larger context size."
+                    )
+    except TokenizerException as exc:
+        raise GenerateException(f"Counting seed example tokens failed: {exc}") from exc
 
     seeds = len(seed_instruction_data)
     logger.debug(f"Loaded {seeds} human-written seed instructions from {taxonomy}")
     if not seeds:
         raise SystemExit("Nothing to generate. Exiting.")
 
-    def unescape(s):
-        return bytes(s, "utf-8").decode("utf-8")
-
     test_data = []
     for seed_example in seed_instruction_data:
-        user = seed_example["instruction"]
-
         documents = seed_example["document"]
         if documents:
-            seed_example["document"] = chunk_document(
+            # seeds of one file share their documents, they are chunked once
+            seed_example["document"] = document_cache.chunk_document(
                 documents=documents,
                 server_ctx_size=server_ctx_size,
                 chunk_word_count=chunk_word_count,
+                tokenizer=tokenizer,
             )
 
-        if len(seed_example["input"]) > 0:
-            user += "\n" + seed_example["input"]
         try:
-            test_data.append(
-                {
-                    "system": utils.get_sysprompt(),
-                    "user": unescape(user),
-                    "assistant": unescape(seed_example["output"]),
-                }
-            )
+            test_data.append(train_entry(seed_example))
         except TypeError as exc:
             click.secho(
                 f"Error reading seed examples: {exc}. Please make sure your answers are verbose enough.",
@@ -453,156 +552,398 @@ def generate_data(
             )
             raise click.exceptions.Exit(1)
 
-    name = Path(model_name).stem  # Just in case it is a file path
-    date_suffix = datetime.now().replace(microsecond=0).isoformat().replace(":", "_")
-    output_file = f"generated_{name}_{date_suffix}.json"
-    output_file_train = f"train_{name}_{date_suffix}.jsonl"
-    output_file_test = f"test_{name}_{date_suffix}.jsonl"
-    output_file_discarded = os.path.join(
-        output_dir, f"discarded_{name}_{date_suffix}.log"
-    )
-    logger.debug(f"Generating to: {os.path.join(output_dir, output_file)}")
+    return seed_instruction_data, prompt_template, max_seed_tokens, test_data
 
-    request_idx = 0
-    # load the LM-generated instructions
-    machine_instruction_data = []
-    if os.path.exists(os.path.join(output_dir, "regen.json")):
-        machine_instruction_data = utils.jload(os.path.join(output_dir, "regen.json"))
-        logger.debug(
-            f"Loaded {len(machine_instruction_data)} machine-generated instructions"
-        )
+
+def generate_data(
+    logger,
+    api_base,
+    tls_insecure,
+    model_family: str,
+    yaml_rules: Optional[str] = None,
+    output_dir: Optional[str] = None,
+    taxonomy: Optional[str] = None,
+    taxonomy_base: Optional[str] = None,
+    prompt_file_path: Optional[str] = None,
+    model_name: Optional[str] = None,
+    num_cpus: Optional[int] = None,
+    num_instructions_to_generate: Optional[int] = None,
+    num_prompt_instructions=2,
+    request_batch_size=5,
+    temperature=1.0,
+    top_p=1.0,
+    rouge_threshold: Optional[float] = None,
+    console_output=True,
+    api_key: Optional[str] = None,
+    chunk_word_count=None,
+    server_ctx_size=None,
+    tls_client_cert: Optional[str] = None,
+    tls_client_key: Optional[str] = None,
+    tls_client_passwd: Optional[str] = None,
+    dedup_backend: str = "index",
+    max_in_flight: int = 1,
+    ordered_output: bool = True,
+    checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+    resume_dir: Optional[str] = None,
+    taxonomy_schedule: str = SCHEDULE_ROUND_ROBIN,
+    tokenizer: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    output_format: str = OUTPUT_FORMAT_JSONL,
+    metrics_interval: float = DEFAULT_METRICS_INTERVAL,
+    prometheus_file: Optional[str] = None,
+):
+    generate_start = time.time()
+
+    def unescape(s):
+        return bytes(s, "utf-8").decode("utf-8")
+
+    def train_entry(example):
+        user = example["instruction"]
+        if len(example["input"]) > 0:
+            user += "\n" + example["input"]
+        return {
+            "system": utils.get_sysprompt(),
+            "user": unescape(user),
+            "assistant": unescape(example["output"]),
+        }
 
     # similarities = {}
     scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=False)
 
+    # one client session for the whole run keeps connections alive and only
+    # checks the served models once
+    tls = (tls_insecure, tls_client_cert, tls_client_key, tls_client_passwd)
+    session = ClientSession.from_options(
+        api_base, api_key, tls, max_connections=max_in_flight
+    )
+    prompt_tokenizer = None
+    max_prompt_tokens = None
+    if tokenizer:
+        try:
+            prompt_tokenizer = get_tokenizer(tokenizer, session, model_name)
+        except TokenizerException as exc:
+            session.close()
+            raise GenerateException(str(exc)) from exc
+        if server_ctx_size:
+            # Ensure we have at least 1024 tokens available for a response.
+            max_prompt_tokens = server_ctx_size - 1024
+
+    manifest = None
+    documents = None
+    if resume_dir:
+        # continue from the last checkpoint of a previous run, its seeds and the
+        # tokenizations of its samples were saved and are not computed again
+        manifest_file = find_manifest(resume_dir)
+        if manifest_file is None:
+            raise SystemExit(f"Error: no generate run to resume in {resume_dir}.")
+        manifest = load_manifest(manifest_file)
+        # seeds and samples sharing documents share their resolved chunk lists
+        documents = load_documents(manifest_file, manifest)
+        manifest, machine_instruction_data, machine_instruction_tokens = (
+            load_checkpoint(manifest_file, documents)
+        )
+        output_dir = resume_dir
+        # the test split was written by the resumed run already
+        test_data = None
+        run = utils.jload(os.path.join(output_dir, manifest["files"]["seeds"]))
+        run_name = run["run_name"]
+        output_format = manifest.get("output_format", OUTPUT_FORMAT_JSONL)
+        seed_instruction_data = [
+            documents.resolve(seed) for seed in run["seed_instruction_data"]
+        ]
+        seed_instruction_tokens = run["seed_instruction_tokens"]
+        all_taxonomy_paths = run["taxonomy_paths"]
+        prompt_template = run["prompt_template"]
+        max_seed_tokens = run["max_seed_tokens"]
+        state = manifest["state"]
+        request_idx = state["request_idx"]
+        total_discarded = state["total_discarded"]
+        total_rouged = state["total_rouged"]
+        rng_state = state["rng"]
+        random.setstate((rng_state[0], tuple(rng_state[1]), rng_state[2]))
+        machine_seed_instruction_data = [
+            entry
+            for entry, tokens in zip(
+                machine_instruction_data, machine_instruction_tokens
+            )
+            if len(tokens) <= max_seed_tokens
+        ]
+        logger.debug(
+            f"Resuming {manifest_file} with {len(machine_instruction_data)} machine-generated instructions"
+        )
+    else:
+        seed_instruction_data, prompt_template, max_seed_tokens, test_data = (
+            _load_seed_data(
+                logger,
+                taxonomy,
+                taxonomy_base,
+                yaml_rules,
+                prompt_file_path,
+                model_family,
+                model_name,
+                server_ctx_size,
+                chunk_word_count,
+                train_entry,
+                prompt_tokenizer,
+                DocumentCache(cache_dir),
+                TaxonomyCache(cache_dir) if cache_dir else None,
+            )
+        )
+        if not os.path.exists(output_dir):
+            os.mkdir(output_dir)
+
+        name = Path(model_name).stem  # Just in case it is a file path
+        date_suffix = (
+            datetime.now().replace(microsecond=0).isoformat().replace(":", "_")
+        )
+        run_name = f"{name}_{date_suffix}"
+
+        request_idx = 0
+        total_discarded = 0
+        total_rouged = 0
+        # load the LM-generated instructions
+        machine_instruction_data = []
+        machine_seed_instruction_data = []
+        if os.path.exists(os.path.join(output_dir, "regen.json")):
+            # samples referencing their documents get them back, so the
+            # documents of this run hold them too
+            machine_instruction_data = load_regen(
+                os.path.join(output_dir, "regen.json")
+            )
+            logger.debug(
+                f"Loaded {len(machine_instruction_data)} machine-generated instructions"
+            )
+
+        # first we tokenize all the seed instructions and generated machine instructions
+        seed_instruction_tokens = [
+            scorer._tokenizer.tokenize(d["instruction"]) for d in seed_instruction_data
+        ]
+        machine_instruction_tokens = [
+            scorer._tokenizer.tokenize(d["instruction"])
+            for d in machine_instruction_data
+        ]
+        all_taxonomy_paths = list(
+            set(e["taxonomy_path"] for e in seed_instruction_data)
+        )
+
+    output_file = f"generated_{run_name}.json"
+    output_file_train = f"train_{run_name}.{output_format}"
+    output_file_test = f"test_{run_name}.{output_format}"
+    output_file_discarded = os.path.join(output_dir, f"discarded_{run_name}.log")
+    logger.debug(f"Generating to: {os.path.join(output_dir, output_file)}")
+    # per-request timings and token usage, to tell whether the run is bound
+    # by the teacher model, the ROUGE filter or the disk
+    metrics = GenerateMetrics(
+        os.path.join(output_dir, f"metrics_{run_name}.jsonl"),
+        prometheus_file,
+        metrics_interval,
+    )
+
     # now let's generate new instructions!
     progress_bar = tqdm.tqdm(total=num_instructions_to_generate)
     if machine_instruction_data:
         progress_bar.update(len(machine_instruction_data))
 
-    # first we tokenize all the seed instructions and generated machine instructions
-    all_instructions = [d["instruction"] for d in seed_instruction_data] + [
-        d["instruction"] for d in machine_instruction_data
-    ]
-    all_instruction_tokens = [
-        scorer._tokenizer.tokenize(inst) for inst in all_instructions
-    ]
+    all_instruction_tokens = seed_instruction_tokens + machine_instruction_tokens
+
+    # prompt examples are sampled from the pool of the request's taxonomy path
+    pools = TaxonomyPools(
+        all_taxonomy_paths, seed_instruction_data, schedule=taxonomy_schedule
+    )
+    for entry in machine_seed_instruction_data:
+        pools.add(entry)
 
     if console_output:
         print(
             "Synthesizing new instructions. If you aren't satisfied with the generated instructions, interrupt training (Ctrl-C) and try adjusting your YAML files. Adding more examples may help."
         )
 
-    mpctx = multiprocessing.get_context(DEFAULT_MULTIPROCESSING_START_METHOD)
-
-    all_taxonomy_paths = list(set(e["taxonomy_path"] for e in seed_instruction_data))
-    total_discarded = 0
-    total_rouged = 0
-    while len(machine_instruction_data) < num_instructions_to_generate:
-        request_idx += 1
-
-        # Pick taxonomy path
-        selected_taxonomy = all_taxonomy_paths[request_idx % len(all_taxonomy_paths)]
-        logger.info(f"Selected taxonomy path {selected_taxonomy}")
-        # Filter the pool
-        instruction_data_pool = [
-            e
-            for e in seed_instruction_data + machine_seed_instruction_data
-            if e["taxonomy_path"] == selected_taxonomy
-        ]
-        instruction_data, discarded = get_instructions_from_model(
-            logger,
-            request_idx,
-            instruction_data_pool,
-            prompt_template,
-            api_base,
-            api_key,
-            model_name,
-            num_prompt_instructions,
-            request_batch_size,
-            temperature,
-            top_p,
-            output_file_discarded,
-            tls_insecure,
-            tls_client_cert,
-            tls_client_key,
-            tls_client_passwd,
+    # set up the near-duplicate filter once, it keeps the tokenized instructions resident
+    similarity = get_similarity_backend(
+        dedup_backend, all_instruction_tokens, num_workers=num_cpus
+    )
+
+    # max_in_flight bounds the number of concurrent requests to the teacher model,
+    # spread over as many request batches as needed. Further batches are in flight
+    # while the results of earlier ones are filtered.
+    batches_in_flight = max(1, math.ceil(max_in_flight / request_batch_size))
+    batch_max_in_flight = min(max_in_flight, request_batch_size)
+    executor = ThreadPoolExecutor(max_workers=batches_in_flight)
+    pending = collections.deque()
+    # accepted samples are appended to the outputs, the test split is fixed
+    writer = GenerateOutputWriter(
+        output_dir,
+        output_file,
+        output_file_train,
+        output_file_test,
+        checkpoint_interval=checkpoint_interval,
+        manifest=manifest,
+        documents=documents,
+        output_format=output_format,
+        # the parquet train file of a resumed run is written again
+        train_entries=(
+            [train_entry(entry) for entry in machine_instruction_data]
+            if manifest is not None and output_format == OUTPUT_FORMAT_PARQUET
+            else None
+        ),
+    )
+    if manifest is None:
+        writer.write_test(test_data)
+        writer.write_seeds(
+            {
+                "run_name": run_name,
+                "seed_instruction_data": seed_instruction_data,
+                "seed_instruction_tokens": seed_instruction_tokens,
+                "taxonomy_paths": all_taxonomy_paths,
+                "prompt_template": prompt_template,
+                "max_seed_tokens": max_seed_tokens,
+            }
         )
-        total_discarded += discarded
-        total = len(instruction_data)
-        keep = 0
-        assess_start = time.time()
-        for instruction_data_entry in instruction_data:
-            # computing similarity with the pre-tokenized instructions
-            new_instruction_tokens = scorer._tokenizer.tokenize(
-                instruction_data_entry["instruction"]
-            )
-            with mpctx.Pool(num_cpus) as pool:
-                rouge_scores = pool.map(
-                    partial(rouge_scorer._score_lcs, new_instruction_tokens),
-                    all_instruction_tokens,
+        for synth_example, tokens in zip(
+            machine_instruction_data, machine_instruction_tokens
+        ):
+            writer.append(synth_example, train_entry(synth_example), tokens)
+
+    def checkpoint_state():
+        return {
+            "request_idx": request_idx,
+            "rng": random.getstate(),
+            "total_discarded": total_discarded,
+            "total_rouged": total_rouged,
+        }
+
+    completed = False
+    try:
+        while len(machine_instruction_data) < num_instructions_to_generate:
+            while len(pending) < batches_in_flight:
+                request_idx += 1
+
+                # Pick taxonomy path
+                selected_taxonomy = pools.select(request_idx)
+                logger.info(f"Selected taxonomy path {selected_taxonomy}")
+                # the request samples from the pool as it is now, samples
+                # accepted while it is in flight are not visible to it
+                instruction_data_pool = pools.snapshot(selected_taxonomy)
+                request_metrics = metrics.request(request_idx, selected_taxonomy)
+                # each request samples its prompts from its own generator seeded
+                # here, so prompts don't depend on the thread scheduling
+                future = executor.submit(
+                    get_instructions_from_model,
+                    logger,
+                    request_idx,
+                    instruction_data_pool,
+                    prompt_template,
+                    api_base,
+                    api_key,
+                    model_name,
+                    num_prompt_instructions,
+                    request_batch_size,
+                    temperature,
+                    top_p,
+                    output_file_discarded,
+                    tls_insecure,
+                    tls_client_cert,
+                    tls_client_key,
+                    tls_client_passwd,
+                    rng=random.Random(random.getrandbits(64)),
+                    max_in_flight=batch_max_in_flight,
+                    session=session,
+                    tokenizer=prompt_tokenizer,
+                    max_prompt_tokens=max_prompt_tokens,
+                    metrics=request_metrics,
                 )
-            pool.join()
-            instruction_data_entry["taxonomy_path"] = selected_taxonomy
-            rouge_scores = [score.fmeasure for score in rouge_scores]
-            # Comment out extra info not currently being used:
-            # most_similar_instructions = {
-            #    all_instructions[i]: rouge_scores[i] for i in np.argsort(rouge_scores)[-10:][::-1]
-            # }
-            if max(rouge_scores) > rouge_threshold:
-                total_rouged += 1
-                continue
-            keep += 1
-            # Comment out extra info not currently being used:
-            # instruction_data_entry["most_similar_instructions"] = most_similar_instructions
-            # instruction_data_entry["avg_similarity_score"] = float(np.mean(rouge_scores))
-
-            # Only add sufficiently small instructions to our machine seeds
-            if len(new_instruction_tokens) <= max_seed_tokens:
-                machine_seed_instruction_data.append(instruction_data_entry)
-
-            machine_instruction_data.append(instruction_data_entry)
-            all_instructions.append(instruction_data_entry["instruction"])
-            all_instruction_tokens.append(new_instruction_tokens)
-            if console_output:
-                print(
-                    f"Q> {instruction_data_entry['instruction']}\nI> {instruction_data_entry['input']}\nA> {instruction_data_entry['output']}\n"
+                pending.append((selected_taxonomy, future, request_metrics))
+
+            wait_start = time.perf_counter()
+            if ordered_output:
+                selected_taxonomy, future, request_metrics = pending.popleft()
+            else:
+                wait([p[1] for p in pending], return_when=FIRST_COMPLETED)
+                selected_taxonomy, future, request_metrics = next(
+                    p for p in pending if p[1].done()
                 )
-        progress_bar.update(keep)
-        assess_duration = time.time() - assess_start
-        logger.debug(f"Assessing generated samples took {assess_duration:.2f}s")
-        logger.debug(
-            f"Generated {total} instructions(discarded {discarded}), rouged {total - keep}, kept {keep} instructions"
-        )
-        utils.jdump(machine_instruction_data, os.path.join(output_dir, output_file))
-        train_data = []
-        for synth_example in machine_instruction_data:
-            user = synth_example["instruction"]
-            if len(synth_example["input"]) > 0:
-                user += "\n" + synth_example["input"]
-            train_data.append(
-                {
-                    "system": utils.get_sysprompt(),
-                    "user": unescape(user),
-                    "assistant": unescape(synth_example["output"]),
-                }
+                pending.remove((selected_taxonomy, future, request_metrics))
+            instruction_data, discarded = future.result()
+            request_metrics.timings["result_wait"] = time.perf_counter() - wait_start
+            total_discarded += discarded
+            total = len(instruction_data)
+            keep = 0
+            dedup_time = 0.0
+            write_time = 0.0
+            assess_start = time.time()
+            for instruction_data_entry in instruction_data:
+                # computing similarity with the pre-tokenized instructions
+                dedup_start = time.perf_counter()
+                new_instruction_tokens = scorer._tokenizer.tokenize(
+                    instruction_data_entry["instruction"]
+                )
+                instruction_data_entry["taxonomy_path"] = selected_taxonomy
+                duplicate = similarity.is_duplicate(
+                    new_instruction_tokens, rouge_threshold
+                )
+                dedup_time += time.perf_counter() - dedup_start
+                if duplicate:
+                    total_rouged += 1
+                    continue
+                keep += 1
+                # Comment out extra info not currently being used:
+                # instruction_data_entry["most_similar_instructions"] = most_similar_instructions
+                # instruction_data_entry["avg_similarity_score"] = float(np.mean(rouge_scores))
+
+                # Only add sufficiently small instructions to our machine seeds
+                if len(new_instruction_tokens) <= max_seed_tokens:
+                    pools.add(instruction_data_entry)
+
+                machine_instruction_data.append(instruction_data_entry)
+                write_start = time.perf_counter()
+                writer.append(
+                    instruction_data_entry,
+                    train_entry(instruction_data_entry),
+                    new_instruction_tokens,
+                )
+                write_time += time.perf_counter() - write_start
+                dedup_start = time.perf_counter()
+                similarity.add(new_instruction_tokens)
+                dedup_time += time.perf_counter() - dedup_start
+                if console_output:
+                    print(
+                        f"Q> {instruction_data_entry['instruction']}\nI> {instruction_data_entry['input']}\nA> {instruction_data_entry['output']}\n"
+                    )
+            progress_bar.update(keep)
+            assess_duration = time.time() - assess_start
+            logger.debug(f"Assessing generated samples took {assess_duration:.2f}s")
+            logger.debug(
+                f"Generated {total} instructions(discarded {discarded}), rouged {total - keep}, kept {keep} instructions"
             )
-        # utils.jdump(train_data, os.path.join(output_dir, output_file_train))
-        with open(
-            os.path.join(output_dir, output_file_train), "w", encoding="utf-8"
-        ) as outfile:
-            for entry in train_data:
-                json.dump(entry, outfile, ensure_ascii=False)
-                outfile.write("\n")
-        # utils.jdump(test_data, os.path.join(output_dir, output_file_test))
-        with open(
-            os.path.join(output_dir, output_file_test), "w", encoding="utf-8"
-        ) as outfile:
-            for entry in test_data:
-                json.dump(entry, outfile, ensure_ascii=False)
-                outfile.write("\n")
+            write_start = time.perf_counter()
+            writer.commit(checkpoint_state())
+            write_time += time.perf_counter() - write_start
+            request_metrics.timings["dedup_time"] = dedup_time
+            request_metrics.timings["write_time"] = write_time
+            request_metrics.counters["rouge_rejected"] = total - keep
+            request_metrics.counters["kept"] = keep
+            metrics.record(request_metrics)
+        completed = True
+    finally:
+        # batches that already started finish their requests before the
+        # session's connections are closed, unless generation failed or was
+        # interrupted, which should not wait for the teacher model
+        executor.shutdown(wait=completed, cancel_futures=True)
+        similarity.close()
+        session.close()
+        writer.close(checkpoint_state(), complete=completed)
+        metrics_summary = metrics.close()
+
+    stats = session.stats()
+    logger.debug(
+        f"Teacher requests: {stats['requests']} ({stats['errors']} failed), "
+        f"{stats['connections']} connections opened, "
+        f"{stats['tls_handshakes']} TLS handshakes, "
+        f"average latency {stats['latency_avg']:.2f}s, max {stats['latency_max']:.2f}s"
+    )
 
     progress_bar.close()
+    logger.info(f"Generate metrics:\n{format_summary(metrics_summary)}")
 
     if total_discarded or total_rouged:
         logger.info(
@@ -0,0 +1,243 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from typing import Dict, List, Optional
+import json
+import os
+import threading
+import time
+
+# Local
+from ..metrics_util import QUANTILES, percentile
+
+DEFAULT_METRICS_INTERVAL = 10.0
+"""Seconds between two exports of the generate metrics"""
+
+# durations of a request, in seconds. queue_wait is spent before a worker
+# picks the request up, result_wait by the main loop waiting for its results
+TIMINGS = (
+    "queue_wait",
+    "http_latency",
+    "parse_time",
+    "result_wait",
+    "dedup_time",
+    "write_time",
+)
+
+# latency of each chat completion request sent to the teacher model, a
+# request sends one per prompt of its batch
+RESPONSE_LATENCY = "response_latency"
+
+COUNTERS = (
+    "http_requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "generated",
+    "discarded",
+    "rouge_rejected",
+    "kept",
+)
+
+_PROMETHEUS_PREFIX = "ilab_generate"
+
+
+class RequestMetrics:
+    """Measurements of one generate request.
+
+    The worker sending the request records the queue wait, the responses of
+    the teacher and the parsing, the main loop the filtering and writing of
+    its samples. The prompts of a request are sent concurrently, their
+    responses are recorded under a lock.
+    """
+
+    def __init__(self, request_idx: int, taxonomy_path: str):
+        self.request_idx = request_idx
+        self.taxonomy_path = taxonomy_path
+        self.submitted = time.perf_counter()
+        self.timings: Dict[str, float] = dict.fromkeys(TIMINGS, 0.0)
+        self.counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.response_latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Called by the worker when it starts sending the request."""
+        self.timings["queue_wait"] = time.perf_counter() - self.submitted
+
+    def record_response(self, latency: float, usage=None):
+        """Record a chat completion response and its token usage."""
+        with self._lock:
+            self.response_latencies.append(latency)
+            self.counters["http_requests"] += 1
+            if usage is not None:
+                self.counters["prompt_tokens"] += usage.prompt_tokens or 0
+                self.counters["completion_tokens"] += usage.completion_tokens or 0
+
+    def to_dict(self) -> dict:
+        return {
+            "request_idx": self.request_idx,
+            "taxonomy_path": self.taxonomy_path,
+            **{name: round(value, 6) for name, value in self.timings.items()},
+            **self.counters,
+        }
+
+
+class GenerateMetrics:  # pylint: disable=too-many-instance-attributes
+    """Collects the metrics of the requests of a generate run.
+
+    Completed requests are appended to a JSON lines file every interval
+    seconds, followed by a progress line with the totals of the run so far.
+    If prometheus_path is given, the totals are also written there in the
+    Prometheus text format, replacing the file atomically so it can be
+    picked up by the node exporter's textfile collector. close() appends the
+    summary of the run.
+
+    Requests are only recorded by the generate loop, the collector is not
+    thread safe.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        prometheus_path: Optional[str] = None,
+        interval: float = DEFAULT_METRICS_INTERVAL,
+    ):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self.interval = interval
+        self.start_time = time.perf_counter()
+        self.requests = 0
+        self.totals: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.timings: Dict[str, List[float]] = {
+            name: [] for name in TIMINGS + (RESPONSE_LATENCY,)
+        }
+        self._pending: List[dict] = []
+        self._last_export = self.start_time
+
+    def request(self, request_idx: int, taxonomy_path: str) -> RequestMetrics:
+        """Metrics of a request about to be submitted."""
+        return RequestMetrics(request_idx, taxonomy_path)
+
+    def record(self, request: RequestMetrics):
+        """Record a request whose samples were filtered and written."""
+        self.requests += 1
+        for name, value in request.counters.items():
+            self.totals[name] += value
+        for name, value in request.timings.items():
+            self.timings[name].append(value)
+        self.timings[RESPONSE_LATENCY].extend(request.response_latencies)
+        if self.path is not None:
+            self._pending.append({"type": "request", **request.to_dict()})
+        if time.perf_counter() - self._last_export >= self.interval:
+            self.export()
+
+    def summary(self) -> dict:
+        """Totals, throughput and latency percentiles of the run so far."""
+        duration = time.perf_counter() - self.start_time
+        tokens = self.totals["prompt_tokens"] + self.totals["completion_tokens"]
+        return {
+            "requests": self.requests,
+            "duration": round(duration, 3),
+            **self.totals,
+            "tokens_per_sec": round(tokens / duration, 3) if duration else 0.0,
+            "completion_tokens_per_sec": (
+                round(self.totals["completion_tokens"] / duration, 3)
+                if duration
+                else 0.0
+            ),
+            "timings": {
+                name: {
+                    "total": round(sum(values), 6),
+                    **{
+                        f"p{int(q * 100)}": round(percentile(values, q), 6)
+                        for q in QUANTILES
+                    },
+                }
+                for name, values in self.timings.items()
+            },
+        }
+
+    def export(self, summary_type: str = "progress") -> dict:
+        """Write the pending requests and the totals, return the totals."""
+        self._last_export = time.perf_counter()
+        summary = self.summary()
+        if self.path is not None:
+            lines = self._pending + [
+                {"type": summary_type, "time": time.time(), **summary}
+            ]
+            self._pending = []
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(line) + "\n" for line in lines)
+        if self.prometheus_path is not None:
+            tmp_path = f"{self.prometheus_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(
+                    prometheus_text(
+                        summary,
+                        {name: len(values) for name, values in self.timings.items()},
+                    )
+                )
+            os.replace(tmp_path, self.prometheus_path)
+        return summary
+
+    def close(self) -> dict:
+        """Write the remaining requests and the summary of the run."""
+        return self.export("summary")
+
+
+def prometheus_text(summary: dict, counts: Dict[str, int]) -> str:
+    """The totals of a run in the Prometheus text exposition format.
+
+    counts is the number of measurements of each stage of summary's timings.
+    """
+    prefix = _PROMETHEUS_PREFIX
+    lines = [
+        f"# HELP {prefix}_requests_total Generate requests completed.",
+        f"# TYPE {prefix}_requests_total counter",
+        f"{prefix}_requests_total {summary['requests']}",
+        f"# HELP {prefix}_http_requests_total Chat completion requests sent to the teacher model.",
+        f"# TYPE {prefix}_http_requests_total counter",
+        f"{prefix}_http_requests_total {summary['http_requests']}",
+        f"# HELP {prefix}_tokens_total Tokens reported by the teacher model.",
+        f"# TYPE {prefix}_tokens_total counter",
+        f'{prefix}_tokens_total{{kind="prompt"}} {summary["prompt_tokens"]}',
+        f'{prefix}_tokens_total{{kind="completion"}} {summary["completion_tokens"]}',
+        f"# HELP {prefix}_samples_total Generated samples by outcome.",
+        f"# TYPE {prefix}_samples_total counter",
+    ]
+    for outcome in ("kept", "discarded", "rouge_rejected"):
+        lines.append(
+            f'{prefix}_samples_total{{outcome="{outcome}"}} {summary[outcome]}'
+        )
+    lines += [
+        f"# HELP {prefix}_tokens_per_second Prompt and completion tokens per second over the run.",
+        f"# TYPE {prefix}_tokens_per_second gauge",
+        f"{prefix}_tokens_per_second {summary['tokens_per_sec']}",
+        f"# HELP {prefix}_stage_seconds Time spent per request in each stage.",
+        f"# TYPE {prefix}_stage_seconds summary",
+    ]
+    for name, timing in summary["timings"].items():
+        for q in QUANTILES:
+            lines.append(
+                f'{prefix}_stage_seconds{{stage="{name}",quantile="{q}"}} '
+                f"{timing[f'p{int(q * 100)}']}"
+            )
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {timing["total"]}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {counts[name]}')
+    return "\n".join(lines) + "\n"
+
+
+def format_summary(summary: dict) -> str:
+    """One line per stage with its percentiles, for the end-of-run log."""
+    lines = [
+        f"{summary['requests']} requests, {summary['http_requests']} teacher "
+        f"requests, {summary['prompt_tokens']} prompt and "
+        f"{summary['completion_tokens']} completion tokens, "
+        f"{summary['tokens_per_sec']:.1f} tokens/s "
+        f"({summary['completion_tokens_per_sec']:.1f} completion tokens/s)"
+    ]
+    for name, timing in summary["timings"].items():
+        lines.append(
+            f"{name}: p50 {timing['p50']:.3f}s, p95 {timing['p95']:.3f}s, "
+            f"p99 {timing['p99']:.3f}s, total {timing['total']:.2f}s"
+        )
+    return "\n".join(lines)
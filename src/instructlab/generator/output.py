@@ -0,0 +1,605 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from typing import Dict, List, Optional, Tuple
+import glob
+import json
+import os
+import time
+
+# Local
+from ..cache import content_key
+from .utils import GenerateException
+
+DEFAULT_CHECKPOINT_INTERVAL = 30.0
+"""Seconds between two checkpoints of the generate outputs"""
+
+MANIFEST_VERSION = 1
+
+OUTPUT_FORMAT_JSONL = "jsonl"
+OUTPUT_FORMAT_PARQUET = "parquet"
+OUTPUT_FORMATS = (OUTPUT_FORMAT_JSONL, OUTPUT_FORMAT_PARQUET)
+
+# train and test entries, see generate_data's train_entry
+TRAIN_COLUMNS = ("system", "user", "assistant")
+
+# rows buffered before a row group of the train parquet file is written
+_PARQUET_ROW_GROUP_SIZE = 10000
+
+_INDENT = 4
+
+
+def _sidecar_path(output_path: str, kind: str) -> str:
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.{kind}{ext}"
+
+
+def manifest_path(output_path: str) -> str:
+    """Path of the run manifest kept next to a generated json file."""
+    return _sidecar_path(output_path, "manifest")
+
+
+def tokens_path(output_path: str) -> str:
+    """Path of the ROUGE tokenizations of the samples of a generated json file."""
+    return _sidecar_path(output_path, "tokens")
+
+
+def seeds_path(output_path: str) -> str:
+    """Path of the seed data of the run that wrote a generated json file."""
+    return _sidecar_path(output_path, "seeds")
+
+
+def documents_path(output_path: str) -> str:
+    """Path of the documents referenced by the samples of a generated json file."""
+    return _sidecar_path(output_path, "documents")
+
+
+DOCUMENT_REF_PREFIX = "sha256:"
+
+
+class DocumentTable:
+    """The knowledge documents of a generate run, interned by content hash.
+
+    Samples generated from a knowledge seed carry the chunk list of its
+    documents. Instead of repeating the list in every sample, the output
+    files reference it by the content hash of the list, and the table is
+    stored once in the documents sidecar. The sidecar is only read when a
+    reference is first resolved, and resolving references to the same
+    documents gives the same list.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._documents: Optional[Dict[str, List[str]]] = None
+        # id of a chunk list -> (the list, its reference), samples generated
+        # from the same seed share the list and it is only hashed once
+        self._refs: Dict[int, Tuple[List[str], str]] = {}
+        self._dirty = False
+
+    def _table(self) -> Dict[str, List[str]]:
+        if self._documents is None:
+            self._documents = {}
+            if self.path is not None and os.path.exists(self.path):
+                with open(self.path, encoding="utf-8") as f:
+                    self._documents = json.load(f)
+        return self._documents
+
+    def __getitem__(self, ref: str) -> List[str]:
+        try:
+            return self._table()[ref]
+        except KeyError:
+            raise GenerateException(
+                f"Document {ref} is missing from {self.path}"
+            ) from None
+
+    def __contains__(self, ref: str) -> bool:
+        return ref in self._table()
+
+    def intern(self, documents: List[str]) -> str:
+        """Add the chunk list to the table and return its reference."""
+        known = self._refs.get(id(documents))
+        if known is not None and known[0] is documents:
+            return known[1]
+        ref = DOCUMENT_REF_PREFIX + content_key(documents)
+        table = self._table()
+        if ref not in table:
+            table[ref] = documents
+            self._dirty = True
+        self._refs[id(documents)] = (documents, ref)
+        return ref
+
+    def reference(self, sample: dict) -> dict:
+        """The sample with its documents replaced by their reference."""
+        documents = sample.get("document")
+        if not isinstance(documents, list) or not documents:
+            return sample
+        return dict(sample, document=self.intern(documents))
+
+    def resolve(self, sample: dict) -> dict:
+        """The sample with its document reference replaced by the documents."""
+        ref = sample.get("document")
+        if not isinstance(ref, str) or not ref.startswith(DOCUMENT_REF_PREFIX):
+            return sample
+        documents = self[ref]
+        self._refs[id(documents)] = (documents, ref)
+        return dict(sample, document=documents)
+
+    def save(self):
+        """Write the table to its sidecar if documents were added."""
+        if self._dirty and self.path is not None:
+            _write_atomic(self.path, self._table())
+            self._dirty = False
+
+
+def _encode_sample(sample) -> bytes:
+    # same layout as an array element written by utils.jdump, so the
+    # finished file is byte for byte identical to a single json.dump
+    text = json.dumps(sample, indent=_INDENT, default=str)
+    return (" " * _INDENT + text.replace("\n", "\n" + " " * _INDENT)).encode("utf-8")
+
+
+def _encode_tokens(tokens) -> bytes:
+    return json.dumps(tokens).encode("utf-8")
+
+
+def _encode_line(entry) -> bytes:
+    return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _write_atomic(path: str, data: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _open_at(path: str, offset: Optional[int]):
+    """Open a file for writing, truncated to offset if resuming."""
+    # pylint: disable=consider-using-with
+    if offset is None:
+        return open(path, "wb")
+    f = open(path, "r+b")
+    if f.seek(0, os.SEEK_END) < offset:
+        f.close()
+        raise GenerateException(f"{path} is shorter than its checkpoint")
+    f.seek(offset)
+    f.truncate()
+    return f
+
+
+class _JsonArrayFile:
+    """A json array file that is appended to in place.
+
+    The closing bracket is only written on ``close_array`` and written over
+    by the next ``append``.
+    """
+
+    def __init__(self, path, encode, offset=None, count=0):
+        self.encode = encode
+        self.count = count
+        self.file = _open_at(path, offset)
+        if offset is None:
+            self.file.write(b"[")
+            offset = 1
+        self.offset = offset
+
+    def append(self, obj):
+        self.file.seek(self.offset)
+        data = (b",\n" if self.count else b"\n") + self.encode(obj)
+        self.file.write(data)
+        self.offset += len(data)
+        self.count += 1
+
+    def close_array(self):
+        self.file.seek(self.offset)
+        self.file.write(b"\n]" if self.count else b"]")
+        self.file.truncate()
+
+
+class _JsonLinesFile:
+    def __init__(self, path, offset=None):
+        self.file = _open_at(path, offset)
+        self.offset = offset or 0
+
+    def append(self, entry):
+        data = _encode_line(entry)
+        self.file.write(data)
+        self.offset += len(data)
+
+    def finish(self):
+        pass
+
+
+def _train_schema():
+    # pylint: disable=import-outside-toplevel
+    # Third Party
+    import pyarrow as pa
+
+    return pa.schema([(name, pa.string()) for name in TRAIN_COLUMNS])
+
+
+def _train_table(entries: List[dict]):
+    # pylint: disable=import-outside-toplevel
+    # Third Party
+    import pyarrow as pa
+
+    schema = _train_schema()
+    return pa.Table.from_pydict(
+        {name: [entry[name] for entry in entries] for name in TRAIN_COLUMNS},
+        schema=schema,
+    )
+
+
+class _ParquetFile:
+    """A zstd compressed parquet file of train entries.
+
+    Entries are written in row groups of _PARQUET_ROW_GROUP_SIZE and the
+    file is only readable once finished, so the offset is the number of
+    entries instead of a byte offset. A resumed run writes the file again
+    from the entries of its checkpoint.
+    """
+
+    def __init__(self, path, entries: Optional[List[dict]] = None):
+        # pylint: disable=import-outside-toplevel
+        # Third Party
+        import pyarrow.parquet as pq
+
+        self.file = open(path, "wb")  # pylint: disable=consider-using-with
+        self._writer = pq.ParquetWriter(self.file, _train_schema(), compression="zstd")
+        self._pending: List[dict] = []
+        self.offset = 0
+        for entry in entries or ():
+            self.append(entry)
+
+    def append(self, entry):
+        self._pending.append(entry)
+        self.offset += 1
+        if len(self._pending) >= _PARQUET_ROW_GROUP_SIZE:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if self._pending:
+            self._writer.write_table(_train_table(self._pending))
+            self._pending = []
+
+    def finish(self):
+        self._write_row_group()
+        self._writer.close()
+
+
+def write_train_file(path: str, entries: List[dict]):
+    """Write train or test entries to a jsonl or, by extension, parquet file."""
+    if path.endswith(f".{OUTPUT_FORMAT_PARQUET}"):
+        # pylint: disable=import-outside-toplevel
+        # Third Party
+        import pyarrow.parquet as pq
+
+        pq.write_table(_train_table(entries), path, compression="zstd")
+        return
+    with open(path, "wb") as f:
+        for entry in entries:
+            f.write(_encode_line(entry))
+
+
+def read_train_file(path: str) -> List[dict]:
+    """Read the train or test entries of a jsonl or parquet file."""
+    if path.endswith(f".{OUTPUT_FORMAT_PARQUET}"):
+        # pylint: disable=import-outside-toplevel
+        # Third Party
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, memory_map=True).to_pylist()
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class GenerateOutputWriter:  # pylint: disable=too-many-instance-attributes
+    """Append-only writer for the generate output files.
+
+    Accepted samples are appended to the generated json array and the train
+    jsonl file as they come in, instead of rewriting both files after every
+    request batch. The test jsonl file never changes and is written once.
+
+    The json arrays are closed and all files are fsynced at every checkpoint
+    (at most every ``checkpoint_interval`` seconds, and when the writer is
+    closed). A checkpoint then atomically replaces the run manifest next to
+    the generated json file, which records the committed byte offsets, the
+    file names and the generator state passed by the caller. If the run dies
+    between two checkpoints, ``load_generated`` and ``load_checkpoint`` read
+    the samples of the last checkpoint, and passing the manifest back to the
+    writer truncates the files to that checkpoint to continue the run.
+
+    With the parquet output format, the train and test splits are written
+    as parquet files instead of jsonl. The train file is only readable once
+    the writer is closed, and resuming a run needs the train entries of its
+    checkpoint to write it again.
+
+    The ROUGE tokenization of every sample is kept in a tokens sidecar, so
+    a resumed run does not tokenize the samples again. The documents of the
+    samples and seeds are kept once in a documents sidecar (see
+    ``DocumentTable``) and referenced by content hash.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        output_file: str,
+        output_file_train: str,
+        output_file_test: str,
+        checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+        manifest: Optional[dict] = None,
+        documents: Optional[DocumentTable] = None,
+        output_format: str = OUTPUT_FORMAT_JSONL,
+        train_entries: Optional[List[dict]] = None,
+    ):
+        self.output_dir = output_dir
+        self.output_path = os.path.join(output_dir, output_file)
+        self.train_path = os.path.join(output_dir, output_file_train)
+        self.test_path = os.path.join(output_dir, output_file_test)
+        self.manifest_path = manifest_path(self.output_path)
+        self.tokens_path = tokens_path(self.output_path)
+        self.seeds_path = seeds_path(self.output_path)
+        if documents is None:
+            documents = DocumentTable(documents_path(self.output_path))
+        self.documents = documents
+        self.checkpoint_interval = checkpoint_interval
+        self.state: dict = {}
+        offsets = {}
+        num_samples = 0
+        if manifest is not None:
+            offsets = manifest["offsets"]
+            num_samples = manifest["num_samples"]
+            self.state = manifest.get("state", {})
+        self._output = _JsonArrayFile(
+            self.output_path,
+            _encode_sample,
+            offsets.get("output"),
+            num_samples,
+        )
+        self._tokens = _JsonArrayFile(
+            self.tokens_path,
+            _encode_tokens,
+            offsets.get("tokens"),
+            num_samples,
+        )
+        if manifest is not None:
+            output_format = manifest.get("output_format", OUTPUT_FORMAT_JSONL)
+        self.output_format = output_format
+        if output_format == OUTPUT_FORMAT_PARQUET:
+            if manifest is not None and (
+                train_entries is None or len(train_entries) != num_samples
+            ):
+                raise GenerateException(
+                    f"Resuming {self.train_path} needs the train entries of its "
+                    f"{num_samples} samples"
+                )
+            self._train = _ParquetFile(self.train_path, train_entries)
+        else:
+            self._train = _JsonLinesFile(self.train_path, offsets.get("train"))
+        self._last_checkpoint = time.monotonic()
+        self._closed = False
+        self.checkpoint()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close(complete=exc_type is None)
+
+    @property
+    def num_samples(self) -> int:
+        return self._output.count
+
+    def write_test(self, test_data: List[dict]):
+        """Write the test split, which does not change during the run."""
+        write_train_file(self.test_path, test_data)
+        with open(self.test_path, "rb") as f:
+            os.fsync(f.fileno())
+
+    def write_seeds(self, seeds: dict):
+        """Write the seed data a resumed run starts from."""
+        seeds = dict(
+            seeds,
+            seed_instruction_data=[
+                self.documents.reference(seed)
+                for seed in seeds.get("seed_instruction_data", [])
+            ],
+        )
+        self.documents.save()
+        _write_atomic(self.seeds_path, seeds)
+
+    def append(
+        self,
+        sample: dict,
+        train_entry: Optional[dict] = None,
+        tokens: Optional[List[str]] = None,
+    ):
+        """Append one accepted sample, its train entry and its tokenization."""
+        self._output.append(self.documents.reference(sample))
+        self._tokens.append(tokens)
+        if train_entry is not None:
+            self._train.append(train_entry)
+
+    def commit(self, state: Optional[dict] = None):
+        """Make the samples appended so far visible to readers.
+
+        Python buffers are flushed every time, the files are checkpointed
+        with the given state when the checkpoint interval elapsed.
+        """
+        if state is not None:
+            self.state = state
+        if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+        else:
+            for f in self._files():
+                f.flush()
+
+    def _files(self):
+        return (self._output.file, self._tokens.file, self._train.file)
+
+    def checkpoint(self, complete: bool = False):
+        """Close the json arrays, fsync the outputs and replace the manifest."""
+        self._output.close_array()
+        self._tokens.close_array()
+        for f in self._files():
+            f.flush()
+            os.fsync(f.fileno())
+        # before the manifest commits the samples referencing them
+        self.documents.save()
+        _write_atomic(
+            self.manifest_path,
+            {
+                "version": MANIFEST_VERSION,
+                "complete": complete,
+                "output_format": self.output_format,
+                "files": {
+                    "output": os.path.basename(self.output_path),
+                    "train": os.path.basename(self.train_path),
+                    "test": os.path.basename(self.test_path),
+                    "tokens": os.path.basename(self.tokens_path),
+                    "seeds": os.path.basename(self.seeds_path),
+                    "documents": os.path.basename(self.documents.path),
+                },
+                "num_samples": self.num_samples,
+                "offsets": {
+                    "output": self._output.offset,
+                    "tokens": self._tokens.offset,
+                    "train": self._train.offset,
+                },
+                "state": self.state,
+            },
+        )
+        self._last_checkpoint = time.monotonic()
+
+    def close(self, state: Optional[dict] = None, complete: bool = True):
+        """Write the final checkpoint and close the files.
+
+        A run that failed or was interrupted is closed with complete False,
+        its manifest then stays a checkpoint to resume from.
+        """
+        if self._closed:
+            return
+        if state is not None:
+            self.state = state
+        self._train.finish()
+        self.checkpoint(complete=complete)
+        for f in self._files():
+            f.close()
+        self._closed = True
+
+
+def find_manifest(run_dir: str) -> Optional[str]:
+    """Path of the manifest of the latest run in run_dir, if any."""
+    # file names end with the run's timestamp, so they sort chronologically
+    manifests = sorted(glob.glob(os.path.join(run_dir, "generated_*.manifest.json")))
+    return manifests[-1] if manifests else None
+
+
+def load_manifest(path: str) -> dict:
+    """Load a run manifest."""
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise GenerateException(
+            f"Unsupported manifest version {manifest.get('version')} in {path}"
+        )
+    return manifest
+
+
+def _read_array(path: str, offset: int, count: int) -> list:
+    with open(path, "rb") as f:
+        data = f.read(offset)
+    if len(data) != offset:
+        raise GenerateException(f"{path} is shorter than its checkpoint")
+    return json.loads(data + (b"\n]" if count else b"]"))
+
+
+def load_checkpoint(path: str, documents: Optional[DocumentTable] = None):
+    """Load the manifest, samples and sample tokens of a run manifest.
+
+    Only the samples of the last checkpoint are returned, whether or not
+    the run finished. Document references are resolved through documents,
+    the table of the run by default.
+    """
+    manifest = load_manifest(path)
+    run_dir = os.path.dirname(path)
+    files = manifest["files"]
+    offsets = manifest["offsets"]
+    count = manifest["num_samples"]
+    if documents is None:
+        documents = load_documents(path, manifest)
+    samples = _read_array(
+        os.path.join(run_dir, files["output"]), offsets["output"], count
+    )
+    tokens = _read_array(
+        os.path.join(run_dir, files["tokens"]), offsets["tokens"], count
+    )
+    return manifest, [documents.resolve(sample) for sample in samples], tokens
+
+
+def load_documents(path: str, manifest: Optional[dict] = None) -> DocumentTable:
+    """The document table of a run manifest, read on first use."""
+    if manifest is None:
+        manifest = load_manifest(path)
+    files = manifest["files"]
+    name = files.get("documents", documents_path(files["output"]))
+    return DocumentTable(os.path.join(os.path.dirname(path), name))
+
+
+def load_generated(output_path: str, resolve_documents: bool = True) -> List[dict]:
+    """Load the samples of a generated json file, even from an unfinished run.
+
+    If the run did not finish, the samples up to its last checkpoint are
+    returned. Document references are resolved unless resolve_documents is
+    False, consumers that only need some of the documents then resolve them
+    with a ``DocumentTable`` of ``documents_path(output_path)``.
+    """
+    path = manifest_path(output_path)
+    samples = None
+    if os.path.exists(path):
+        manifest = load_manifest(path)
+        if not manifest["complete"]:
+            samples = _read_array(
+                output_path, manifest["offsets"]["output"], manifest["num_samples"]
+            )
+    if samples is None:
+        with open(output_path, encoding="utf-8") as f:
+            samples = json.load(f)
+    if not resolve_documents:
+        return samples
+    documents = DocumentTable(documents_path(output_path))
+    return [documents.resolve(sample) for sample in samples]
+
+
+def load_regen(path: str) -> List[dict]:
+    """Load the samples of a generated json file copied to resume from them.
+
+    The copy is usually made without the documents sidecar of the file, so
+    references are resolved through the sidecar of the copy if there is
+    one, else through the sidecars of the generated files next to it.
+    """
+    samples = load_generated(path, resolve_documents=False)
+    tables = [DocumentTable(documents_path(path))] + [
+        DocumentTable(sidecar)
+        for sidecar in sorted(
+            glob.glob(
+                os.path.join(os.path.dirname(path), "generated_*.documents.json")
+            ),
+            reverse=True,
+        )
+    ]
+    resolved = []
+    for sample in samples:
+        ref = sample.get("document")
+        if isinstance(ref, str) and ref.startswith(DOCUMENT_REF_PREFIX):
+            table = next((table for table in tables if ref in table), None)
+            if table is None:
+                raise GenerateException(
+                    f"Document {ref} of {path} is missing from the documents "
+                    "of the generated files next to it"
+                )
+            sample = table.resolve(sample)
+        resolved.append(sample)
+    return resolved
@@ -0,0 +1,102 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from collections.abc import Sequence
+from typing import Dict, Iterable, List
+import math
+
+SCHEDULE_ROUND_ROBIN = "round-robin"
+SCHEDULE_WEIGHTED = "weighted"
+
+TAXONOMY_SCHEDULES = [SCHEDULE_ROUND_ROBIN, SCHEDULE_WEIGHTED]
+"""Available schedules to pick the taxonomy path of a request"""
+
+
+class _PoolSnapshot(Sequence):
+    """Read-only view of the first ``size`` examples of a pool.
+
+    Pools only grow by appending, so the view keeps seeing the same examples
+    while the pool grows, without copying it.
+    """
+
+    def __init__(self, pool: List[dict], size: int):
+        self._pool = pool
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._pool[i] for i in range(*idx.indices(self._size))]
+        if idx < 0:
+            idx += self._size
+        if not 0 <= idx < self._size:
+            raise IndexError("pool snapshot index out of range")
+        return self._pool[idx]
+
+
+def _weighted_schedule(paths: List[str], weights: List[int]) -> List[str]:
+    """One cycle of a smooth weighted round-robin over the paths."""
+    divisor = math.gcd(*weights)
+    weights = [weight // divisor for weight in weights]
+    total = sum(weights)
+    current = [0] * len(paths)
+    schedule = []
+    for _ in range(total):
+        for idx, weight in enumerate(weights):
+            current[idx] += weight
+        best = max(range(len(paths)), key=current.__getitem__)
+        current[best] -= total
+        schedule.append(paths[best])
+    return schedule
+
+
+class TaxonomyPools:
+    """Prompt example pools indexed by taxonomy path.
+
+    Every request samples its prompt examples from the pool of one taxonomy
+    path: the human-written seed examples of that path and the accepted
+    machine-generated examples added to it during the run.
+
+    The path of a request is picked from a schedule computed once:
+    ``round-robin`` cycles over the paths, ``weighted`` interleaves them in
+    proportion to their number of seed examples.
+    """
+
+    def __init__(
+        self,
+        taxonomy_paths: Iterable[str],
+        seed_examples: Iterable[dict],
+        schedule: str = SCHEDULE_ROUND_ROBIN,
+    ):
+        self.paths = list(taxonomy_paths)
+        self._pools: Dict[str, List[dict]] = {path: [] for path in self.paths}
+        for example in seed_examples:
+            self.add(example)
+        if schedule == SCHEDULE_ROUND_ROBIN:
+            self._schedule = self.paths
+        elif schedule == SCHEDULE_WEIGHTED:
+            self._schedule = _weighted_schedule(
+                self.paths, [len(self._pools[path]) or 1 for path in self.paths]
+            )
+        else:
+            raise ValueError(
+                f"Unknown taxonomy schedule '{schedule}', choose one of {TAXONOMY_SCHEDULES}"
+            )
+
+    def add(self, example: dict):
+        """Add an example to the pool of its taxonomy path."""
+        self._pools[example["taxonomy_path"]].append(example)
+
+    def select(self, request_idx: int) -> str:
+        """Returns the taxonomy path of the request with the given index."""
+        return self._schedule[request_idx % len(self._schedule)]
+
+    def snapshot(self, taxonomy_path: str) -> Sequence:
+        """Returns the current pool of a path, unaffected by later additions."""
+        pool = self._pools[taxonomy_path]
+        return _PoolSnapshot(pool, len(pool))
+
+    def __len__(self):
+        return sum(len(pool) for pool in self._pools.values())
@@ -0,0 +1,267 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+import math
+import multiprocessing
+
+# Third Party
+from rouge_score import rouge_scorer
+
+# Local
+from ..config import DEFAULT_MULTIPROCESSING_START_METHOD
+
+_CMD_ADD = "add"
+_CMD_SCORE = "score"
+_CMD_CLOSE = "close"
+
+# tolerance used when pruning with upper bounds so that floating point noise
+# never drops a pair the exact score would have flagged
+_EPSILON = 1e-9
+
+
+def _max_fmeasure(candidate_tokens, corpus_tokens, stop_above=None) -> float:
+    """Returns the highest ROUGE-L f-measure of the candidate against the corpus.
+
+    If stop_above is given, returns as soon as a score above it is found.
+    """
+    best = 0.0
+    for tokens in corpus_tokens:
+        score = rouge_scorer._score_lcs(candidate_tokens, tokens).fmeasure
+        if score > best:
+            best = score
+            if stop_above is not None and best > stop_above:
+                break
+    return best
+
+
+def _worker(conn, shard):
+    """Worker loop holding one shard of the tokenized corpus in memory.
+
+    Commands arrive over the pipe in order, so a score request always sees
+    every token list added before it.
+    """
+    try:
+        while True:
+            cmd, payload = conn.recv()
+            if cmd == _CMD_ADD:
+                shard.append(payload)
+            elif cmd == _CMD_SCORE:
+                tokens, stop_above = payload
+                conn.send(_max_fmeasure(tokens, shard, stop_above))
+            elif cmd == _CMD_CLOSE:
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        conn.close()
+
+
+class RougeSimilarity:
+    """Long-lived brute-force ROUGE-L similarity engine.
+
+    The worker processes are started once and each keeps a shard of the
+    tokenized corpus resident, so scoring a candidate only ships the
+    candidate tokens to the workers instead of the whole corpus.
+
+    With ``num_workers`` of 1 or less everything is scored in-process.
+    """
+
+    def __init__(
+        self,
+        corpus_tokens: Sequence[List[str]] = (),
+        num_workers: Optional[int] = None,
+        start_method: str = DEFAULT_MULTIPROCESSING_START_METHOD,
+    ):
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        self._size = 0
+        self._local: Optional[List[List[str]]] = None
+        self._conns = []
+        self._procs = []
+        if num_workers <= 1:
+            self._local = list(corpus_tokens)
+            self._size = len(self._local)
+            return
+
+        shards: List[List[List[str]]] = [[] for _ in range(num_workers)]
+        for idx, tokens in enumerate(corpus_tokens):
+            shards[idx % num_workers].append(tokens)
+            self._size += 1
+
+        mpctx = multiprocessing.get_context(start_method)
+        for shard in shards:
+            parent_conn, child_conn = mpctx.Pipe()
+            proc = mpctx.Process(target=_worker, args=(child_conn, shard), daemon=True)
+            proc.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._procs.append(proc)
+
+    def __len__(self):
+        return self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, tokens: List[str]):
+        """Add a token list to the corpus."""
+        if self._local is not None:
+            self._local.append(tokens)
+        else:
+            self._conns[self._size % len(self._conns)].send((_CMD_ADD, tokens))
+        self._size += 1
+
+    def max_score(self, tokens: List[str], stop_above=None) -> float:
+        """Returns the highest ROUGE-L f-measure of ``tokens`` against the corpus."""
+        if self._local is not None:
+            return _max_fmeasure(tokens, self._local, stop_above)
+        for conn in self._conns:
+            conn.send((_CMD_SCORE, (tokens, stop_above)))
+        return max(conn.recv() for conn in self._conns)
+
+    def is_duplicate(self, tokens: List[str], threshold: float) -> bool:
+        """Returns True if any corpus entry scores above the threshold."""
+        return self.max_score(tokens, stop_above=threshold) > threshold
+
+    def close(self):
+        """Stop the worker processes."""
+        for conn in self._conns:
+            try:
+                conn.send((_CMD_CLOSE, None))
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        self._conns = []
+        self._procs = []
+
+
+class IndexedRougeSimilarity:
+    """ROUGE-L similarity engine backed by a token inverted index.
+
+    The LCS of two token lists can never be longer than their (multiset)
+    token overlap, so ``2 * overlap / (len(a) + len(b))`` is an upper bound of
+    the ROUGE-L f-measure. The index uses that bound to prefilter the corpus
+    to the few entries that could score above the threshold, and only those
+    are scored with the exact LCS. Pairs that are scored use exactly the same
+    comparison as the brute-force path, pairs that are skipped provably
+    cannot exceed the threshold.
+    """
+
+    def __init__(self, corpus_tokens: Sequence[List[str]] = ()):
+        self._tokens: List[List[str]] = []
+        self._counts: List[Counter] = []
+        self._postings: Dict[str, List[int]] = {}
+        for tokens in corpus_tokens:
+            self.add(tokens)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, tokens: List[str]):
+        """Add a token list to the corpus."""
+        doc_id = len(self._tokens)
+        counts = Counter(tokens)
+        self._tokens.append(tokens)
+        self._counts.append(counts)
+        for token in counts:
+            self._postings.setdefault(token, []).append(doc_id)
+
+    def max_score(self, tokens: List[str], stop_above=None) -> float:
+        """Returns the highest ROUGE-L f-measure of ``tokens`` against the corpus."""
+        return _max_fmeasure(tokens, self._tokens, stop_above)
+
+    def is_duplicate(self, tokens: List[str], threshold: float) -> bool:
+        """Returns True if any corpus entry scores above the threshold."""
+        if not self._tokens:
+            return False
+        if threshold < 0:
+            # every pair scores at least 0
+            return True
+        if not tokens:
+            return False
+
+        candidate_counts = Counter(tokens)
+        num_tokens = len(tokens)
+        # a corpus entry of any length needs at least this many shared tokens
+        # to reach the threshold (the bound is tightest for the shortest entry
+        # that passes the length filter)
+        min_overlap = 1
+        if threshold < 2:
+            min_overlap = max(
+                1, math.ceil(threshold * num_tokens / (2 - threshold) - _EPSILON)
+            )
+        # so it must contain one of the (num_tokens - min_overlap + 1) rarest
+        # tokens of the candidate, only those postings need to be probed
+        prefix_size = num_tokens - min_overlap + 1
+        if prefix_size <= 0:
+            return False
+        probe = set()
+        remaining = prefix_size
+        for token in sorted(
+            candidate_counts, key=lambda t: len(self._postings.get(t, ()))
+        ):
+            probe.add(token)
+            remaining -= candidate_counts[token]
+            if remaining <= 0:
+                break
+
+        candidates = set()
+        for token in probe:
+            candidates.update(self._postings.get(token, ()))
+
+        bounded = []
+        for doc_id in candidates:
+            doc_counts = self._counts[doc_id]
+            overlap = sum(
+                min(count, doc_counts[token])
+                for token, count in candidate_counts.items()
+                if token in doc_counts
+            )
+            bound = 2 * overlap / (num_tokens + len(self._tokens[doc_id]))
+            if bound + _EPSILON > threshold:
+                bounded.append((bound, doc_id))
+
+        # most promising first so that duplicates are found quickly
+        bounded.sort(reverse=True)
+        for _, doc_id in bounded:
+            score = rouge_scorer._score_lcs(tokens, self._tokens[doc_id]).fmeasure
+            if score > threshold:
+                return True
+        return False
+
+    def close(self):
+        """Nothing to release, present for interface compatibility."""
+
+
+SIMILARITY_BACKENDS = ["index", "brute"]
+"""Available near-duplicate filter backends"""
+
+
+def get_similarity_backend(
+    backend: str,
+    corpus_tokens: Sequence[List[str]] = (),
+    num_workers: Optional[int] = None,
+):
+    """Create the near-duplicate filter backend with the given name."""
+    if backend == "index":
+        return IndexedRougeSimilarity(corpus_tokens)
+    if backend == "brute":
+        return RougeSimilarity(corpus_tokens, num_workers=num_workers)
+    raise ValueError(
+        f"Unknown similarity backend '{backend}', choose one of {SIMILARITY_BACKENDS}"
+    )
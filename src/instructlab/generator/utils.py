@@ -1,21 +1,22 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # Standard
-from typing import Optional, Sequence, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Sequence, Union
 import copy
 import dataclasses
 import io
 import json
 import logging
-import math
 import os
 import sys
+import time
 
 # Third Party
-from openai import OpenAI, OpenAIError
-import httpx
+from openai import OpenAIError
 
 # Local
+from ..client import ClientSession
 from ..config import DEFAULT_API_KEY, DEFAULT_MODEL_OLD
 from ..utils import get_sysprompt
 
@@ -54,6 +55,9 @@ def openai_completion(
     max_batches=sys.maxsize,
     return_text=False,
     api_key=DEFAULT_API_KEY,
+    max_in_flight=1,
+    session: Optional[ClientSession] = None,
+    response_hook: Optional[Callable] = None,
     **decoding_kwargs,
 ) -> Union[
     Union[StrOrOpenAIObject],
@@ -80,6 +84,12 @@ def openai_completion(
         max_batches: Maximum number of batches to decode. This will be deprecated in the future.
         return_text: If True, return text instead of full completion object (e.g. includes logprob).
         api_key: API key API key for API endpoint where model is hosted
+        max_in_flight: Maximum number of prompts sent to the server concurrently.
+            Completions are always returned in prompt order.
+        session: Client session to send the requests with. A temporary one is
+            created if not given.
+        response_hook: Called with the latency and the token usage of every
+            chat completion response.
         decoding_kwargs: Extra decoding arguments. Pass in `best_of` and `logit_bias` if needed.
 
     Returns:
@@ -101,61 +111,76 @@ def openai_completion(
         max_instances = max_batches * batch_size
 
     prompts = prompts[:max_instances]
-    num_prompts = len(prompts)
-    prompt_batches = [
-        prompts[batch_id * batch_size : (batch_id + 1) * batch_size]
-        for batch_id in range(int(math.ceil(num_prompts / batch_size)))
-    ]
-
-    completions = []
-    for batch_id, prompt_batch in enumerate(prompt_batches):
-        batch_decoding_args = copy.deepcopy(decoding_args)  # cloning the decoding_args
-
-        shared_kwargs = {
-            "model": model_name,
-            **batch_decoding_args.__dict__,
-            **decoding_kwargs,
-        }
-
-        if not api_key:
-            # we need to explicitly set non-empty api-key, to ensure generate
-            # connects to our local server
-            api_key = "no_api_key"
 
+    own_session = session is None
+    if own_session:
         # do not pass a lower timeout to this client since generating a dataset takes some time
-        # pylint: disable=R0801
-        orig_cert = (tls_client_cert, tls_client_key, tls_client_passwd)
-        cert = tuple(item for item in orig_cert if item)
-        verify = not tls_insecure
-        client = OpenAI(
-            base_url=api_base,
-            api_key=api_key,
-            http_client=httpx.Client(cert=cert, verify=verify),
+        tls = (tls_insecure, tls_client_cert, tls_client_key, tls_client_passwd)
+        session = ClientSession.from_options(
+            api_base, api_key, tls, max_connections=max_in_flight
         )
-
-        # ensure the model specified exists on the server. with backends like vllm, this is crucial.
-        model_list = client.models.list().data
-        model_ids = []
-        for model in model_list:
-            model_ids.append(model.id)
-        if not any(model_name == m for m in model_ids):
-            if model_name == DEFAULT_MODEL_OLD:
-                logging.info(
-                    "Model %s is not a full path. Try running ilab init or edit your config to have the full model path for serving, chatting, and generation.",
-                    model_name,
-                )
-            raise GenerateException(
-                f"Model {model_name} is not served by the server. These are the served models {model_ids}"
+    try:
+        return _openai_completion(
+            session,
+            prompts,
+            is_single_prompt,
+            decoding_args,
+            model_name,
+            return_text,
+            max_in_flight,
+            response_hook,
+            **decoding_kwargs,
+        )
+    finally:
+        if own_session:
+            session.close()
+
+
+def _openai_completion(
+    session,
+    prompts,
+    is_single_prompt,
+    decoding_args,
+    model_name,
+    return_text,
+    max_in_flight,
+    response_hook=None,
+    **decoding_kwargs,
+):
+    # ensure the model specified exists on the server. with backends like vllm, this is crucial.
+    # the served models are only fetched once per session.
+    try:
+        model_ids = session.served_model_ids()
+    except OpenAIError as exc:
+        raise GenerateException(
+            f"There was a problem connecting to the server {exc}"
+        ) from exc
+    if not any(model_name == m for m in model_ids):
+        if model_name == DEFAULT_MODEL_OLD:
+            logging.info(
+                "Model %s is not a full path. Try running ilab init or edit your config to have the full model path for serving, chatting, and generation.",
+                model_name,
             )
+        raise GenerateException(
+            f"Model {model_name} is not served by the server. These are the served models {model_ids}"
+        )
+
+    shared_kwargs = {
+        "model": model_name,
+        **copy.deepcopy(decoding_args).__dict__,
+        **decoding_kwargs,
+    }
 
+    def complete(prompt):
         messages = [
             {"role": "system", "content": get_sysprompt()},
-            {"role": "user", "content": prompt_batch[batch_id]},
+            {"role": "user", "content": prompt},
         ]
 
         # Inference the model
+        start = time.perf_counter()
         try:
-            response = client.chat.completions.create(
+            response = session.chat_completion(
                 messages=messages,
                 **shared_kwargs,
             )
@@ -163,8 +188,23 @@ def openai_completion(
             raise GenerateException(
                 f"There was a problem connecting to the server {exc}"
             ) from exc
+        if response_hook is not None:
+            response_hook(time.perf_counter() - start, getattr(response, "usage", None))
+        return response.choices
 
-        completions.extend(response.choices)
+    # every prompt is a separate chat completion request, keep up to
+    # max_in_flight of them running against the server at the same time
+    completions = []
+    if max_in_flight <= 1 or len(prompts) <= 1:
+        for prompt in prompts:
+            completions.extend(complete(prompt))
+    else:
+        with ThreadPoolExecutor(
+            max_workers=min(max_in_flight, len(prompts))
+        ) as executor:
+            # map() yields in prompt order regardless of completion order
+            for choices in executor.map(complete, prompts):
+                completions.extend(choices)
 
     if return_text:
         completions = [completion.text for completion in completions]
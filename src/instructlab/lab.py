@@ -227,6 +227,52 @@ def init(
     )
 
 
+def _watch_taxonomy(
+    logger, taxonomy_path, taxonomy_base, yaml_rules, quiet, taxonomy_cache
+):
+    """Check the taxonomy whenever it changes, for `ilab diff --watch`."""
+    # pylint: disable=C0415
+    # Local
+    from .watch import TaxonomyWatcher, watch_taxonomy
+
+    if not os.path.isdir(taxonomy_path):
+        raise click.UsageError("--watch needs a taxonomy directory")
+
+    def report(watcher, updated):
+        if quiet:
+            return
+        for f in updated:
+            click.echo(f)
+        if watcher.errors:
+            click.secho(
+                f"{len(watcher.files_with_errors)} taxonomy files with errors:",
+                fg="red",
+            )
+            for f in watcher.files_with_errors:
+                click.secho(f"* {f}", fg="red")
+        else:
+            click.secho(
+                f"Taxonomy in /{taxonomy_path}/ is valid :)",
+                fg="green",
+            )
+        click.echo("Watching for changes...")
+
+    watcher = TaxonomyWatcher(
+        logger, taxonomy_path, taxonomy_base, yaml_rules, taxonomy_cache
+    )
+    try:
+        watch_taxonomy(watcher, report)
+    except (SystemExit, GitError) as exc:
+        if not quiet:
+            click.secho(
+                f"Reading taxonomy failed with the following error: {exc}",
+                fg="red",
+            )
+        raise SystemExit(1) from exc
+    except KeyboardInterrupt:
+        raise SystemExit(1 if watcher.errors else 0) from None
+
+
 @cli.command()
 @click.option(
     "--taxonomy-path",
@@ -248,14 +294,25 @@ def init(
     is_flag=True,
     help="Suppress all output. Call returns 0 if check passes, 1 otherwise.",
 )
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Check all taxonomy files and fetch knowledge documents again instead of reusing the on-disk caches.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running and check the changed taxonomy files again whenever they are saved.",
+)
 @click.pass_context
-def diff(ctx, taxonomy_path, taxonomy_base, yaml_rules, quiet):
+def diff(ctx, taxonomy_path, taxonomy_base, yaml_rules, quiet, no_cache, watch):
     """
     Lists taxonomy files that have changed since <taxonomy-base>
     and checks that taxonomy is valid. Similar to 'git diff <ref>'.
     """
     # pylint: disable=C0415
     # Local
+    from .cache import DocumentCache, TaxonomyCache
     from .utils import get_taxonomy_diff, read_taxonomy
 
     if not taxonomy_base:
@@ -266,6 +323,13 @@ def diff(ctx, taxonomy_path, taxonomy_base, yaml_rules, quiet):
         logger = logging.getLogger(__name__)
     else:
         logger = ctx.obj.logger
+    taxonomy_cache = None if no_cache else TaxonomyCache(config.DEFAULT_CACHE_DIR)
+
+    if watch:
+        _watch_taxonomy(
+            logger, taxonomy_path, taxonomy_base, yaml_rules, quiet, taxonomy_cache
+        )
+        return
 
     if not quiet:
         is_file = os.path.isfile(taxonomy_path)
@@ -283,7 +347,16 @@ def diff(ctx, taxonomy_path, taxonomy_base, yaml_rules, quiet):
             for f in updated_taxonomy_files:
                 click.echo(f)
     try:
-        read_taxonomy(logger, taxonomy_path, taxonomy_base, yaml_rules)
+        read_taxonomy(
+            logger,
+            taxonomy_path,
+            taxonomy_base,
+            yaml_rules,
+            document_cache=DocumentCache(
+                None if no_cache else config.DEFAULT_CACHE_DIR
+            ),
+            taxonomy_cache=taxonomy_cache,
+        )
     except (SystemExit, yaml.YAMLError) as exc:
         if not quiet:
             click.secho(
@@ -327,8 +400,53 @@ utils.make_lab_diff_aliases(cli, diff)
     type=str,
     help="Force model family to specify which chat template to serve with",
 )
+@click.option(
+    "--parallel-slots",
+    type=click.IntRange(min=1),
+    help="Number of requests decoded in parallel. Every slot has its own context of max-ctx-size tokens over the same memory-mapped model weights, layers offloaded to the GPU are copied per slot. Defaults to 1.",
+)
+@click.option(
+    "--max-queue",
+    type=click.IntRange(min=0),
+    help="Number of requests that may wait for a free slot, in priority then arrival order. Further requests are answered with a 503 and a Retry-After header. Defaults to 64.",
+)
+@click.option(
+    "--keep-alive",
+    type=click.IntRange(min=0),
+    help="Seconds an idle client connection is kept open. Defaults to 5.",
+)
+@click.option(
+    "--extra-model",
+    "extra_models",
+    type=click.Path(),
+    multiple=True,
+    help="Path to another model to serve, to the requests naming it by its path or file name in their model field. May be given several times.",
+)
+@click.option(
+    "--memory-budget",
+    type=click.FloatRange(min=0),
+    help="GiB of memory the loaded models may use, the least recently used ones are unloaded beyond it. Models are memory-mapped, so loading them again is cheap. Defaults to 0, no limit.",
+)
+@click.option(
+    "--stats-interval",
+    type=click.IntRange(min=0),
+    help="Seconds between two log lines of the request counts, queue depth, time to first token, token rates and memory of the server, also served at /metrics and /stats. Defaults to 0, not logged.",
+)
 @click.pass_context
-def serve(ctx, model_path, gpu_layers, num_threads, max_ctx_size, model_family):
+def serve(
+    ctx,
+    model_path,
+    gpu_layers,
+    num_threads,
+    max_ctx_size,
+    model_family,
+    parallel_slots,
+    max_queue,
+    keep_alive,
+    extra_models,
+    memory_budget,
+    stats_interval,
+):
     """Start a local server"""
     # pylint: disable=C0415
     # Local
@@ -338,8 +456,13 @@ def serve(ctx, model_path, gpu_layers, num_threads, max_ctx_size, model_family):
     log.stdout_stderr_to_logger(ctx.obj.logger)
 
     ctx.obj.logger.info(
-        f"Using model '{model_path}' with {gpu_layers} gpu-layers and {max_ctx_size} max context size."
+        f"Using model '{model_path}' with {gpu_layers} gpu-layers, {max_ctx_size} max context size and {parallel_slots} parallel slots."
     )
+    if extra_models:
+        budget = f"{memory_budget:g} GiB" if memory_budget else "no limit"
+        ctx.obj.logger.info(
+            f"Also serving {', '.join(extra_models)}, loaded models use at most {budget} of memory."
+        )
 
     try:
         host = ctx.obj.config.serve.host_port.split(":")[0]
@@ -353,6 +476,12 @@ def serve(ctx, model_path, gpu_layers, num_threads, max_ctx_size, model_family):
             num_threads,
             host,
             port,
+            parallel_slots=parallel_slots,
+            max_queue=max_queue,
+            keep_alive=keep_alive,
+            extra_models=extra_models,
+            memory_budget=memory_budget,
+            stats_interval=stats_interval,
         )
     except ServerException as exc:
         click.secho(f"Error creating server: {exc}", fg="red")
@@ -477,6 +606,83 @@ def serve(ctx, model_path, gpu_layers, num_threads, max_ctx_size, model_family):
     "--model-family",
     help="Force model family to use when picking a generation template",
 )
+@click.option(
+    "--dedup-backend",
+    type=click.Choice(["index", "brute"]),
+    default="index",
+    show_default=True,
+    help="Near-duplicate filter used for the Rouge threshold. 'index' prefilters candidates with a token index and scores the same pairs above the threshold as 'brute'.",
+)
+@click.option(
+    "--max-in-flight",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Maximum number of concurrent requests to the teacher model. The built-in server serves as many requests at once as its parallel slots.",
+)
+@click.option(
+    "--ordered/--unordered",
+    default=True,
+    show_default=True,
+    help="Process concurrent request results in request order for deterministic output, or as soon as they complete.",
+)
+@click.option(
+    "--checkpoint-interval",
+    type=click.FloatRange(min=0),
+    default=30.0,
+    show_default=True,
+    help="Seconds between checkpoints of the output files. At a checkpoint the outputs are synced to disk and stay readable if the run is interrupted.",
+)
+@click.option(
+    "--resume",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    help="Continue the latest generate run in this output directory from its last checkpoint, instead of starting a new run from the taxonomy.",
+)
+@click.option(
+    "--taxonomy-schedule",
+    type=click.Choice(["round-robin", "weighted"]),
+    default="round-robin",
+    show_default=True,
+    help="How requests are spread over the taxonomy paths. 'weighted' sends more requests to paths with more seed examples.",
+)
+@click.option(
+    "--tokenizer",
+    default=None,
+    help="Count tokens to fit seed examples, document chunks and prompts into the server context: 'server' uses the teacher server's tokenizer, 'heuristic' estimates from characters, anything else is loaded as a Hugging Face tokenizer (name or tokenizer.json path). By default token counts are only estimated for the seed examples.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=config.DEFAULT_CACHE_DIR,
+    show_default=True,
+    help="Directory caching the clones of knowledge document repositories, their documents and document chunks, and the checks of taxonomy files across runs.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Check taxonomy files, fetch and chunk knowledge documents without the on-disk caches.",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(["jsonl", "parquet"]),
+    default="jsonl",
+    show_default=True,
+    help="Format of the train and test files. 'parquet' writes compressed columnar files that `ilab train` loads without parsing JSON.",
+)
+@click.option(
+    "--metrics-interval",
+    type=click.FloatRange(min=0),
+    default=10.0,
+    show_default=True,
+    help="Seconds between exports of the per-request metrics (queue wait, teacher latency, tokens, filtering and write times) to metrics_<run>.jsonl in the output directory.",
+)
+@click.option(
+    "--prometheus-file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Also export the generate metrics to this file in the Prometheus text format, e.g. for the node exporter's textfile collector.",
+)
 @click.pass_context
 def generate(
     ctx,
@@ -498,7 +704,19 @@ def generate(
     tls_client_cert,
     tls_client_key,
     tls_client_passwd,
-    model_family
+    model_family,
+    dedup_backend,
+    max_in_flight,
+    ordered,
+    checkpoint_interval,
+    resume,
+    taxonomy_schedule,
+    tokenizer,
+    cache_dir,
+    no_cache,
+    output_format,
+    metrics_interval,
+    prometheus_file,
 ):
     """Generates synthetic data to enhance your example data"""
     # pylint: disable=C0415
@@ -570,11 +788,24 @@ def generate(
             tls_client_cert=tls_client_cert,
             tls_client_key=tls_client_key,
             tls_client_passwd=tls_client_passwd,
+            dedup_backend=dedup_backend,
+            max_in_flight=max_in_flight,
+            ordered_output=ordered,
+            checkpoint_interval=checkpoint_interval,
+            resume_dir=resume,
+            taxonomy_schedule=taxonomy_schedule,
+            tokenizer=tokenizer,
+            cache_dir=None if no_cache else cache_dir,
+            output_format=output_format,
+            metrics_interval=metrics_interval,
+            prometheus_file=prometheus_file,
         )
 
         # if all went well, let us generate lineage data...
 
         # get all generated files in output dir...
+        if resume:
+            output_dir = resume
         generated_files = lineage.get_files_with_sha2(output_dir)
 
         # assume we finished... let's add lineage for it...
@@ -709,7 +940,7 @@ def chat(
     # pylint: disable=C0415
     # Local
     from .chat.chat import ChatException, chat_cli
-    from .client import ClientException, list_models
+    from .client import ClientException, ClientSession, list_models
     from .server import ensure_server, is_temp_server_running
 
     if endpoint_url:
@@ -733,6 +964,12 @@ def chat(
         if not api_base:
             api_base = ctx.obj.config.serve.api_base()
 
+    # one session, and so one connection pool, for listing the models and the chat
+    tls = (tls_insecure, tls_client_cert, tls_client_key, tls_client_passwd)
+    client_session = ClientSession.from_options(
+        api_base, api_key, tls, timeout=config.DEFAULT_CONNECTION_TIMEOUT
+    )
+
     # if only the chat is running (`ilab chat`) and the temp server is not, the chat interacts
     # in server mode (`ilab serve` is running somewhere, or we are talking to another
     # OpenAI compatible endpoint).
@@ -759,6 +996,7 @@ def chat(
                     tls_client_cert=tls_client_cert,
                     tls_client_key=tls_client_key,
                     tls_client_passwd=tls_client_passwd,
+                    session=client_session,
                 )
 
                 # Currently, we only present a single model so we can safely assume that the first model
@@ -797,11 +1035,13 @@ def chat(
             tls_client_cert=tls_client_cert,
             tls_client_key=tls_client_key,
             tls_client_passwd=tls_client_passwd,
+            client_session=client_session,
         )
     except ChatException as exc:
         click.secho(f"Executing chat failed with: {exc}", fg="red")
         raise click.exceptions.Exit(1)
     finally:
+        client_session.close()
         if server_process and server_queue:
             server_process.terminate()
             server_process.join(timeout=30)
@@ -1078,8 +1318,21 @@ def train(
                     fg="yellow",
                 )
             # First file is latest (by above reverse sort and timestamped names)
-            shutil.copy(train_files[0], data_dir + "/train_gen.jsonl")
-            shutil.copy(test_files[0], data_dir + "/test_gen.jsonl")
+            for data_file, name in (
+                (train_files[0], "train_gen"),
+                (test_files[0], "test_gen"),
+            ):
+                if data_file.endswith(".parquet") and utils.is_macos_with_m_chip():
+                    # Local
+                    from .generator.output import read_train_file, write_train_file
+
+                    # the MLX data preparation reads jsonl
+                    write_train_file(
+                        f"{data_dir}/{name}.jsonl", read_train_file(data_file)
+                    )
+                else:
+                    _, ext = os.path.splitext(data_file)
+                    shutil.copy(data_file, f"{data_dir}/{name}{ext}")
         except FileNotFoundError as exc:
             click.secho(
                 f"Could not read directory: {exc}",
@@ -0,0 +1,16 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from typing import List
+import math
+
+# quantiles reported by the metrics of generate and of the server
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of values, 0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q * len(ordered))) - 1]
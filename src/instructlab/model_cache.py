@@ -0,0 +1,274 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+# Third Party
+from llama_cpp.server.model import LlamaProxy
+from llama_cpp.server.settings import ModelSettings
+import llama_cpp
+
+logger = logging.getLogger(__name__)
+
+GIB = 1024**3
+
+
+class Timings(NamedTuple):
+    """Tokens a loaded model evaluated and the seconds it took."""
+
+    prompt_tokens: int
+    prompt_seconds: float
+    completion_tokens: int
+    completion_seconds: float
+
+
+class SlotUsage(NamedTuple):
+    """What the model of a slot did for a request."""
+
+    model: str
+    # monotonic time the request got its model
+    ready: float
+    prompt_tokens: int
+    prompt_seconds: float
+    completion_tokens: int
+    completion_seconds: float
+    # tokens in the context at the end of the request
+    context_used: int
+    context_size: int
+
+
+def measure(llama) -> Tuple[int, int]:
+    """Bytes of the weights and of the context of a loaded model."""
+    # pylint: disable=protected-access
+    return llama._model.size(), llama_cpp.llama_get_state_size(llama._ctx.ctx)
+
+
+def timings(llama) -> Timings:
+    t = llama_cpp.llama_get_timings(llama.ctx)
+    return Timings(t.n_p_eval, t.t_p_eval_ms / 1000, t.n_eval, t.t_eval_ms / 1000)
+
+
+class ModelCache:  # pylint: disable=too-many-instance-attributes
+    """The models of a server, loaded when first requested.
+
+    Every slot of the server runs its own instance of a model, with its own
+    context over the weights shared by all the instances of the model, as
+    they are memory-mapped. Once the loaded instances exceed memory_budget
+    bytes, the least recently used ones are unloaded, 0 keeps them all. The
+    weights of an unloaded model stay in the page cache as long as the
+    memory is not needed, so loading it again is cheap. An instance unloaded
+    while a request runs on it is freed when the request completes.
+
+    Requests name a model by its path, its file name or its file name
+    without extension; unknown names get the first model, like the
+    LlamaProxy of llama-cpp-python.
+    """
+
+    def __init__(
+        self,
+        models: List[ModelSettings],
+        chat_handlers: Optional[Dict[str, Callable]] = None,
+        memory_budget: int = 0,
+        load: Callable = LlamaProxy.load_llama_from_model_settings,
+        measure: Callable = measure,  # pylint: disable=redefined-outer-name
+        timings: Callable = timings,  # pylint: disable=redefined-outer-name
+    ):
+        if not models:
+            raise ValueError("a model cache needs at least one model")
+        self.settings: Dict[str, ModelSettings] = {}
+        for model in models:
+            self.settings.setdefault(model.model_alias or model.model, model)
+        self.chat_handlers = chat_handlers or {}
+        self.memory_budget = memory_budget
+        self._load = load
+        self._measure = measure
+        self.timings = timings
+        self._loaded: "OrderedDict[Tuple[str, int], object]" = OrderedDict()
+        self._weights: Dict[str, int] = {}
+        self._contexts: Dict[Tuple[str, int], int] = {}
+        self._last_context: Dict[str, int] = {}
+        # seconds the last load of each model took
+        self.load_times: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def default_model(self) -> str:
+        return next(iter(self.settings))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.settings)
+
+    def resolve(self, model: Optional[str]) -> str:
+        """The alias of the model named by a request."""
+        if model in self.settings:
+            return model
+        if model:
+            for alias in self.settings:
+                name = os.path.basename(alias)
+                if model in (name, os.path.splitext(name)[0]):
+                    return alias
+        return self.default_model
+
+    def loaded(self) -> List[Tuple[str, int]]:
+        """The loaded instances, least recently used first."""
+        with self._lock:
+            return list(self._loaded)
+
+    def memory(self) -> int:
+        """Bytes used by the loaded instances."""
+        with self._lock:
+            return sum(self._weights.values()) + sum(self._contexts.values())
+
+    def model_memory(self) -> Dict[str, int]:
+        """Bytes used by the loaded instances of each model."""
+        with self._lock:
+            memory = dict(self._weights)
+            for (alias, _), context in self._contexts.items():
+                memory[alias] += context
+            return memory
+
+    def peek(self, model: Optional[str]):
+        """The most recently used loaded instance of the model, if any.
+
+        Does not change the order the instances are unloaded in.
+        """
+        alias = self.resolve(model)
+        with self._lock:
+            for (loaded, _), llama in reversed(self._loaded.items()):
+                if loaded == alias:
+                    return llama
+        return None
+
+    def get(self, model: Optional[str], slot: int = 0):
+        """The instance of the model for a slot, loading it if needed."""
+        alias = self.resolve(model)
+        key = (alias, slot)
+        with self._lock:
+            llama = self._loaded.get(key)
+            if llama is not None:
+                self._loaded.move_to_end(key)
+                return llama
+            self._trim(self._estimate(alias))
+            start = time.perf_counter()
+            llama = self._load(self.settings[alias])
+            self.load_times[alias] = time.perf_counter() - start
+            logger.debug(
+                "Loaded %s for slot %d in %.2fs",
+                alias,
+                slot,
+                self.load_times[alias],
+            )
+            self.add(alias, slot, llama)
+            return llama
+
+    def add(self, alias: str, slot: int, llama):
+        """Add an instance loaded elsewhere, like the first one of the server."""
+        key = (alias, slot)
+        if alias in self.chat_handlers:
+            llama.chat_handler = self.chat_handlers[alias]
+        with self._lock:
+            weights, context = self._measure(llama)
+            self._loaded[key] = llama
+            self._weights[alias] = weights
+            self._contexts[key] = context
+            self._last_context[alias] = context
+            self._trim(0, keep=key)
+
+    def _estimate(self, alias: str) -> int:
+        """Bytes a new instance of the model is expected to add."""
+        weights = 0
+        if alias not in self._weights:
+            weights = os.path.getsize(self.settings[alias].model)
+        return weights + self._last_context.get(alias, 0)
+
+    def _trim(self, needed: int, keep: Optional[Tuple[str, int]] = None):
+        if not self.memory_budget:
+            return
+        while self.memory() + needed > self.memory_budget:
+            victim = next((key for key in self._loaded if key != keep), None)
+            if victim is None:
+                # a single instance over the budget is still served
+                return
+            self._unload(victim)
+
+    def _unload(self, key: Tuple[str, int]):
+        alias, slot = key
+        del self._loaded[key]
+        del self._contexts[key]
+        if not any(loaded == alias for loaded, _ in self._loaded):
+            del self._weights[alias]
+        logger.debug("Unloaded %s of slot %d", alias, slot)
+
+
+class ModelSlot:
+    """The models of one slot of the server.
+
+    Stands in for the LlamaProxy the routes of llama-cpp-python get the
+    model of a request from.
+    """
+
+    def __init__(self, cache: ModelCache, slot: int):
+        self.cache = cache
+        self.slot = slot
+        self._request = None
+
+    def __call__(self, model: Optional[str] = None):
+        llama = self.cache.get(model, self.slot)
+        if self._request is None:
+            self._request = (
+                self.cache.resolve(model),
+                llama,
+                self.cache.timings(llama),
+                time.monotonic(),
+            )
+        return llama
+
+    def take_usage(self) -> Optional[SlotUsage]:
+        """What the model did since the request on the slot got it, if it did."""
+        if self._request is None:
+            return None
+        alias, llama, before, ready = self._request
+        self._request = None
+        # llama.cpp resets the timings of a context it reuses, which would
+        # make the differences negative
+        after = self.cache.timings(llama)
+        return SlotUsage(
+            alias,
+            ready,
+            max(0, after.prompt_tokens - before.prompt_tokens),
+            max(0.0, after.prompt_seconds - before.prompt_seconds),
+            max(0, after.completion_tokens - before.completion_tokens),
+            max(0.0, after.completion_seconds - before.completion_seconds),
+            llama.n_tokens,
+            llama.n_ctx(),
+        )
+
+    def __getitem__(self, model: str):
+        return self.cache.settings[model].model_dump()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.cache)
+
+    def free(self):
+        pass
+
+
+class UnslottedModels(ModelSlot):
+    """The models of the requests that hold no slot, like tokenizing.
+
+    They only read the vocabulary of a model, so they share an instance
+    loaded for a slot, even while a request runs on it, without changing
+    the order of unloading. A model no slot loaded is loaded for the slot
+    of this object, past the ones of the server. No usage is recorded.
+    """
+
+    def __call__(self, model: Optional[str] = None):
+        llama = self.cache.peek(model)
+        if llama is None:
+            llama = self.cache.get(model, self.slot)
+        return llama
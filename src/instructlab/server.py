@@ -2,15 +2,16 @@
 
 # Standard
 from contextlib import redirect_stderr, redirect_stdout
-from time import sleep
 import logging
 import multiprocessing
 import os
-import random
+import queue as queue_module
 import signal
-import socket
+import time
 
 # Third Party
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
 from llama_cpp import llama_chat_format
 from llama_cpp.server.app import create_app
 from llama_cpp.server.settings import Settings
@@ -20,7 +21,16 @@ import uvicorn
 
 # Local
 from .client import ClientException, list_models
-from .config import get_api_base, get_model_family
+from .config import (
+    DEFAULT_KEEP_ALIVE,
+    DEFAULT_MAX_QUEUE,
+    DEFAULT_STATS_INTERVAL,
+    get_api_base,
+    get_model_family,
+)
+from .model_cache import GIB, ModelCache, ModelSlot, UnslottedModels
+from .server_metrics import ServerMetrics, format_stats
+from .slots import DEFAULT_QUEUE_TIMEOUT, SlotMiddleware, SlotPool
 
 templates = [
     {
@@ -34,12 +44,91 @@ templates = [
 ]
 
 
+def chat_handler(model_family, model_path):
+    """Chat handler formatting the messages with the template of the model family."""
+    template = ""
+    eos_token = "<|endoftext|>"
+    bos_token = ""
+    for template_dict in templates:
+        if template_dict["model"] == get_model_family(model_family, model_path):
+            template = template_dict["template"]
+            if template_dict["model"] == "mixtral":
+                eos_token = "</s>"
+                bos_token = "<s>"
+    return llama_chat_format.Jinja2ChatFormatter(
+        template=template,
+        eos_token=eos_token,
+        bos_token=bos_token,
+    ).to_chat_handler()
+
+
+DEFAULT_STARTUP_TIMEOUT = 600.0
+"""Seconds to wait for a temporary server to load its model and start"""
+
+# message of a server process that accepts requests, followed by its port
+SERVER_READY = "ready"
+
+# interval to check that a starting server process is still alive
+_STARTUP_POLL_INTERVAL = 0.1
+
+
 class ServerException(Exception):
     """An exception raised when serving the API."""
 
 
-class Server(uvicorn.Server):
-    """Override uvicorn.Server to handle SIGINT."""
+class Server(uvicorn.Server):  # pylint: disable=too-many-instance-attributes
+    """Override uvicorn.Server to handle SIGINT and report its startup.
+
+    With an idle_timeout the server exits once it served no request for that
+    many seconds, as long as in_use, checked once a second, returns False.
+    With a stats_interval, log_stats is called every that many seconds.
+    """
+
+    def __init__(
+        self,
+        config,
+        on_started=None,
+        idle_timeout=None,
+        in_use=None,
+        stats_interval=DEFAULT_STATS_INTERVAL,
+        log_stats=None,
+    ):
+        super().__init__(config)
+        self.on_started = on_started
+        self.idle_timeout = idle_timeout
+        self.in_use = in_use
+        self.stats_interval = stats_interval
+        self.log_stats = log_stats
+        self._last_active = time.monotonic()
+        self._last_stats = self._last_active
+        self._requests = 0
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.started and self.on_started is not None:
+            self.on_started()
+
+    async def on_tick(self, counter):
+        if await super().on_tick(counter):
+            return True
+        now = time.monotonic()
+        if (
+            self.stats_interval
+            and self.log_stats is not None
+            and now - self._last_stats >= self.stats_interval
+        ):
+            self._last_stats = now
+            self.log_stats()
+        if self.idle_timeout is None:
+            return False
+        state = self.server_state
+        # requests still being answered, like streamed ones, keep it active
+        if state.tasks or state.total_requests != self._requests:
+            self._requests = state.total_requests
+            self._last_active = now
+        elif counter % 10 == 0 and self.in_use is not None and self.in_use():
+            self._last_active = now
+        return now - self._last_active >= self.idle_timeout
 
     def handle_exit(self, sig, frame):
         # type: (int, Optional[FrameType]) -> None
@@ -55,9 +144,14 @@ def ensure_server(
     tls_client_key,
     tls_client_passwd,
     model_family,
+    startup_timeout=DEFAULT_STARTUP_TIMEOUT,
 ):
     """Checks if server is running, if not starts one as a subprocess. Returns the server process
-    and the URL where it's available."""
+    and the URL where it's available, once the server loaded its model and accepts requests.
+
+    With an idle_timeout in serve_config, the command attaches to the model
+    daemon of the model instead, starting it when needed, and no process is
+    returned."""
     try:
         api_base = serve_config.api_base()
         logger.debug(f"Trying to connect to {api_base}...")
@@ -72,71 +166,87 @@ def ensure_server(
         return (None, None, None)
         # pylint: enable=duplicate-code
     except ClientException:
-        tried_ports = set()
+        if serve_config.idle_timeout:
+            # the daemon locks its state with fcntl, only available on POSIX
+            # pylint: disable=import-outside-toplevel
+            # Local
+            from .daemon import attach_daemon
+
+            daemon_api_base = attach_daemon(
+                logger,
+                serve_config,
+                model_family,
+                tls_insecure=tls_insecure,
+                tls_client_cert=tls_client_cert,
+                tls_client_key=tls_client_key,
+                tls_client_passwd=tls_client_passwd,
+                startup_timeout=startup_timeout,
+            )
+            return (None, daemon_api_base, None)
         mpctx = multiprocessing.get_context(None)
         # use a queue to communicate between the main process and the server process
         queue = mpctx.Queue()
-        port = random.randint(1024, 65535)
         host = serve_config.host_port.rsplit(":", 1)[0]
-        logger.debug(f"Trying port {port}...")
-
-        # extract address provided in the config
-        while not can_bind_to_port(host, port):
-            logger.debug(f"Port {port} is not available.")
-            # add the port to the map so that we can avoid using the same one
-            tried_ports.add(port)
-            port = random.randint(1024, 65535)
-            while True:
-                # if all the ports have been tried, exit
-                if len(tried_ports) == 65535 - 1024:
-                    # pylint: disable=raise-missing-from
-                    raise SystemExit(
-                        "No available ports to start the temporary server."
-                    )
-                if port in tried_ports:
-                    logger.debug(f"Port {port} has already been tried.")
-                    port = random.randint(1024, 65535)
-                else:
-                    break
-        logger.debug(f"Port {port} is available.")
-
-        host_port = f"{host}:{port}"
-        temp_api_base = get_api_base(host_port)
-        logger.debug(
-            f"Connection to {api_base} failed. Starting a temporary server at {temp_api_base}..."
-        )
+        logger.debug(f"Connection to {api_base} failed. Starting a temporary server...")
         # create a temporary, throw-away logger
-        logger = logging.getLogger(host_port)
-        logger.setLevel(logging.FATAL)
+        server_logger = logging.getLogger(f"{host}:temp")
+        server_logger.setLevel(logging.FATAL)
         server_process = mpctx.Process(
             target=server,
             kwargs={
-                "logger": logger,
+                "logger": server_logger,
                 "model_path": serve_config.model_path,
                 "gpu_layers": serve_config.gpu_layers,
                 "max_ctx_size": serve_config.max_ctx_size,
                 "model_family": model_family,
-                "port": port,
+                # the OS picks a free port, the server reports it when ready
+                "port": 0,
                 "host": host,
                 "queue": queue,
+                "parallel_slots": serve_config.parallel_slots,
+                "max_queue": serve_config.max_queue,
+                "keep_alive": serve_config.keep_alive,
             },
         )
         server_process.start()
+        port = wait_for_server(server_process, queue, startup_timeout)
+        temp_api_base = get_api_base(f"{host}:{port}")
+        logger.debug(f"Temporary server started at {temp_api_base}")
 
-        # in case the server takes some time to fail we wait a bit
-        count = 0
-        while server_process.is_alive():
-            sleep(0.1)
-            if count > 10:
-                break
-            count += 1
+        return (server_process, temp_api_base, queue)
 
-        # if the queue is not empty it means the server failed to start
-        if not queue.empty():
-            # pylint: disable=raise-missing-from
-            raise queue.get()
 
-        return (server_process, temp_api_base, queue)
+def wait_for_server(process, queue, timeout=DEFAULT_STARTUP_TIMEOUT) -> int:
+    """Wait until a server process reports it is ready, return its port.
+
+    The process reports the exception it failed with, or its readiness once
+    its model is loaded and it accepts requests.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        # checked before reading, the last messages of a process that
+        # exited are still read
+        alive = process.is_alive()
+        try:
+            message = queue.get(timeout=_STARTUP_POLL_INTERVAL)
+        except queue_module.Empty:
+            if not alive:
+                raise ServerException(
+                    f"The server exited with code {process.exitcode} before it was ready"
+                ) from None
+            if time.monotonic() >= deadline:
+                process.terminate()
+                process.join()
+                raise ServerException(
+                    f"The server was not ready after {timeout:g}s"
+                ) from None
+            continue
+        if isinstance(message, BaseException):
+            process.join()
+            raise message
+        status, port = message
+        if status == SERVER_READY:
+            return port
 
 
 def server(
@@ -149,8 +259,36 @@ def server(
     host="localhost",
     port=8000,
     queue=None,
+    parallel_slots=1,
+    max_queue=DEFAULT_MAX_QUEUE,
+    keep_alive=DEFAULT_KEEP_ALIVE,
+    queue_timeout=DEFAULT_QUEUE_TIMEOUT,
+    idle_timeout=None,
+    in_use=None,
+    on_ready=None,
+    extra_models=(),
+    memory_budget=0.0,
+    stats_interval=DEFAULT_STATS_INTERVAL,
 ):
-    """Start OpenAI-compatible server"""
+    """Start OpenAI-compatible server
+
+    The model serves parallel_slots requests at a time, each slot with its
+    own context over the same memory-mapped weights. Further requests wait
+    for a slot in a queue of at most max_queue requests, after that they are
+    answered with a 503 and a Retry-After header.
+
+    Requests for the extra_models, by the model field, run them instead.
+    They are loaded when first requested, with the chat template of their
+    own family, and unloaded least recently used first once the loaded
+    models use more than memory_budget GiB, see ModelCache.
+
+    The metrics of the model requests are served at /metrics, in the
+    Prometheus text format, and /stats, as JSON, and logged every
+    stats_interval seconds.
+
+    on_ready is called with the port once the server accepts requests, and
+    the server exits when idle, see Server.
+    """
     settings = Settings(
         host=host,
         port=port,
@@ -177,23 +315,25 @@ def server(
             return
         raise ServerException(f"failed creating the server application: {exc}") from exc
 
-    template = ""
-    eos_token = "<|endoftext|>"
-    bos_token = ""
-    for template_dict in templates:
-        if template_dict["model"] == get_model_family(model_family, model_path):
-            template = template_dict["template"]
-            if template_dict["model"] == "mixtral":
-                eos_token = "</s>"
-                bos_token = "<s>"
+    models = [settings.model_copy(update={"model_alias": model_path})]
+    for path in extra_models:
+        models.append(settings.model_copy(update={"model": path, "model_alias": path}))
+    cache = ModelCache(
+        models,
+        chat_handlers={
+            model.model: chat_handler(model_family, model.model) for model in models
+        },
+        memory_budget=int(memory_budget * GIB),
+    )
+    slots = [ModelSlot(cache, slot) for slot in range(parallel_slots)]
     try:
-        llama_app._llama_proxy._current_model.chat_handler = (
-            llama_chat_format.Jinja2ChatFormatter(
-                template=template,
-                eos_token=eos_token,
-                bos_token=bos_token,
-            ).to_chat_handler()
-        )
+        # the app loaded the model for the first slot, the cache owns it now
+        proxy = llama_app._llama_proxy
+        cache.add(model_path, 0, proxy._current_model)
+        proxy._current_model = None
+        for slot in slots[1:]:
+            # through the cache, usage is only recorded for requests
+            cache.get(model_path, slot.slot)
     # pylint: disable=broad-exception-caught
     except Exception as exc:
         if queue:
@@ -203,20 +343,61 @@ def server(
             return
         raise ServerException(f"failed creating the server application: {exc}") from exc
 
-    logger.info("Starting server process, press CTRL+C to shutdown server...")
-    logger.info(
-        f"After application startup complete see http://{host}:{port}/docs for API."
-    )
+    pool = SlotPool(slots, max_queue=max_queue, queue_timeout=queue_timeout)
+    metrics = ServerMetrics(cache, pool)
+    app.add_middleware(SlotMiddleware, pool=pool, metrics=metrics)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def get_metrics():
+        return PlainTextResponse(
+            metrics.prometheus(), media_type="text/plain; version=0.0.4"
+        )
+
+    @app.get("/stats")
+    async def get_stats():
+        return metrics.stats()
+
+    unslotted = UnslottedModels(cache, parallel_slots)
+
+    def get_llama_proxy(request: Request):
+        # requests that don't run the model, like listing the models or
+        # tokenizing, don't take a slot or disturb the request running on one
+        return getattr(request.state, "slot", unslotted)
+
+    # replaces the lock serializing all the requests of the app
+    app.dependency_overrides[llama_app.get_llama_proxy] = get_llama_proxy
 
     config = Config(
         app,
         host=host,
         port=port,
         log_level=logging.ERROR,
-        limit_concurrency=2,  # Make sure we only serve a single client at a time
-        timeout_keep_alive=0,  # prevent clients holding connections open (we only have 1)
+        # requests beyond the slots wait in the slot pool's queue
+        timeout_keep_alive=keep_alive,
+    )
+    # bound here so the port the OS picks for port 0 is known
+    sock = config.bind_socket()
+    port = sock.getsockname()[1]
+
+    def on_started():
+        if queue:
+            queue.put((SERVER_READY, port))
+        if on_ready is not None:
+            on_ready(port)
+
+    s = Server(
+        config,
+        on_started,
+        idle_timeout=idle_timeout,
+        in_use=in_use,
+        stats_interval=stats_interval,
+        log_stats=lambda: logger.info(format_stats(metrics.stats())),
+    )
+
+    logger.info("Starting server process, press CTRL+C to shutdown server...")
+    logger.info(
+        f"After application startup complete see http://{host}:{port}/docs for API."
     )
-    s = Server(config)
 
     # If this is not the main process, this is the temp server process that ran in the background
     # after `ilab chat` was executed.
@@ -230,24 +411,15 @@ def server(
             redirect_stdout(f),
             redirect_stderr(f),
         ):
-            s.run()
+            s.run(sockets=[sock])
     else:
-        s.run()
+        s.run(sockets=[sock])
 
     if queue:
         queue.close()
         queue.join_thread()
 
 
-def can_bind_to_port(host, port):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        try:
-            s.bind((host, port))
-            return True
-        except socket.error:
-            return False
-
-
 def is_temp_server_running():
     """Check if the temp server is running."""
     return multiprocessing.current_process().name != "MainProcess"
@@ -0,0 +1,252 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from collections import Counter, deque
+from typing import Deque, Dict, Optional
+import threading
+import time
+
+# Local
+from .metrics_util import QUANTILES, percentile
+from .model_cache import GIB, ModelCache, SlotUsage
+from .slots import SlotPool
+
+# the quantiles are computed over the last requests
+_WINDOW = 1024
+
+_PROMETHEUS_PREFIX = "ilab_serve"
+
+# name, type, description and key in the stats of the metrics of each model
+_MODEL_METRICS = (
+    (
+        "model_requests_total",
+        "counter",
+        "Requests run by the model.",
+        "requests",
+    ),
+    (
+        "prompt_tokens_total",
+        "counter",
+        "Prompt tokens evaluated by the model.",
+        "prompt_tokens",
+    ),
+    (
+        "completion_tokens_total",
+        "counter",
+        "Completion tokens generated by the model.",
+        "completion_tokens",
+    ),
+    (
+        "prompt_tokens_per_second",
+        "gauge",
+        "Prompt tokens evaluated per second of prompt evaluation.",
+        "prompt_tokens_per_sec",
+    ),
+    (
+        "completion_tokens_per_second",
+        "gauge",
+        "Completion tokens generated per second of generation.",
+        "completion_tokens_per_sec",
+    ),
+    (
+        "model_load_seconds",
+        "gauge",
+        "Seconds the last load of the model took.",
+        "load_time",
+    ),
+    (
+        "model_loaded_slots",
+        "gauge",
+        "Slots with the model loaded.",
+        "loaded_slots",
+    ),
+    (
+        "model_memory_bytes",
+        "gauge",
+        "Memory used by the loaded instances of the model.",
+        "memory_bytes",
+    ),
+)
+
+
+class _ModelMetrics:  # pylint: disable=too-many-instance-attributes
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.prompt_seconds = 0.0
+        self.completion_tokens = 0
+        self.completion_seconds = 0.0
+        self.ttft: Deque[float] = deque(maxlen=_WINDOW)
+        self.context_utilization: Deque[float] = deque(maxlen=_WINDOW)
+
+    def record(self, arrival: float, usage: SlotUsage):
+        self.requests += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.prompt_seconds += usage.prompt_seconds
+        self.completion_tokens += usage.completion_tokens
+        self.completion_seconds += usage.completion_seconds
+        # the wait for a slot, the load of the model if it was not loaded and
+        # the evaluation of the prompt come before the first token
+        self.ttft.append(usage.ready - arrival + usage.prompt_seconds)
+        if usage.context_size:
+            self.context_utilization.append(usage.context_used / usage.context_size)
+
+
+def _quantiles(values) -> dict:
+    values = list(values)
+    return {f"p{int(q * 100)}": round(percentile(values, q), 4) for q in QUANTILES}
+
+
+def _rate(tokens: int, seconds: float) -> float:
+    return round(tokens / seconds, 2) if seconds > 0 else 0.0
+
+
+class ServerMetrics:
+    """Metrics of the model requests served by the server.
+
+    SlotMiddleware reports every model request once it completed, with what
+    the model of its slot did for it, or its rejection. The token rates are
+    the ones of the model evaluating the prompts and generating the
+    completions, the time to first token runs from the arrival of the
+    request to the end of the evaluation of its prompt.
+    """
+
+    def __init__(self, cache: ModelCache, pool: SlotPool):
+        self.cache = cache
+        self.pool = pool
+        self.started = time.monotonic()
+        self.requests: Counter = Counter()
+        self.models: Dict[str, _ModelMetrics] = {
+            alias: _ModelMetrics() for alias in cache
+        }
+        self._lock = threading.Lock()
+
+    def request_done(self, path: str, status: int, arrival: float, slot):
+        usage: Optional[SlotUsage] = slot.take_usage()
+        with self._lock:
+            self.requests[(path, status)] += 1
+            if usage is not None:
+                self.models[usage.model].record(arrival, usage)
+
+    def request_rejected(self, path: str):
+        with self._lock:
+            self.requests[(path, 503)] += 1
+
+    def stats(self) -> dict:
+        """The metrics as a JSON-serializable dict."""
+        memory = self.cache.model_memory()
+        loaded = Counter(alias for alias, _ in self.cache.loaded())
+        with self._lock:
+            statuses: Counter = Counter()
+            paths: Counter = Counter()
+            for (path, status), count in self.requests.items():
+                statuses[str(status)] += count
+                paths[path] += count
+            models = {}
+            for alias, model in self.models.items():
+                models[alias] = {
+                    "requests": model.requests,
+                    "prompt_tokens": model.prompt_tokens,
+                    "completion_tokens": model.completion_tokens,
+                    "prompt_tokens_per_sec": _rate(
+                        model.prompt_tokens, model.prompt_seconds
+                    ),
+                    "completion_tokens_per_sec": _rate(
+                        model.completion_tokens, model.completion_seconds
+                    ),
+                    "ttft": _quantiles(model.ttft),
+                    "context_utilization": _quantiles(model.context_utilization),
+                    "load_time": round(self.cache.load_times.get(alias, 0.0), 4),
+                    "loaded_slots": loaded[alias],
+                    "memory_bytes": memory.get(alias, 0),
+                }
+            ttft = [value for model in self.models.values() for value in model.ttft]
+            return {
+                "uptime": round(time.monotonic() - self.started, 3),
+                "requests": sum(statuses.values()),
+                "requests_by_status": dict(statuses),
+                "requests_by_path": dict(paths),
+                "slots": len(self.pool.slots),
+                "busy_slots": len(self.pool.slots) - self.pool.free,
+                "queue_depth": self.pool.waiting,
+                "ttft": _quantiles(ttft),
+                "memory_bytes": sum(memory.values()),
+                "memory_budget_bytes": self.cache.memory_budget,
+                "models": models,
+            }
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        prefix = _PROMETHEUS_PREFIX
+        stats = self.stats()
+        with self._lock:
+            requests = sorted(self.requests.items())
+        lines = [
+            f"# HELP {prefix}_requests_total Model requests by path and status, 503 for the ones rejected by the queue.",
+            f"# TYPE {prefix}_requests_total counter",
+        ]
+        for (path, status), count in requests:
+            lines.append(
+                f'{prefix}_requests_total{{path="{path}",status="{status}"}} {count}'
+            )
+        lines += [
+            f"# HELP {prefix}_slots Decode slots of the server.",
+            f"# TYPE {prefix}_slots gauge",
+            f"{prefix}_slots {stats['slots']}",
+            f"# HELP {prefix}_busy_slots Decode slots running a request.",
+            f"# TYPE {prefix}_busy_slots gauge",
+            f"{prefix}_busy_slots {stats['busy_slots']}",
+            f"# HELP {prefix}_queue_depth Requests waiting for a decode slot.",
+            f"# TYPE {prefix}_queue_depth gauge",
+            f"{prefix}_queue_depth {stats['queue_depth']}",
+        ]
+        for name, kind, description, key in _MODEL_METRICS:
+            lines += [
+                f"# HELP {prefix}_{name} {description}",
+                f"# TYPE {prefix}_{name} {kind}",
+            ]
+            for alias, model in stats["models"].items():
+                lines.append(f'{prefix}_{name}{{model="{alias}"}} {model[key]}')
+        for name, description, key in (
+            (
+                "ttft_seconds",
+                "Seconds from the arrival of a request to its first token, over the last requests.",
+                "ttft",
+            ),
+            (
+                "context_utilization",
+                "Fraction of the context used by a request, over the last requests.",
+                "context_utilization",
+            ),
+        ):
+            lines += [
+                f"# HELP {prefix}_{name} {description}",
+                f"# TYPE {prefix}_{name} summary",
+            ]
+            for alias, model in stats["models"].items():
+                for q in QUANTILES:
+                    lines.append(
+                        f'{prefix}_{name}{{model="{alias}",quantile="{q}"}} '
+                        f"{model[key][f'p{int(q * 100)}']}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def format_stats(stats: dict) -> str:
+    """One line of the main numbers of stats, for the log of the server."""
+    rejected = stats["requests_by_status"].get("503", 0)
+    line = (
+        f"{stats['requests']} requests ({rejected} rejected), "
+        f"{stats['busy_slots']}/{stats['slots']} slots busy, "
+        f"{stats['queue_depth']} queued, ttft p50 {stats['ttft']['p50']:.3f}s "
+        f"p95 {stats['ttft']['p95']:.3f}s, "
+        f"{stats['memory_bytes'] / GIB:.2f} GiB loaded"
+    )
+    for alias, model in stats["models"].items():
+        if model["requests"]:
+            line += (
+                f"; {alias}: {model['prompt_tokens_per_sec']:.1f} prompt tokens/s, "
+                f"{model['completion_tokens_per_sec']:.1f} completion tokens/s, "
+                f"context p95 {model['context_utilization']['p95']:.0%}"
+            )
+    return line
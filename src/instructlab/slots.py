@@ -0,0 +1,209 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from contextlib import asynccontextmanager
+from typing import Generic, List, Sequence, Tuple, TypeVar
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import time
+
+# Local
+from .config import DEFAULT_MAX_QUEUE
+
+DEFAULT_QUEUE_TIMEOUT = 600.0
+"""Seconds a request may wait for a decode slot"""
+
+PRIORITY_HEADER = "x-priority"
+"""Request header with the priority of a request, higher is served first"""
+
+# requests running the model, they hold a slot until their response is sent
+SLOT_PATHS = ("/v1/completions", "/v1/chat/completions", "/v1/embeddings")
+
+# expected time a request holds a slot before any request completed
+_INITIAL_SERVICE_TIME = 1.0
+# weight of the last request in the average time a request holds a slot
+_SERVICE_TIME_WEIGHT = 0.2
+
+T = TypeVar("T")
+
+
+class QueueFullException(Exception):
+    """An exception raised when a request cannot get a decode slot in time."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SlotPool(Generic[T]):  # pylint: disable=too-many-instance-attributes
+    """Decode slots shared by the requests of the server.
+
+    A request holds a slot while the model works on it. When all slots are
+    busy, requests wait in a bounded queue, by priority and then in arrival
+    order. A released slot is handed over to the first waiting request, so
+    requests arriving later never overtake it. Requests are turned away with
+    a QueueFullException when the queue is full or they waited longer than
+    queue_timeout, with the estimated seconds after which to retry.
+
+    All methods must be called from the event loop of the server.
+    """
+
+    def __init__(
+        self,
+        slots: Sequence[T],
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+    ):
+        if not slots:
+            raise ValueError("a slot pool needs at least one slot")
+        self.slots = list(slots)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._free = list(reversed(self.slots))
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._waiting = 0
+        self._order = itertools.count()
+        self._service_time = _INITIAL_SERVICE_TIME
+
+    @property
+    def free(self) -> int:
+        return len(self._free)
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def retry_after(self) -> int:
+        """Seconds until the queue is expected to have drained by one request."""
+        return max(
+            1, math.ceil(self._service_time * (self._waiting + 1) / len(self.slots))
+        )
+
+    async def acquire(self, priority: int = 0) -> T:
+        if self._free and not self._waiting:
+            return self._free.pop()
+        if self._waiting >= self.max_queue:
+            raise QueueFullException(
+                f"All {len(self.slots)} slots are busy and {self._waiting} requests are queued",
+                self.retry_after(),
+            )
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._order), future))
+        self._waiting += 1
+        try:
+            return await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError as exc:
+            raise QueueFullException(
+                f"No slot was free within {self.queue_timeout:g}s",
+                self.retry_after(),
+            ) from exc
+        except asyncio.CancelledError:
+            # the slot may have been handed over as the request was cancelled
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            raise
+        finally:
+            self._waiting -= 1
+
+    def release(self, slot: T):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            # waiters that timed out or were cancelled are skipped
+            if not future.done():
+                future.set_result(slot)
+                return
+        self._free.append(slot)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 0):
+        """Hold a slot for the duration of the context."""
+        slot = await self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield slot
+        finally:
+            self._service_time += _SERVICE_TIME_WEIGHT * (
+                time.monotonic() - start - self._service_time
+            )
+            self.release(slot)
+
+
+def _priority(scope) -> int:
+    for name, value in scope.get("headers", []):
+        if name.decode("latin-1").lower() == PRIORITY_HEADER:
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return 0
+
+
+class SlotMiddleware:
+    """ASGI middleware running the model requests of an app on a slot pool.
+
+    The slot is held until the response is sent, including streamed
+    responses, and is stored in the request state as ``slot``. Requests that
+    get no slot are answered with a 503 and a Retry-After header.
+
+    metrics, if given, gets request_done(path, status, arrival, slot) once a
+    request completed, while it still holds its slot, and
+    request_rejected(path) for the requests that got no slot.
+    """
+
+    def __init__(
+        self, app, pool: SlotPool, paths: Sequence[str] = SLOT_PATHS, metrics=None
+    ):
+        self.app = app
+        self.pool = pool
+        self.paths = tuple(paths)
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        arrival = time.monotonic()
+        try:
+            async with self.pool.slot(_priority(scope)) as slot:
+                scope.setdefault("state", {})["slot"] = slot
+                if self.metrics is None:
+                    await self.app(scope, receive, send)
+                    return
+                status = []
+
+                async def send_status(message):
+                    if message["type"] == "http.response.start":
+                        status.append(message["status"])
+                    await send(message)
+
+                try:
+                    await self.app(scope, receive, send_status)
+                finally:
+                    self.metrics.request_done(
+                        scope["path"], status[0] if status else 500, arrival, slot
+                    )
+        except QueueFullException as exc:
+            if self.metrics is not None:
+                self.metrics.request_rejected(scope["path"])
+            await _send_overloaded(send, str(exc), exc.retry_after)
+
+
+async def _send_overloaded(send, message: str, retry_after: int):
+    body = json.dumps(
+        {"error": {"message": message, "type": "server_overloaded", "code": 503}}
+    ).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(retry_after).encode("latin-1")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
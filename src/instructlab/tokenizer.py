@@ -0,0 +1,130 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from typing import Optional
+import abc
+import functools
+import hashlib
+import os
+
+# Local
+from .client import ClientException, ClientSession
+from .utils import num_tokens_from_chars
+
+DEFAULT_TOKENIZER_CACHE_SIZE = 65536
+"""Number of token counts each tokenizer keeps in its LRU cache"""
+
+TOKENIZER_HEURISTIC = "heuristic"
+TOKENIZER_SERVER = "server"
+
+
+class TokenizerException(Exception):
+    """An exception raised when counting tokens fails."""
+
+
+class Tokenizer(abc.ABC):
+    """Counts the tokens of texts for context budgeting.
+
+    Counts are kept in an LRU cache, since the same seed examples, document
+    chunks and prompt templates are counted over and over during a run.
+    The cache is thread-safe.
+    """
+
+    cache_key: Optional[str] = None
+    """Identifies the tokenization for on-disk caches of token based results,
+    None if the results must not outlive the process"""
+
+    def __init__(self, cache_size: int = DEFAULT_TOKENIZER_CACHE_SIZE):
+        self._cached_count = functools.lru_cache(maxsize=cache_size)(self._count)
+
+    @abc.abstractmethod
+    def _count(self, text: str) -> int:
+        """Returns the number of tokens of the text, without caching."""
+
+    def count(self, text: str) -> int:
+        """Returns the number of tokens of the text."""
+        return self._cached_count(text)
+
+
+class HeuristicTokenizer(Tokenizer):
+    """Estimates the tokens from the number of characters."""
+
+    cache_key = TOKENIZER_HEURISTIC
+
+    def _count(self, text: str) -> int:
+        return num_tokens_from_chars(len(text))
+
+
+class HuggingFaceTokenizer(Tokenizer):
+    """Counts tokens with a local Hugging Face tokenizer.
+
+    Accepts the path of a `tokenizer.json` file, a directory holding one, or
+    the name of a model on the Hugging Face Hub.
+    """
+
+    def __init__(
+        self, name_or_path: str, cache_size: int = DEFAULT_TOKENIZER_CACHE_SIZE
+    ):
+        super().__init__(cache_size)
+        # pylint: disable=import-outside-toplevel
+        # Third Party
+        from tokenizers import Tokenizer as HFTokenizer
+
+        path = name_or_path
+        if os.path.isdir(path):
+            path = os.path.join(path, "tokenizer.json")
+        try:
+            if os.path.isfile(path):
+                self._tokenizer = HFTokenizer.from_file(path)
+                with open(path, "rb") as f:
+                    self.cache_key = "sha256:" + hashlib.sha256(f.read()).hexdigest()
+            else:
+                self._tokenizer = HFTokenizer.from_pretrained(name_or_path)
+                self.cache_key = f"hub:{name_or_path}"
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            raise TokenizerException(
+                f"Cannot load tokenizer {name_or_path}: {exc}"
+            ) from exc
+
+    def _count(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+class ServerTokenizer(Tokenizer):
+    """Counts tokens with the tokenizer of the model served by the server."""
+
+    def __init__(
+        self,
+        session: ClientSession,
+        model_name: Optional[str] = None,
+        cache_size: int = DEFAULT_TOKENIZER_CACHE_SIZE,
+    ):
+        super().__init__(cache_size)
+        self.session = session
+        self.model_name = model_name
+
+    def _count(self, text: str) -> int:
+        try:
+            return self.session.count_tokens(text, self.model_name)
+        except ClientException as exc:
+            raise TokenizerException(str(exc)) from exc
+
+
+def get_tokenizer(
+    tokenizer: str,
+    session: Optional[ClientSession] = None,
+    model_name: Optional[str] = None,
+    cache_size: int = DEFAULT_TOKENIZER_CACHE_SIZE,
+) -> Tokenizer:
+    """Create a tokenizer from its name.
+
+    `heuristic` estimates tokens from characters, `server` asks the server of
+    the given session, anything else is loaded as a Hugging Face tokenizer.
+    """
+    if tokenizer == TOKENIZER_HEURISTIC:
+        return HeuristicTokenizer(cache_size)
+    if tokenizer == TOKENIZER_SERVER:
+        if session is None:
+            raise TokenizerException("The server tokenizer needs a client session")
+        return ServerTokenizer(session, model_name, cache_size)
+    return HuggingFaceTokenizer(tokenizer, cache_size)
@@ -142,6 +142,16 @@ def report_hpu_device(args_device: torch.device) -> None:
             print(f'  {key}="{value}"')
 
 
+def load_data_file(data_file: str):
+    """Load a train or test file of `ilab generate` as a dataset.
+
+    Parquet files are read column by column into the memory-mapped Arrow
+    cache of datasets, jsonl files are parsed line by line.
+    """
+    builder = "parquet" if data_file.endswith(".parquet") else "json"
+    return load_dataset(builder, data_files=data_file, split="train")
+
+
 def linux_train(
     ctx: click.Context,
     train_file: str,
@@ -176,9 +186,9 @@ def linux_train(
 
     print("LINUX_TRAIN.PY: LOADING DATASETS")
     # Get the file name
-    train_dataset = load_dataset("json", data_files=train_file, split="train")
+    train_dataset = load_data_file(train_file)
 
-    test_dataset = load_dataset("json", data_files=test_file, split="train")
+    test_dataset = load_data_file(test_file)
     train_dataset.to_pandas().head()
 
     tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
@@ -1,13 +1,30 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # Standard
-from functools import cache, wraps
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, lru_cache, wraps
 from logging import Logger
 from pathlib import Path
-from typing import Any, Dict, List, Mapping, Optional, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 import copy
 import glob
+import hashlib
 import json
+import logging
+import multiprocessing
 import os
 import platform
 import re
@@ -16,7 +33,6 @@ import tempfile
 
 # Third Party
 from git import Repo, exc
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 import click
 import git
 import gitdb
@@ -35,6 +51,9 @@ rules:
 
 DEFAULT_CHUNK_OVERLAP = 100
 
+CHUNK_SEPARATORS = ("\n\n", "\n", " ")
+"""Separators documents are split on, tried in order until the pieces fit"""
+
 
 class TaxonomyReadingException(Exception):
     """An exception raised during reading of the taxonomy."""
@@ -135,51 +154,63 @@ def istaxonomyfile(fn):
     return False
 
 
-def get_taxonomy_diff(repo="taxonomy", base="origin/main"):
-    repo = git.Repo(repo)
-    untracked_files = [u for u in repo.untracked_files if istaxonomyfile(u)]
+@lru_cache(maxsize=64)
+def _merge_base(git_dir: str, head: str, base: str) -> Optional[str]:
+    """Merge-base of two commits, cached since it only depends on the SHAs."""
+    try:
+        return git.Repo(git_dir).git.merge_base(head, base)
+    except exc.GitCommandError:
+        return None
 
-    branches = [b.name for b in repo.branches]
 
-    head_commit = None
+def _get_taxonomy_diff_base(repo: git.Repo, base: str) -> str:
+    """SHA of the commit the taxonomy changes are taken from."""
     if "/" in base:
-        re_git_branch = re.compile(f"remotes/{base}$", re.MULTILINE)
-    elif base in branches:
-        re_git_branch = re.compile(f"{base}$", re.MULTILINE)
+        base_ref = f"refs/remotes/{base}"
+    elif base in [b.name for b in repo.branches]:
+        base_ref = f"refs/heads/{base}"
     else:
         try:
-            head_commit = repo.commit(base)
-        except gitdb.exc.BadName as e:
+            return repo.commit(base).hexsha
+        except (gitdb.exc.BadName, ValueError) as e:
             raise SystemExit(
                 yaml.YAMLError(
                     f'Couldn\'t find the taxonomy git ref "{base}" from the current HEAD'
                 )
             ) from e
 
-    # Move backwards from HEAD until we find the first commit that is part of base
-    # then we can take our diff from there
-    current_commit = repo.commit("HEAD")
-    while not head_commit:
-        branches = repo.git.branch("-a", "--contains", current_commit.hexsha)
-        if re_git_branch.findall(branches):
-            head_commit = current_commit
-            break
-        try:
-            current_commit = current_commit.parents[0]
-        except IndexError as e:
-            raise SystemExit(
-                yaml.YAMLError(
-                    f'Couldn\'t find the taxonomy base branch "{base}" from the current HEAD'
-                )
-            ) from e
+    # the first commit of HEAD that is part of base, the diff is taken from there
+    try:
+        base_sha = repo.git.rev_parse("--verify", "--quiet", f"{base_ref}^{{commit}}")
+    except exc.GitCommandError:
+        base_sha = None
+    merge_base = None
+    if base_sha:
+        merge_base = _merge_base(repo.git_dir, repo.head.commit.hexsha, base_sha)
+    if not merge_base:
+        raise SystemExit(
+            yaml.YAMLError(
+                f'Couldn\'t find the taxonomy base branch "{base}" from the current HEAD'
+            )
+        )
+    return merge_base
 
-    modified_files = [
-        d.b_path
-        for d in head_commit.diff(None)
-        if not d.deleted_file and istaxonomyfile(d.b_path)
-    ]
 
-    updated_taxonomy_files = list(set(untracked_files + modified_files))
+def get_taxonomy_diff(repo="taxonomy", base="origin/main"):
+    repo = git.Repo(repo)
+    diff_base = _get_taxonomy_diff_base(repo, base)
+
+    # one diff of the base tree against the working tree, without deletions
+    modified_files = repo.git.diff(
+        "--name-only", "-z", "--no-renames", "--diff-filter=d", diff_base
+    ).split("\0")
+    untracked_files = repo.git.ls_files("--others", "--exclude-standard", "-z").split(
+        "\0"
+    )
+
+    updated_taxonomy_files = sorted(
+        {f for f in modified_files + untracked_files if f and istaxonomyfile(f)}
+    )
     return updated_taxonomy_files
 
 
@@ -208,22 +239,37 @@ def get_documents(
                 temp_dir=temp_dir,
                 skip_checkout=skip_checkout,
             )
-            file_contents = []
-
-            logger.debug("Processing files...")
-            for pattern in file_patterns:
-                for file_path in glob.glob(os.path.join(repo.working_dir, pattern)):
-                    if os.path.isfile(file_path) and file_path.endswith(".md"):
-                        with open(file_path, "r", encoding="utf-8") as file:
-                            file_contents.append(file.read())
-
-            if file_contents:
-                return file_contents
-            raise SystemExit("Couldn't find knowledge documents")
+            return read_documents(logger, repo.working_dir, file_patterns)
         except (OSError, exc.GitCommandError, FileNotFoundError) as e:
             raise e
 
 
+def read_documents(logger, working_dir: str, file_patterns: List[str]) -> List[str]:
+    """
+    Read the markdown files matching the patterns from a checked out repository.
+
+    Args:
+        working_dir (str): Working directory of the repository.
+        file_patterns (list): Glob patterns of the documents, relative to working_dir.
+
+    Returns:
+         List[str]: List of document contents.
+    """
+    file_contents = []
+
+    logger.debug("Processing files...")
+    for pattern in file_patterns:
+        # sorted, glob.glob lists directories in no particular order
+        for file_path in sorted(glob.glob(os.path.join(working_dir, pattern))):
+            if os.path.isfile(file_path) and file_path.endswith(".md"):
+                with open(file_path, "r", encoding="utf-8") as file:
+                    file_contents.append(file.read())
+
+    if file_contents:
+        return file_contents
+    raise SystemExit("Couldn't find knowledge documents")
+
+
 def git_clone_checkout(
     repo_url: str, temp_dir: str, commit_hash: str, skip_checkout: bool
 ) -> Repo:
@@ -245,7 +291,9 @@ def num_tokens_from_chars(num_chars) -> int:
     return int(num_chars / 4)  # 1 token ~ 4 English character
 
 
-def max_seed_example_tokens(server_ctx_size, prompt_num_chars) -> int:
+def max_seed_example_tokens(
+    server_ctx_size, prompt_num_chars, prompt_num_tokens=None
+) -> int:
     """
     Estimates the maximum number of tokens any seed example can have based
     on the server context size and number of characters in the selected prompt.
@@ -272,23 +320,32 @@ def max_seed_example_tokens(server_ctx_size, prompt_num_chars) -> int:
     Args:
         server_ctx_size (int): Size of the server context, in tokens.
         prompt_num_chars (int): Number of characters in the prompt (not including the examples)
+        prompt_num_tokens (int): Number of tokens in the prompt, if counted by a
+            tokenizer. Used instead of estimating it from prompt_num_chars.
     """
+    if prompt_num_tokens is None:
+        prompt_num_tokens = num_tokens_from_chars(prompt_num_chars)
     # Ensure we have at least 1024 tokens available for a response.
     max_seed_tokens = server_ctx_size - 1024
     # Subtract the number of tokens in our prompt template
-    max_seed_tokens = max_seed_tokens - num_tokens_from_chars(prompt_num_chars)
+    max_seed_tokens = max_seed_tokens - prompt_num_tokens
     # Divide number of characters by 2, since we insert 2 examples
     max_seed_tokens = int(max_seed_tokens / 2)
     return max_seed_tokens
 
 
-def chunk_document(documents: List, server_ctx_size, chunk_word_count) -> List[str]:
+def chunk_document(
+    documents: List, server_ctx_size, chunk_word_count, tokenizer=None
+) -> List[str]:
     """
     Iterates over the documents and splits them into chunks based on the word count provided by the user.
     Args:
         documents (dict): List of documents retrieved from git (can also consist of a single document).
         server_ctx_size (int): Context window size of server.
         chunk_word_count (int): Maximum number of words to chunk a document.
+        tokenizer (Tokenizer): Counts the tokens of the chunks if given, so the
+            chunks hold up to the token count of chunk_word_count. Otherwise
+            the number of tokens is estimated from the number of characters.
     Returns:
          List[str]: List of chunked documents.
     """
@@ -301,18 +358,138 @@ def chunk_document(documents: List, server_ctx_size, chunk_word_count) -> List[s
                 )
             )
         )
-    content = []
-    text_splitter = RecursiveCharacterTextSplitter(
-        separators=["\n\n", "\n", " "],
-        chunk_size=num_chars_from_tokens(no_tokens_per_doc),
-        chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+    if tokenizer is None:
+        chunks = iter_chunks(
+            documents,
+            chunk_size=num_chars_from_tokens(no_tokens_per_doc),
+            chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+        )
+    else:
+        chunks = iter_chunks(
+            documents,
+            chunk_size=no_tokens_per_doc,
+            chunk_overlap=num_tokens_from_chars(DEFAULT_CHUNK_OVERLAP),
+            length_function=tokenizer.count,
+        )
+    return list(chunks)
+
+
+def iter_chunks(
+    documents: Iterable[str],
+    chunk_size: int,
+    chunk_overlap: int,
+    length_function: Callable[[str], int] = len,
+) -> Iterator[str]:
+    """
+    Lazily splits the documents into chunks of up to chunk_size.
+    The documents are split on the first of CHUNK_SEPARATORS found in them,
+    pieces that are still too long are split on the next separators, and
+    consecutive pieces are merged back into chunks overlapping by up to
+    chunk_overlap. Separators stay at the start of the piece they precede
+    and chunks are stripped of surrounding whitespace.
+    Args:
+        documents (Iterable[str]): Documents to split, read one at a time.
+        chunk_size (int): Maximum length of a chunk.
+        chunk_overlap (int): Maximum length shared by two consecutive chunks.
+        length_function (Callable): Measures the length of a text, in
+            characters by default, or in tokens with a tokenizer's count.
+    Returns:
+         Iterator[str]: The chunks of all the documents, in order.
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+    if chunk_overlap < 0:
+        raise ValueError(f"chunk_overlap must be >= 0, got {chunk_overlap}")
+    if chunk_overlap > chunk_size:
+        raise ValueError(
+            f"Got a larger chunk overlap ({chunk_overlap}) than chunk size "
+            f"({chunk_size}), should be smaller."
+        )
+    separator_length = length_function("")
+    return (
+        chunk
+        for document in documents
+        for chunk in _split_chunks(
+            document,
+            CHUNK_SEPARATORS,
+            chunk_size,
+            chunk_overlap,
+            length_function,
+            separator_length,
+        )
     )
 
-    for docs in documents:
-        temp = text_splitter.create_documents([docs])
-        content.extend([item.page_content for item in temp])
 
-    return content
+def _split_pieces(text: str, separators) -> Tuple[List[str], Tuple[str, ...]]:
+    """Split text on the first separator found in it.
+
+    Returns the non-empty pieces, each but the first starting with the
+    separator, and the separators left to split them further.
+    """
+    for i, separator in enumerate(separators):
+        if separator in text:
+            first, *rest = text.split(separator)
+            pieces = [first] if first else []
+            pieces.extend(separator + piece for piece in rest)
+            return pieces, tuple(separators[i + 1 :])
+    return ([text] if text else []), ()
+
+
+def _split_chunks(
+    text, separators, chunk_size, chunk_overlap, length_function, separator_length
+) -> Iterator[str]:
+    pieces, separators = _split_pieces(text, separators)
+    fitting: List[Tuple[str, int]] = []
+    for piece in pieces:
+        length = length_function(piece)
+        if length < chunk_size:
+            fitting.append((piece, length))
+            continue
+        if fitting:
+            yield from _merge_pieces(
+                fitting, chunk_size, chunk_overlap, separator_length
+            )
+            fitting = []
+        if separators:
+            yield from _split_chunks(
+                piece,
+                separators,
+                chunk_size,
+                chunk_overlap,
+                length_function,
+                separator_length,
+            )
+        else:
+            # a single word longer than a chunk
+            yield piece
+    if fitting:
+        yield from _merge_pieces(fitting, chunk_size, chunk_overlap, separator_length)
+
+
+def _merge_pieces(
+    pieces: List[Tuple[str, int]], chunk_size, chunk_overlap, separator_length
+) -> Iterator[str]:
+    """Merge consecutive pieces, with their lengths, into overlapping chunks."""
+    current: deque = deque()
+    total = 0
+    for piece, length in pieces:
+        if total + length + (separator_length if current else 0) > chunk_size:
+            if current:
+                chunk = "".join(p for p, _ in current).strip()
+                if chunk:
+                    yield chunk
+                # keep the tail of the chunk as the overlap of the next one
+                while total > chunk_overlap or (
+                    total + length + (separator_length if current else 0) > chunk_size
+                    and total > 0
+                ):
+                    _, dropped = current.popleft()
+                    total -= dropped + (separator_length if current else 0)
+        current.append((piece, length))
+        total += length + (separator_length if len(current) > 1 else 0)
+    chunk = "".join(p for p, _ in current).strip()
+    if chunk:
+        yield chunk
 
 
 # pylint: disable=unused-argument
@@ -356,6 +533,33 @@ def _load_schema(path: "importlib.resources.abc.Traversable") -> "referencing.Re
     return resource
 
 
+@lru_cache
+def _get_schema_validator(version: int, schema_name: str) -> "jsonschema.Validator":
+    """Compile the validator of a taxonomy schema once per version and name.
+
+    Raises:
+        NoSuchResource: If the schema cannot be loaded.
+    """
+    # pylint: disable=C0415
+    # Standard
+    from importlib import resources
+
+    # Third Party
+    from jsonschema.validators import validator_for
+    from referencing import Registry, Resource
+    from referencing.typing import URI
+
+    schemas_path = resources.files("instructlab").joinpath(f"schema/v{version}")
+
+    def retrieve(uri: URI) -> Resource:
+        path = schemas_path.joinpath(uri)
+        return _load_schema(path)
+
+    schema = retrieve(f"{schema_name}.json").contents
+    validator_cls = validator_for(schema)
+    return validator_cls(schema, registry=Registry(retrieve=retrieve))
+
+
 def validate_yaml(
     logger: Logger, contents: Mapping[str, Any], taxonomy_path: Path
 ) -> int:
@@ -373,24 +577,11 @@ def validate_yaml(
         Messages for each error have been logged.
     """
     # pylint: disable=C0415
-    # Standard
-    from importlib import resources
-
     # Third Party
-    from jsonschema.protocols import Validator
-    from jsonschema.validators import validator_for
-    from referencing import Registry, Resource
     from referencing.exceptions import NoSuchResource
-    from referencing.typing import URI
 
     errors = 0
     version = get_version(contents)
-    schemas_path = resources.files("instructlab").joinpath(f"schema/v{version}")
-
-    def retrieve(uri: URI) -> Resource:
-        path = schemas_path.joinpath(uri)
-        return _load_schema(path)
-
     schema_name = taxonomy_path.parts[0]
     if schema_name not in TAXONOMY_FOLDERS:
         schema_name = "knowledge" if "document" in contents else "compositional_skills"
@@ -399,12 +590,7 @@ def validate_yaml(
         )
 
     try:
-        schema_resource = retrieve(f"{schema_name}.json")
-        schema = schema_resource.contents
-        validator_cls = validator_for(schema)
-        validator: Validator = validator_cls(
-            schema, registry=Registry(retrieve=retrieve)
-        )
+        validator = _get_schema_validator(version, schema_name)
 
         for validation_error in validator.iter_errors(contents):
             errors += 1
@@ -440,101 +626,359 @@ def get_version(contents: Mapping) -> int:
     return version
 
 
-# pylint: disable=broad-exception-caught
-def read_taxonomy_file(
-    logger: Logger, file_path: str, yaml_rules: Optional[str] = None
-):
-    seed_instruction_data = []
-    warnings = 0
-    errors = 0
-    file_path = Path(file_path).resolve()
-    # file should end with ".yaml" explicitly
-    if file_path.suffix != ".yaml":
-        logger.warn(f"Skipping {file_path}! Use lowercase '.yaml' extension instead.")
-        warnings += 1
-        return None, warnings, errors
-    for i in range(len(file_path.parts) - 1, -1, -1):
-        if file_path.parts[i] in TAXONOMY_FOLDERS:
-            taxonomy_path = Path(*file_path.parts[i:])
-            break
+DEFAULT_PARALLEL_TAXONOMY_FILES = 256
+"""Number of taxonomy files from which they are checked by a process pool"""
+
+_YAMLLINT_BATCH_SIZE = 256
+_YAMLLINT_LINE_RE = re.compile(r"^(.*):\d+:\d+: ")
+
+
+class _TaxonomyFileCheck(NamedTuple):
+    """Outcome of parsing, linting and validating a taxonomy file.
+
+    The messages are recorded rather than logged, so checks can run in
+    other processes and still be logged in the order of the files.
+    """
+
+    records: List[Tuple[int, str]]
+    warnings: int = 0
+    errors: int = 0
+    contents: Optional[Mapping] = None
+    taxonomy_path: Optional[Path] = None
+    exception: Optional[Exception] = None
+
+    def to_json(self) -> Optional[dict]:
+        """Encode the check for the taxonomy cache, None if it cannot be."""
+        if self.exception is not None:
+            return None
+        value = {
+            "records": self.records,
+            "warnings": self.warnings,
+            "errors": self.errors,
+            "contents": self.contents,
+            "taxonomy_path": None
+            if self.taxonomy_path is None
+            else str(self.taxonomy_path),
+        }
+        try:
+            # YAML values such as dates do not round-trip through json
+            if json.loads(json.dumps(value))["contents"] != self.contents:
+                return None
+        except (TypeError, ValueError):
+            return None
+        return value
+
+    @classmethod
+    def from_json(cls, value: dict) -> "_TaxonomyFileCheck":
+        return cls(
+            records=[tuple(record) for record in value["records"]],
+            warnings=value["warnings"],
+            errors=value["errors"],
+            contents=value["contents"],
+            taxonomy_path=None
+            if value["taxonomy_path"] is None
+            else Path(value["taxonomy_path"]),
+        )
+
+
+class _RecordingLogger:
+    """Records the messages logged while checking a taxonomy file."""
+
+    def __init__(self):
+        self.records: List[Tuple[int, str]] = []
+
+    def debug(self, message: str):
+        self.records.append((logging.DEBUG, message))
+
+    def info(self, message: str):
+        self.records.append((logging.INFO, message))
+
+    def warning(self, message: str):
+        self.records.append((logging.WARNING, message))
+
+    def error(self, message: str):
+        self.records.append((logging.ERROR, message))
+
+
+def _yamllint_cmd(yaml_rules: Optional[str], file_paths: List[Path]) -> List[str]:
+    if yaml_rules is not None and os.path.isfile(yaml_rules):
+        rules = ["-c", yaml_rules]
     else:
-        taxonomy_path = file_path
-    # read file if extension is correct
-    try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            contents = yaml.safe_load(file)
+        rules = ["-d", DEFAULT_YAML_RULES]
+    return ["yamllint", "-f", "parsable", *rules, *map(str, file_paths), "-s"]
+
+
+def _lint_yaml_files(
+    file_paths: List[Path], yaml_rules: Optional[str]
+) -> Dict[str, List[str]]:
+    """Run yamllint once per batch of files.
+
+    Returns the problems found, without the file name prefix, by file.
+    """
+    problems: Dict[str, List[str]] = {}
+    for start in range(0, len(file_paths), _YAMLLINT_BATCH_SIZE):
+        batch = file_paths[start : start + _YAMLLINT_BATCH_SIZE]
+        result = subprocess.run(
+            _yamllint_cmd(yaml_rules, batch),
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        # exits with 1 for errors and 2 for warnings in strict mode
+        if result.returncode not in (0, 1, 2):
+            raise subprocess.CalledProcessError(
+                result.returncode, result.args, result.stdout, result.stderr
+            )
+        for line in result.stdout.splitlines():
+            match = _YAMLLINT_LINE_RE.match(line)
+            if match:
+                path = match.group(1)
+                problems.setdefault(path, []).append(line[len(path) + 1 :])
+    return problems
+
+
+# pylint: disable=broad-exception-caught
+def _check_taxonomy_files(
+    file_paths: List[str], yaml_rules: Optional[str] = None
+) -> List[_TaxonomyFileCheck]:
+    """Parse, lint and validate taxonomy files.
+
+    yamllint runs once for all the files that need linting.
+    """
+    checks: List[Optional[_TaxonomyFileCheck]] = [None] * len(file_paths)
+    resolved_paths: List[Optional[Path]] = [None] * len(file_paths)
+    to_lint = []
+    for idx, file_path in enumerate(file_paths):
+        logger = _RecordingLogger()
+        file_path = Path(file_path).resolve()
+        # file should end with ".yaml" explicitly
+        if file_path.suffix != ".yaml":
+            logger.warning(
+                f"Skipping {file_path}! Use lowercase '.yaml' extension instead."
+            )
+            checks[idx] = _TaxonomyFileCheck(logger.records, warnings=1)
+            continue
+        for i in range(len(file_path.parts) - 1, -1, -1):
+            if file_path.parts[i] in TAXONOMY_FOLDERS:
+                taxonomy_path = Path(*file_path.parts[i:])
+                break
+        else:
+            taxonomy_path = file_path
+        # read file if extension is correct
+        try:
+            with open(file_path, "r", encoding="utf-8") as file:
+                contents = yaml.safe_load(file)
+        except Exception as e:
+            exception = TaxonomyReadingException(f"Exception {e} raised in {file_path}")
+            exception.__cause__ = e
+            checks[idx] = _TaxonomyFileCheck(logger.records, exception=exception)
+            continue
         if not contents:
-            logger.warn(f"Skipping {file_path} because it is empty!")
-            warnings += 1
-            return None, warnings, errors
+            logger.warning(f"Skipping {file_path} because it is empty!")
+            checks[idx] = _TaxonomyFileCheck(logger.records, warnings=1)
+            continue
         if not isinstance(contents, Mapping):
             logger.error(
                 f"{file_path} is not valid. The top-level element is not an object with key-value pairs."
             )
-            errors += 1
-            return None, warnings, errors
+            checks[idx] = _TaxonomyFileCheck(logger.records, errors=1)
+            continue
 
         # do general YAML linting if specified
-        version = get_version(contents)
-        if version > 1:  # no linting for version 1 yaml
+        if get_version(contents) > 1:  # no linting for version 1 yaml
             if yaml_rules is not None:
-                is_file = os.path.isfile(yaml_rules)
-                if is_file:
+                if os.path.isfile(yaml_rules):
                     logger.debug(f"Using YAML rules from {yaml_rules}")
-                    yamllint_cmd = [
-                        "yamllint",
-                        "-f",
-                        "parsable",
-                        "-c",
-                        yaml_rules,
-                        file_path,
-                        "-s",
-                    ]
                 else:
                     logger.debug(f"Cannot find {yaml_rules}. Using default rules.")
-                    yamllint_cmd = [
-                        "yamllint",
-                        "-f",
-                        "parsable",
-                        "-d",
-                        DEFAULT_YAML_RULES,
-                        file_path,
-                        "-s",
-                    ]
+            to_lint.append(idx)
+        checks[idx] = _TaxonomyFileCheck(
+            logger.records, contents=contents, taxonomy_path=taxonomy_path
+        )
+        resolved_paths[idx] = file_path
+
+    lint_problems: Dict[str, List[str]] = {}
+    lint_exception = None
+    if to_lint:
+        try:
+            lint_problems = _lint_yaml_files(
+                [resolved_paths[idx] for idx in to_lint], yaml_rules
+            )
+        except Exception as e:
+            lint_exception = e
+    to_lint = set(to_lint)
+
+    for idx, check in enumerate(checks):
+        if check.contents is None:
+            continue
+        file_path = resolved_paths[idx]
+        logger = _RecordingLogger()
+        logger.records = check.records
+        try:
+            if idx in to_lint:
+                if lint_exception is not None:
+                    raise lint_exception
+                problems = lint_problems.get(str(file_path))
+                if problems:
+                    lint_messages = [f"Problems found in file {file_path}"]
+                    lint_messages.extend(problems)
+                    logger.error("\n".join(lint_messages))
+                    checks[idx] = _TaxonomyFileCheck(
+                        logger.records, errors=len(problems)
+                    )
+                    continue
+
+            errors = validate_yaml(logger, check.contents, check.taxonomy_path)
+        except Exception as e:
+            exception = TaxonomyReadingException(f"Exception {e} raised in {file_path}")
+            exception.__cause__ = e
+            checks[idx] = _TaxonomyFileCheck(logger.records, exception=exception)
+            continue
+        if errors:
+            checks[idx] = _TaxonomyFileCheck(logger.records, errors=errors)
+        else:
+            checks[idx] = check
+    return checks
+
+
+_TAXONOMY_CHECK_FORMAT = 1
+
+
+@cache
+def _schemas_digest() -> str:
+    # pylint: disable=C0415
+    # Standard
+    from importlib import resources
+
+    digest = hashlib.sha256()
+
+    def update(path):
+        for child in sorted(path.iterdir(), key=lambda p: p.name):
+            if child.is_dir():
+                update(child)
             else:
-                yamllint_cmd = [
-                    "yamllint",
-                    "-f",
-                    "parsable",
-                    "-d",
-                    DEFAULT_YAML_RULES,
-                    file_path,
-                    "-s",
-                ]
-            try:
-                subprocess.check_output(yamllint_cmd, text=True)
-            except subprocess.SubprocessError as e:
-                lint_messages = [f"Problems found in file {file_path}"]
-                parsed_output = e.output.splitlines()
-                for p in parsed_output:
-                    errors += 1
-                    delim = str(file_path) + ":"
-                    parsed_p = p.split(delim)[1]
-                    lint_messages.append(parsed_p)
-                logger.error("\n".join(lint_messages))
-                return None, warnings, errors
-
-        validation_errors = validate_yaml(logger, contents, taxonomy_path)
-        if validation_errors:
-            errors += validation_errors
-            return None, warnings, errors
+                digest.update(child.name.encode("utf-8"))
+                digest.update(child.read_bytes())
+
+    schemas_path = resources.files("instructlab").joinpath("schema")
+    if schemas_path.is_dir():
+        update(schemas_path)
+    return digest.hexdigest()
+
+
+def taxonomy_check_key(
+    file_path: str, yaml_rules: Optional[str] = None
+) -> Optional[str]:
+    """Key of the check of a taxonomy file in the taxonomy cache.
+
+    Covers the git blob hash of the file, its location (which appears in the
+    messages), the schemas and the YAML rules. None if the file cannot be read.
+    """
+    file_path = Path(file_path).resolve()
+    try:
+        data = file_path.read_bytes()
+    except OSError:
+        return None
+    blob_sha = hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+    rules = DEFAULT_YAML_RULES
+    if yaml_rules is not None and os.path.isfile(yaml_rules):
+        with open(yaml_rules, "r", encoding="utf-8") as f:
+            rules = f.read()
+    key = json.dumps(
+        [
+            _TAXONOMY_CHECK_FORMAT,
+            str(file_path),
+            blob_sha,
+            _schemas_digest(),
+            None if yaml_rules is None else os.fspath(yaml_rules),
+            rules,
+        ]
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
+
+def _check_taxonomy_files_cached(
+    file_paths: List[str], yaml_rules: Optional[str] = None, taxonomy_cache=None
+) -> Iterator[_TaxonomyFileCheck]:
+    """Check taxonomy files, reusing the cached checks of unchanged files.
+
+    The checks are yielded in the order of the files.
+    """
+    if taxonomy_cache is None:
+        yield from _check_taxonomy_files_parallel(file_paths, yaml_rules)
+        return
+    keys = [taxonomy_check_key(file_path, yaml_rules) for file_path in file_paths]
+    cached = []
+    for key in keys:
+        value = taxonomy_cache.get(key) if key else None
+        cached.append(None if value is None else _TaxonomyFileCheck.from_json(value))
+    checks = _check_taxonomy_files_parallel(
+        [f for f, check in zip(file_paths, cached) if check is None], yaml_rules
+    )
+    for key, check in zip(keys, cached):
+        if check is None:
+            check = next(checks, None)
+            value = check.to_json() if key else None
+            if value is not None:
+                taxonomy_cache.put(key, value)
+        yield check
+    taxonomy_cache.prune()
+
+
+def _check_taxonomy_files_parallel(
+    file_paths: List[str], yaml_rules: Optional[str] = None
+) -> Iterator[_TaxonomyFileCheck]:
+    """Check taxonomy files, in a process pool if there are many.
+
+    The checks are yielded in the order of the files.
+    """
+    if len(file_paths) < DEFAULT_PARALLEL_TAXONOMY_FILES:
+        yield from _check_taxonomy_files(file_paths, yaml_rules)
+        return
+    # pylint: disable=C0415
+    # Local
+    from .config import DEFAULT_MULTIPROCESSING_START_METHOD
+
+    num_workers = os.cpu_count() or 1
+    chunk_size = min(_YAMLLINT_BATCH_SIZE, max(1, -(-len(file_paths) // num_workers)))
+    chunks = [
+        file_paths[start : start + chunk_size]
+        for start in range(0, len(file_paths), chunk_size)
+    ]
+    mpctx = multiprocessing.get_context(DEFAULT_MULTIPROCESSING_START_METHOD)
+    with ProcessPoolExecutor(
+        max_workers=min(num_workers, len(chunks)), mp_context=mpctx
+    ) as executor:
+        for checks in executor.map(
+            _check_taxonomy_files, chunks, [yaml_rules] * len(chunks)
+        ):
+            yield from checks
+
+
+def _read_checked_taxonomy_file(
+    logger: Logger, check: _TaxonomyFileCheck, document_cache=None
+):
+    """Log the messages of a check and get the seed examples of a valid file."""
+    for level, message in check.records:
+        logger.log(level, message)
+    if check.exception is not None:
+        raise check.exception
+    if check.contents is None:
+        return None, check.warnings, check.errors
+
+    contents = check.contents
+    taxonomy_path = check.taxonomy_path
+    seed_instruction_data = []
+    try:
         # get seed instruction data
         tax_path = "->".join(taxonomy_path.parent.parts)
         task_description = contents.get("task_description")
         documents = contents.get("document")
         if documents:
-            documents = get_documents(source=documents, logger=logger)
+            if document_cache is not None:
+                documents = document_cache.get_documents(logger, documents)
+            else:
+                documents = get_documents(source=documents, logger=logger)
             logger.debug("Content from git repo fetched")
 
         for seed_example in contents.get("seed_examples"):
@@ -552,18 +996,37 @@ def read_taxonomy_file(
                 }
             )
     except Exception as e:
-        errors += 1
-        raise TaxonomyReadingException(f"Exception {e} raised in {file_path}") from e
+        raise TaxonomyReadingException(
+            f"Exception {e} raised in {taxonomy_path}"
+        ) from e
+
+    return seed_instruction_data, check.warnings, check.errors
 
-    return seed_instruction_data, warnings, errors
+
+def read_taxonomy_file(
+    logger: Logger,
+    file_path: str,
+    yaml_rules: Optional[str] = None,
+    document_cache=None,
+    taxonomy_cache=None,
+):
+    (check,) = _check_taxonomy_files_cached([file_path], yaml_rules, taxonomy_cache)
+    return _read_checked_taxonomy_file(logger, check, document_cache)
 
 
-def read_taxonomy(logger, taxonomy, taxonomy_base, yaml_rules):
+def read_taxonomy(
+    logger,
+    taxonomy,
+    taxonomy_base,
+    yaml_rules,
+    document_cache=None,
+    taxonomy_cache=None,
+):
     seed_instruction_data = []
     is_file = os.path.isfile(taxonomy)
     if is_file:  # taxonomy is file
         seed_instruction_data, warnings, errors = read_taxonomy_file(
-            logger, taxonomy, yaml_rules
+            logger, taxonomy, yaml_rules, document_cache, taxonomy_cache
         )
         if warnings:
             logger.warn(
@@ -580,9 +1043,23 @@ def read_taxonomy(logger, taxonomy, taxonomy_base, yaml_rules):
             logger.debug("Found new taxonomy files:")
             for e in updated_taxonomy_files:
                 logger.debug(f"* {e}")
-        for f in updated_taxonomy_files:
-            file_path = os.path.join(taxonomy, f)
-            data, warnings, errors = read_taxonomy_file(logger, file_path, yaml_rules)
+        file_paths = [os.path.join(taxonomy, f) for f in updated_taxonomy_files]
+        checks = _check_taxonomy_files_cached(file_paths, yaml_rules, taxonomy_cache)
+        if document_cache is not None:
+            checks = list(checks)
+            # fetch the document repositories of all the files at once
+            document_cache.prefetch(
+                logger,
+                [
+                    check.contents["document"]
+                    for check in checks
+                    if check.contents and check.contents.get("document")
+                ],
+            )
+        for check in checks:
+            data, warnings, errors = _read_checked_taxonomy_file(
+                logger, check, document_cache
+            )
             total_warnings += warnings
             total_errors += errors
             if data:
@@ -0,0 +1,361 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from logging import Logger
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+# Third Party
+from git.exc import GitError
+
+# Local
+from .cache import DocumentCache
+from .utils import (
+    TAXONOMY_FOLDERS,
+    TaxonomyReadingException,
+    get_taxonomy_diff,
+    istaxonomyfile,
+    read_taxonomy_file,
+    taxonomy_check_key,
+)
+
+DEFAULT_POLL_INTERVAL = 0.5
+"""Seconds between two scans of the taxonomy when inotify is not available"""
+
+# changes arriving this soon after another are handled together, editors
+# tend to write a file in several steps
+_SETTLE_TIME = 0.05
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_MASK = (
+    _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+)
+_EVENT = struct.Struct("iIII")
+
+
+class WatchException(Exception):
+    """An exception raised when the taxonomy cannot be watched."""
+
+
+class TaxonomyChanges:
+    """Changes of the taxonomy since the last call to wait.
+
+    paths are relative to the taxonomy root. rescan is set if the git state
+    changed (commit, checkout, staging) or changes may have been missed.
+    """
+
+    def __init__(self):
+        self.paths: Set[str] = set()
+        self.rescan = False
+
+    def __bool__(self):
+        return bool(self.paths) or self.rescan
+
+
+class InotifyMonitor:
+    """Watches the taxonomy folders and the git directory with inotify."""
+
+    def __init__(self, root: str):
+        if not sys.platform.startswith("linux"):
+            raise WatchException("inotify is only available on Linux")
+        self.root = root
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise WatchException(
+                f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}"
+            )
+        self._dirs: Dict[int, str] = {}
+        try:
+            # the root for taxonomy folders that are created later
+            self._add_watch("")
+            self._add_watch(".git")
+            for folder in TAXONOMY_FOLDERS:
+                self._add_tree(folder)
+        except WatchException:
+            self.close()
+            raise
+
+    def _add_watch(self, rel_dir: str):
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _IN_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            # ENOSPC is raised when the limit of watches is reached
+            raise WatchException(f"Cannot watch {path}: {os.strerror(err)}")
+        self._dirs[wd] = rel_dir
+
+    def _add_tree(self, rel_dir: str):
+        self._add_watch(rel_dir)
+        for dirpath, _, _ in os.walk(os.path.join(self.root, rel_dir)):
+            if dirpath != os.path.join(self.root, rel_dir):
+                self._add_watch(os.path.relpath(dirpath, self.root))
+
+    def wait(self, timeout: Optional[float] = None) -> TaxonomyChanges:
+        changes = TaxonomyChanges()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        while ready:
+            self._read(changes)
+            ready, _, _ = select.select([self._fd], [], [], _SETTLE_TIME)
+        return changes
+
+    def _read(self, changes: TaxonomyChanges):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                changes.rescan = True
+                continue
+            rel_dir = self._dirs.get(wd)
+            if rel_dir is None:
+                continue
+            if mask & _IN_IGNORED:
+                del self._dirs[wd]
+                continue
+            if rel_dir == ".git":
+                # the index, HEAD or a ref changed
+                if not name.endswith(".lock"):
+                    changes.rescan = True
+                continue
+            if not name:
+                continue
+            if not rel_dir and name not in TAXONOMY_FOLDERS:
+                continue
+            rel_path = os.path.join(rel_dir, name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    # files may be written before the watch is added
+                    self._add_tree(rel_path)
+                    for dirpath, _, files in os.walk(os.path.join(self.root, rel_path)):
+                        for f in files:
+                            changes.paths.add(
+                                os.path.relpath(os.path.join(dirpath, f), self.root)
+                            )
+                else:
+                    changes.rescan = True
+                continue
+            changes.paths.add(rel_path)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingMonitor:
+    """Watches the taxonomy folders and the git directory by scanning them."""
+
+    def __init__(self, root: str, interval: float = DEFAULT_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._files, self._git = self._scan()
+
+    def _scan(self) -> Tuple[Dict[str, Tuple[int, int]], Tuple]:
+        files = {}
+        for folder in TAXONOMY_FOLDERS:
+            for dirpath, _, names in os.walk(os.path.join(self.root, folder)):
+                for name in names:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files[os.path.relpath(path, self.root)] = (
+                        stat.st_mtime_ns,
+                        stat.st_size,
+                    )
+        git_state = []
+        for name in ("HEAD", "index", "packed-refs"):
+            try:
+                git_state.append(
+                    os.stat(os.path.join(self.root, ".git", name)).st_mtime_ns
+                )
+            except OSError:
+                git_state.append(None)
+        # the current branch moves on commits
+        try:
+            with open(os.path.join(self.root, ".git", "HEAD"), encoding="utf-8") as f:
+                head = f.read().strip()
+            if head.startswith("ref: "):
+                ref = os.path.join(self.root, ".git", head[5:])
+                git_state.append(os.stat(ref).st_mtime_ns)
+        except OSError:
+            git_state.append(None)
+        return files, tuple(git_state)
+
+    def wait(self, timeout: Optional[float] = None) -> TaxonomyChanges:
+        changes = TaxonomyChanges()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            files, git_state = self._scan()
+            changes.paths = {
+                path
+                for path in files.keys() | self._files.keys()
+                if files.get(path) != self._files.get(path)
+            }
+            changes.rescan = git_state != self._git
+            self._files, self._git = files, git_state
+            if changes or (deadline is not None and time.monotonic() >= deadline):
+                return changes
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+def get_monitor(logger: Logger, root: str, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Monitor of the taxonomy changes, with inotify if available."""
+    try:
+        return InotifyMonitor(root)
+    except (WatchException, OSError, AttributeError) as exc:
+        logger.debug(f"Polling the taxonomy for changes: {exc}")
+        return PollingMonitor(root, poll_interval)
+
+
+class TaxonomyWatcher:  # pylint: disable=too-many-instance-attributes
+    """Keeps the validation state of the changed files of a taxonomy.
+
+    After the first scan, only the files that changed are read again.
+    Documents of knowledge files are kept in memory for the whole session.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        taxonomy: str,
+        taxonomy_base: str,
+        yaml_rules: Optional[str] = None,
+        taxonomy_cache=None,
+    ):
+        self.logger = logger
+        self.taxonomy = taxonomy
+        self.taxonomy_base = taxonomy_base
+        self.yaml_rules = yaml_rules
+        self.taxonomy_cache = taxonomy_cache
+        self.document_cache = DocumentCache()
+        self.results: Dict[str, Tuple[int, int]] = {}
+        self._keys: Dict[str, Optional[str]] = {}
+
+    @property
+    def warnings(self) -> int:
+        return sum(warnings for warnings, _ in self.results.values())
+
+    @property
+    def errors(self) -> int:
+        return sum(errors for _, errors in self.results.values())
+
+    @property
+    def files_with_errors(self) -> List[str]:
+        return sorted(path for path, (_, errors) in self.results.items() if errors)
+
+    def _read(self, path: str) -> bool:
+        """Read a taxonomy file again if it changed since it was last read."""
+        file_path = os.path.join(self.taxonomy, path)
+        key = taxonomy_check_key(file_path, self.yaml_rules)
+        if path in self.results and key is not None and key == self._keys.get(path):
+            return False
+        try:
+            _, warnings, errors = read_taxonomy_file(
+                self.logger,
+                file_path,
+                self.yaml_rules,
+                self.document_cache,
+                self.taxonomy_cache,
+            )
+        except (TaxonomyReadingException, GitError, SystemExit) as e:
+            # documents that cannot be fetched are an error of the file, it
+            # is read again once it changes
+            self.logger.error(f"Reading taxonomy file {path} failed: {e}")
+            warnings, errors = 0, 1
+        self.results[path] = (warnings, errors)
+        self._keys[path] = key
+        return True
+
+    def _drop(self, path: str) -> bool:
+        self._keys.pop(path, None)
+        return self.results.pop(path, None) is not None
+
+    def rescan(self) -> List[str]:
+        """Read the taxonomy diff and the files that changed in it.
+
+        Returns the files that were read again or dropped.
+        """
+        updated_taxonomy_files = get_taxonomy_diff(self.taxonomy, self.taxonomy_base)
+        updated = [
+            path
+            for path in list(self.results)
+            if path not in updated_taxonomy_files and self._drop(path)
+        ]
+        updated.extend(path for path in updated_taxonomy_files if self._read(path))
+        return updated
+
+    def update(self, paths) -> List[str]:
+        """Read the changed taxonomy files again.
+
+        Returns the files that were read again or dropped.
+        """
+        updated = []
+        for path in sorted(paths):
+            if not istaxonomyfile(path):
+                continue
+            if os.path.isfile(os.path.join(self.taxonomy, path)):
+                if self._read(path):
+                    updated.append(path)
+            elif self._drop(path):
+                updated.append(path)
+        return updated
+
+
+def watch_taxonomy(
+    watcher: TaxonomyWatcher,
+    report: Callable[[TaxonomyWatcher, List[str]], None],
+    monitor=None,
+):
+    """Validate the taxonomy on every change, until interrupted.
+
+    report is called with the files read again or dropped, after the first
+    scan and after every change that touched the taxonomy.
+    """
+    if monitor is None:
+        monitor = get_monitor(watcher.logger, watcher.taxonomy)
+    try:
+        report(watcher, watcher.rescan())
+        while True:
+            changes = monitor.wait()
+            if changes.rescan:
+                updated = watcher.rescan()
+            else:
+                updated = watcher.update(changes.paths)
+            if updated:
+                report(watcher, updated)
+    finally:
+        monitor.close()
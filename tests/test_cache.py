@@ -0,0 +1,252 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from unittest.mock import patch
+import logging
+
+# Third Party
+import git
+import pytest
+
+# First Party
+from instructlab import utils
+from instructlab.cache import DocumentCache, TaxonomyCache
+from instructlab.tokenizer import HeuristicTokenizer
+
+# Local
+from .testdata import testdata
+
+logger = logging.getLogger("_test_")
+
+
+def _make_repo(path, files):
+    repo = git.Repo.init(path)
+    with repo.config_writer() as cfg:
+        cfg.set_value("user", "name", "test")
+        cfg.set_value("user", "email", "test@example.com")
+        # lets the cache fetch documents without the other blobs
+        cfg.set_value("uploadpack", "allowFilter", "true")
+    for name, content in files.items():
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        (path / name).write_text(content)
+    repo.index.add(list(files))
+    repo.index.commit("add documents")
+    return repo
+
+
+@pytest.fixture(name="doc_repo")
+def fixture_doc_repo(tmp_path):
+    """A local knowledge document repository."""
+    return _make_repo(
+        tmp_path / "docs",
+        {
+            "phoenix.md": "# Phoenix\n\nA mythical bird.\n",
+            "notes.txt": "not a document",
+            "history/origins.md": "# Origins\n",
+        },
+    )
+
+
+def _source(repo):
+    return {
+        "repo": f"file://{repo.working_dir}",
+        "commit": repo.head.commit.hexsha,
+        "patterns": ["*.md", "*.txt"],
+    }
+
+
+class TestDocumentCache:
+    def test_documents_cached_on_disk(self, doc_repo, tmp_path):
+        cache_dir = str(tmp_path / "cache")
+        source = _source(doc_repo)
+        documents = DocumentCache(cache_dir).get_documents(logger, source)
+        assert documents == ["# Phoenix\n\nA mythical bird.\n"]
+
+        # a later run reads them from disk without touching git
+        with patch("instructlab.cache.Repo", side_effect=AssertionError):
+            assert DocumentCache(cache_dir).get_documents(logger, source) == documents
+
+    def test_documents_fetched_into_bare_repo(self, doc_repo, tmp_path):
+        cache = DocumentCache(str(tmp_path / "cache"))
+        first_commit = doc_repo.head.commit.hexsha
+        first = cache.get_documents(logger, _source(doc_repo))
+        (tmp_path / "docs" / "phoenix.md").write_text("# Phoenix\n\nRevised.\n")
+        doc_repo.index.add(["phoenix.md"])
+        doc_repo.index.commit("revise")
+        with patch.object(git.Repo, "init", side_effect=AssertionError):
+            second = cache.get_documents(logger, _source(doc_repo))
+        assert first != second
+        assert second == ["# Phoenix\n\nRevised.\n"]
+
+        (bare,) = (tmp_path / "cache" / "repos").iterdir()
+        repo = git.Repo(bare)
+        assert repo.bare
+        # only the pinned commits and the blobs of the documents are fetched
+        assert set((bare / "shallow").read_text().split()) == {
+            first_commit,
+            doc_repo.head.commit.hexsha,
+        }
+        missing = repo.git.rev_list(
+            "--objects", "--missing=print", doc_repo.head.commit.hexsha
+        )
+        notes = doc_repo.head.commit.tree["notes.txt"].hexsha
+        assert f"?{notes}" in missing.splitlines()
+
+    def test_documents_patterns(self, doc_repo, tmp_path):
+        cache = DocumentCache(str(tmp_path / "cache"))
+        source = dict(_source(doc_repo), patterns=["history/*.md", "*.md"])
+        assert cache.get_documents(logger, source) == [
+            "# Origins\n",
+            "# Phoenix\n\nA mythical bird.\n",
+        ]
+        # branches are resolved against the fetched refs
+        source = dict(source, commit="master", patterns=["missing/*.md"])
+        with pytest.raises(SystemExit):
+            cache.get_documents(logger, source)
+
+    def test_documents_symlinks(self, doc_repo, tmp_path):
+        root = tmp_path / "docs"
+        (root / "bird.md").symlink_to("phoenix.md")
+        (root / "history" / "bird.md").symlink_to("../bird.md")
+        (root / "history" / "all.md").symlink_to(".")
+        (root / "loop.md").symlink_to("loop.md")
+        doc_repo.git.add(".")
+        doc_repo.index.commit("add links")
+        source = dict(_source(doc_repo), patterns=["*.md", "history/*.md"])
+        documents = DocumentCache(str(tmp_path / "cache")).get_documents(logger, source)
+        # the same documents in the same order as from a checkout
+        assert documents == utils.read_documents(
+            logger, doc_repo.working_dir, source["patterns"]
+        )
+        assert documents == [
+            "# Phoenix\n\nA mythical bird.\n",
+            "# Phoenix\n\nA mythical bird.\n",
+            "# Phoenix\n\nA mythical bird.\n",
+            "# Origins\n",
+        ]
+
+    def test_prefetch(self, doc_repo, tmp_path, caplog):
+        other_repo = _make_repo(tmp_path / "other", {"bird.md": "# Bird\n"})
+        sources = [
+            _source(doc_repo),
+            dict(_source(doc_repo), patterns=["history/*.md"]),
+            _source(doc_repo),
+            _source(other_repo),
+            dict(_source(other_repo), commit="not-a-branch"),
+        ]
+        cache = DocumentCache(str(tmp_path / "cache"))
+        with caplog.at_level(logging.DEBUG, logger="_test_"):
+            cache.prefetch(logger, sources)
+        # the commits of a repository are fetched together, once
+        fetches = sorted(
+            r.getMessage()
+            for r in caplog.records
+            if r.name == "_test_" and r.getMessage().startswith("Fetching")
+        )
+        assert fetches == sorted(
+            [
+                f"Fetching {doc_repo.head.commit.hexsha} of {_source(doc_repo)['repo']}",
+                f"Fetching {other_repo.head.commit.hexsha} of {_source(other_repo)['repo']}",
+                f"Fetching the branches and tags of {_source(other_repo)['repo']}",
+            ]
+        )
+
+        # failures are left to get_documents
+        with patch.object(DocumentCache, "_fetch_commits", side_effect=AssertionError):
+            assert cache.get_documents(logger, sources[1]) == ["# Origins\n"]
+            assert cache.get_documents(logger, sources[3]) == ["# Bird\n"]
+            with pytest.raises(AssertionError):
+                cache.get_documents(logger, sources[4])
+
+    def test_documents_in_memory(self, doc_repo):
+        cache = DocumentCache()
+        source = _source(doc_repo)
+        with patch(
+            "instructlab.utils.get_documents", return_value=["document"]
+        ) as get_documents:
+            assert cache.get_documents(logger, source) == ["document"]
+            assert cache.get_documents(logger, dict(source)) == ["document"]
+        get_documents.assert_called_once()
+
+    def test_chunks(self, tmp_path):
+        cache_dir = str(tmp_path / "cache")
+        expected = utils.chunk_document(testdata.documents, 4096, 50)
+        with patch(
+            "instructlab.utils.chunk_document", wraps=utils.chunk_document
+        ) as chunk_document:
+            cache = DocumentCache(cache_dir)
+            for _ in range(2):
+                assert cache.chunk_document(testdata.documents, 4096, 50) == expected
+            assert chunk_document.call_count == 1
+            # the chunk size and the tokenization are part of the key
+            cache.chunk_document(testdata.documents, 4096, 60)
+            cache.chunk_document(testdata.documents, 4096, 50, HeuristicTokenizer())
+            assert chunk_document.call_count == 3
+            # later runs read the chunks from disk
+            assert (
+                DocumentCache(cache_dir).chunk_document(testdata.documents, 4096, 50)
+                == expected
+            )
+            assert chunk_document.call_count == 3
+
+    def test_chunks_context_exceeded(self):
+        cache = DocumentCache()
+        with pytest.raises(ValueError):
+            cache.chunk_document(testdata.documents, 1034, 100)
+
+
+class TestTaxonomyCache:
+    def _read(self, taxonomy_dir, cache, caplog):
+        caplog.clear()
+        with caplog.at_level(logging.DEBUG, logger="_test_"):
+            try:
+                data = utils.read_taxonomy(
+                    logger, taxonomy_dir.root, "main", None, taxonomy_cache=cache
+                )
+            except SystemExit:
+                data = None
+        return data, [
+            (r.levelno, r.getMessage()) for r in caplog.records if r.name == "_test_"
+        ]
+
+    def test_unchanged_files_not_checked(self, taxonomy_dir, tmp_path, caplog):
+        taxonomy_dir.create_untracked("compositional_skills/valid/qna.yaml")
+        with open("tests/testdata/skill_incomplete.yaml", "rb") as f:
+            taxonomy_dir.create_untracked(
+                "compositional_skills/invalid/qna.yaml", f.read()
+            )
+        cache = TaxonomyCache(str(tmp_path / "cache"))
+        expected = self._read(taxonomy_dir, None, caplog)
+        assert self._read(taxonomy_dir, cache, caplog) == expected
+
+        with patch(
+            "instructlab.utils._check_taxonomy_files",
+            wraps=utils._check_taxonomy_files,
+        ) as check:
+            assert self._read(taxonomy_dir, cache, caplog) == expected
+            check.assert_not_called()
+
+            # a changed file is checked again
+            taxonomy_dir.create_untracked("compositional_skills/invalid/qna.yaml")
+            data, _ = self._read(taxonomy_dir, cache, caplog)
+            assert len(data) == 10
+            assert len(check.call_args.args[0]) == 1
+
+    def test_check_key_path_rules(self, tmp_path):
+        qna = tmp_path / "qna.yaml"
+        qna.write_text("version: 2\n", encoding="utf-8")
+        rules = tmp_path / "rules.yaml"
+        rules.write_text("extends: relaxed\n", encoding="utf-8")
+        key = utils.taxonomy_check_key(str(qna), rules)
+        assert key == utils.taxonomy_check_key(str(qna), str(rules))
+        assert key != utils.taxonomy_check_key(str(qna))
+
+    def test_prune(self, tmp_path):
+        cache = TaxonomyCache(str(tmp_path), max_size=300)
+        for i in range(5):
+            cache.put(f"{i:02d}" * 32, {"records": [], "padding": "x" * 100})
+        cache.get("00" * 32)
+        cache.prune()
+        kept = [i for i in range(5) if cache.get(f"{i:02d}" * 32) is not None]
+        assert len(kept) == 2
+        assert 0 in kept
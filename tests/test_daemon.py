@@ -0,0 +1,226 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import subprocess
+import sys
+
+# Third Party
+from uvicorn import Config
+import pytest
+
+# First Party
+from instructlab import config, daemon
+from instructlab.client import ClientException
+from instructlab.daemon import (
+    DaemonException,
+    attach_daemon,
+    daemon_key,
+    has_clients,
+    read_state,
+    register_client,
+    remove_state,
+    start_daemon,
+    write_state,
+)
+from instructlab.server import Server, ensure_server
+
+logger = logging.getLogger("_test_")
+
+
+def _exited_pid():
+    with subprocess.Popen([sys.executable, "-c", ""]) as process:
+        process.wait()
+    return process.pid
+
+
+class TestDaemonState:
+    def test_key(self):
+        serve = config.get_default_config().serve
+        key = daemon_key(serve, None)
+        assert key.startswith("merlinite-7b-lab-Q4_K_M.gguf-")
+        assert daemon_key(serve, "merlinite") == key
+        serve.max_ctx_size = 1024
+        assert daemon_key(serve, None) != key
+
+    def test_state(self, tmp_path):
+        state_file = str(tmp_path / "model.json")
+        assert read_state(state_file) is None
+        write_state(state_file, {"pid": os.getpid(), "api_base": "http://x/v1"})
+        assert read_state(state_file)["api_base"] == "http://x/v1"
+        # a newer daemon replaced the state
+        remove_state(state_file, os.getpid() + 1)
+        assert os.path.exists(state_file)
+        remove_state(state_file, os.getpid())
+        assert not os.path.exists(state_file)
+
+        write_state(state_file, {"pid": _exited_pid(), "api_base": "http://x/v1"})
+        assert read_state(state_file) is None
+
+    def test_clients(self, tmp_path):
+        state_file = str(tmp_path / "model.json")
+        assert not has_clients(state_file)
+        dead = _exited_pid()
+        register_client(state_file, dead)
+        assert not has_clients(state_file)
+        assert not os.listdir(tmp_path / "model.clients")
+        register_client(state_file)
+        assert has_clients(state_file)
+
+
+def _serve_config(tmp_path, idle_timeout=60):
+    serve = config.get_default_config().serve
+    serve.model_path = str(tmp_path / "model.gguf")
+    serve.idle_timeout = idle_timeout
+    return serve
+
+
+class TestStartDaemon:
+    def _start(self, tmp_path, monkeypatch, script, startup_timeout=30.0):
+        commands = []
+        popen = subprocess.Popen
+
+        def fake_popen(args, **kwargs):
+            # a stand-in for the daemon, fed the same pipes
+            commands.append(args)
+            return popen([sys.executable, "-c", script], **kwargs)
+
+        monkeypatch.setattr(daemon.subprocess, "Popen", fake_popen)
+        state_file = str(tmp_path / "model.json")
+        api_base = start_daemon(
+            state_file, _serve_config(tmp_path), None, startup_timeout
+        )
+        return api_base, commands
+
+    def test_start(self, tmp_path, monkeypatch):
+        api_base, commands = self._start(
+            tmp_path, monkeypatch, "print('http://127.0.0.1:1234/v1')"
+        )
+        assert api_base == "http://127.0.0.1:1234/v1"
+        assert len(commands) == 1
+        command = commands[0]
+        assert command[:3] == [sys.executable, "-m", "instructlab.daemon"]
+        assert command[3] == str(tmp_path / "model.json")
+        kwargs = json.loads(command[4])
+        assert kwargs["model_path"] == os.path.realpath(tmp_path / "model.gguf")
+        assert kwargs["idle_timeout"] == 60
+
+    def test_exited(self, tmp_path, monkeypatch):
+        script = "import sys; sys.stderr.write('no model\\n'); sys.exit(3)"
+        with pytest.raises(DaemonException, match="exited with code 3") as exc:
+            self._start(tmp_path, monkeypatch, script)
+        log_file = str(tmp_path / "model.log")
+        assert log_file in str(exc.value)
+        with open(log_file, encoding="utf-8") as f:
+            assert f.read() == "no model\n"
+
+    def test_timeout(self, tmp_path, monkeypatch):
+        script = "import time; time.sleep(30)"
+        with pytest.raises(DaemonException, match="not ready after 0.2s"):
+            self._start(tmp_path, monkeypatch, script, startup_timeout=0.2)
+
+
+class TestAttachDaemon:
+    def _attach(self, tmp_path, monkeypatch, state=None, answering=True):
+        started = []
+
+        def fake_start(state_file, _serve, model_family, startup_timeout):
+            # commands looking for the same daemon wait for it to start
+            with open(
+                f"{state_file[: -len('.json')]}.lock", "w", encoding="utf-8"
+            ) as f:
+                with pytest.raises(BlockingIOError):
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            started.append((state_file, model_family, startup_timeout))
+            return "http://127.0.0.1:2000/v1"
+
+        def fake_list_models(api_base, **_):
+            if not answering:
+                raise ClientException(f"{api_base} is not answering")
+
+        monkeypatch.setattr(daemon, "start_daemon", fake_start)
+        monkeypatch.setattr(daemon, "list_models", fake_list_models)
+        serve = _serve_config(tmp_path)
+        directory = str(tmp_path / "daemons")
+        state_file = os.path.join(directory, f"{daemon_key(serve, None)}.json")
+        if state is not None:
+            os.makedirs(directory)
+            write_state(state_file, state)
+        api_base = attach_daemon(logger, serve, None, 5.0, directory=directory)
+        assert has_clients(state_file)
+        return api_base, started, state_file
+
+    def test_start(self, tmp_path, monkeypatch):
+        api_base, started, state_file = self._attach(tmp_path, monkeypatch)
+        assert api_base == "http://127.0.0.1:2000/v1"
+        assert started == [(state_file, None, 5.0)]
+
+    def test_running(self, tmp_path, monkeypatch):
+        state = {"pid": os.getpid(), "api_base": "http://127.0.0.1:3000/v1"}
+        api_base, started, _ = self._attach(tmp_path, monkeypatch, state)
+        assert api_base == "http://127.0.0.1:3000/v1"
+        assert not started
+
+    def test_stale_state(self, tmp_path, monkeypatch):
+        state = {"pid": _exited_pid(), "api_base": "http://127.0.0.1:3000/v1"}
+        api_base, started, _ = self._attach(tmp_path, monkeypatch, state)
+        assert api_base == "http://127.0.0.1:2000/v1"
+        assert len(started) == 1
+
+    def test_not_answering(self, tmp_path, monkeypatch):
+        state = {"pid": os.getpid(), "api_base": "http://127.0.0.1:3000/v1"}
+        api_base, started, _ = self._attach(
+            tmp_path, monkeypatch, state, answering=False
+        )
+        assert api_base == "http://127.0.0.1:2000/v1"
+        assert len(started) == 1
+
+
+class TestEnsureServer:
+    def test_daemon(self, tmp_path, monkeypatch):
+        attached = []
+
+        def fake_list_models(api_base, **_):
+            raise ClientException(f"{api_base} is not answering")
+
+        def fake_attach(_logger, serve_config, model_family, **kwargs):
+            attached.append((serve_config, model_family, kwargs["startup_timeout"]))
+            return "http://127.0.0.1:2000/v1"
+
+        monkeypatch.setattr("instructlab.server.list_models", fake_list_models)
+        monkeypatch.setattr(daemon, "attach_daemon", fake_attach)
+        serve = _serve_config(tmp_path)
+        result = ensure_server(
+            logger, serve, False, None, None, None, "merlinite", startup_timeout=5.0
+        )
+        assert result == (None, "http://127.0.0.1:2000/v1", None)
+        assert attached == [(serve, "merlinite", 5.0)]
+
+
+class TestIdleServer:
+    def _tick(self, server, counter=1):
+        return asyncio.run(server.on_tick(counter))
+
+    def test_idle_timeout(self):
+        in_use = [False]
+        server = Server(Config(app=None), idle_timeout=0.2, in_use=lambda: in_use[0])
+        assert not self._tick(server)
+        server.server_state.total_requests = 1
+        server._last_active -= 1
+        # a request completed since the last tick
+        assert not self._tick(server)
+        server._last_active -= 1
+        assert self._tick(server)
+
+        server._last_active -= 1
+        in_use[0] = True
+        assert not self._tick(server, counter=10)
+
+    def test_no_idle_timeout(self):
+        server = Server(Config(app=None))
+        server._last_active -= 3600
+        assert not self._tick(server)
@@ -0,0 +1,116 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from types import SimpleNamespace
+from unittest.mock import Mock
+import json
+
+# First Party
+from instructlab.generator import utils
+from instructlab.generator.metrics import GenerateMetrics
+from instructlab.metrics_util import percentile
+
+
+def _usage(prompt_tokens, completion_tokens):
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+    )
+
+
+class TestGenerateMetrics:
+    def test_percentile(self):
+        values = [float(v) for v in range(100, 0, -1)]
+        assert percentile(values, 0.5) == 50.0
+        assert percentile(values, 0.95) == 95.0
+        assert percentile(values, 0.99) == 99.0
+        assert percentile([3.0], 0.99) == 3.0
+        assert percentile([], 0.5) == 0.0
+
+    def test_export(self, tmp_path):
+        path = tmp_path / "metrics.jsonl"
+        prometheus_path = tmp_path / "generate.prom"
+        metrics = GenerateMetrics(str(path), str(prometheus_path), interval=3600)
+        for idx in range(1, 4):
+            request = metrics.request(idx, "compositional_skills/a")
+            request.start()
+            request.record_response(0.5, _usage(100, 20 * idx))
+            request.record_response(0.25, None)
+            request.timings["http_latency"] = float(idx)
+            request.counters["generated"] = 5
+            request.counters["rouge_rejected"] = 1
+            request.counters["kept"] = 4
+            metrics.record(request)
+        # nothing is written before the interval
+        assert not path.exists()
+
+        summary = metrics.close()
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line["type"] for line in lines] == ["request"] * 3 + ["summary"]
+        assert lines[0]["request_idx"] == 1
+        assert lines[0]["prompt_tokens"] == 100
+        assert lines[0]["completion_tokens"] == 20
+        assert lines[0]["http_requests"] == 2
+        assert summary["requests"] == 3
+        assert summary["prompt_tokens"] == 300
+        assert summary["completion_tokens"] == 120
+        assert summary["kept"] == 12
+        assert summary["tokens_per_sec"] > 0
+        assert summary["timings"]["http_latency"]["p50"] == 2.0
+        assert summary["timings"]["http_latency"]["p99"] == 3.0
+        assert summary["timings"]["response_latency"]["p50"] == 0.25
+        assert lines[-1]["timings"] == summary["timings"]
+
+        prometheus = prometheus_path.read_text()
+        assert "ilab_generate_requests_total 3\n" in prometheus
+        assert 'ilab_generate_tokens_total{kind="prompt"} 300\n' in prometheus
+        assert 'ilab_generate_samples_total{outcome="kept"} 12\n' in prometheus
+        assert (
+            'ilab_generate_stage_seconds{stage="http_latency",quantile="0.99"} 3.0\n'
+            in prometheus
+        )
+        assert (
+            'ilab_generate_stage_seconds_count{stage="response_latency"} 6\n'
+            in prometheus
+        )
+
+    def test_periodic_export(self, tmp_path):
+        path = tmp_path / "metrics.jsonl"
+        metrics = GenerateMetrics(str(path), interval=0)
+        for idx in range(2):
+            metrics.record(metrics.request(idx, "a"))
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line["type"] for line in lines] == [
+            "request",
+            "progress",
+            "request",
+            "progress",
+        ]
+        assert lines[-1]["requests"] == 2
+
+    def test_response_hook(self):
+        response = SimpleNamespace(
+            choices=["completion"], usage=_usage(10, 5), model="my-model"
+        )
+        session = Mock()
+        session.served_model_ids.return_value = ["my-model"]
+        session.chat_completion.return_value = response
+        metrics = GenerateMetrics()
+        request = metrics.request(1, "a")
+        completions = utils.openai_completion(
+            api_base="localhost:8000",
+            tls_insecure=False,
+            tls_client_cert=None,
+            tls_client_key=None,
+            tls_client_passwd=None,
+            prompts=["one", "two", "three"],
+            decoding_args=utils.OpenAIDecodingArguments(),
+            model_name="my-model",
+            max_in_flight=2,
+            session=session,
+            response_hook=request.record_response,
+        )
+        assert completions == ["completion"] * 3
+        assert request.counters["http_requests"] == 3
+        assert request.counters["prompt_tokens"] == 30
+        assert request.counters["completion_tokens"] == 15
+        assert len(request.response_latencies) == 3
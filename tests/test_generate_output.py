@@ -0,0 +1,232 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import json
+
+# Third Party
+import pytest
+
+# First Party
+from instructlab.generator import utils
+from instructlab.generator.output import (
+    OUTPUT_FORMAT_PARQUET,
+    DocumentTable,
+    GenerateOutputWriter,
+    documents_path,
+    find_manifest,
+    load_checkpoint,
+    load_generated,
+    load_regen,
+    manifest_path,
+    read_train_file,
+    seeds_path,
+    tokens_path,
+)
+from instructlab.generator.utils import GenerateException
+
+SAMPLES = [
+    {
+        "instruction": f"Instruction {i} é",
+        "input": "<noinput>",
+        "output": f"Output {i}\nwith a second line",
+        "taxonomy_path": "compositional_skills->tracked",
+    }
+    for i in range(5)
+]
+
+
+def _train_entry(sample):
+    return {"system": "sys", "user": sample["instruction"], "assistant": "a"}
+
+
+class TestGenerateOutputWriter:
+    def _writer(self, tmp_path, **kwargs):
+        return GenerateOutputWriter(
+            str(tmp_path),
+            "generated_run.json",
+            "train.jsonl",
+            "test.jsonl",
+            **kwargs,
+        )
+
+    def test_matches_jdump(self, tmp_path):
+        with self._writer(tmp_path, checkpoint_interval=0) as writer:
+            for sample in SAMPLES:
+                writer.append(sample, _train_entry(sample))
+                writer.commit()
+        utils.jdump(SAMPLES, str(tmp_path / "expected.json"))
+        assert (tmp_path / "generated_run.json").read_bytes() == (
+            tmp_path / "expected.json"
+        ).read_bytes()
+        manifest = utils.jload(manifest_path(str(tmp_path / "generated_run.json")))
+        assert manifest["complete"]
+        assert manifest["num_samples"] == len(SAMPLES)
+        with open(tmp_path / "train.jsonl", encoding="utf-8") as f:
+            assert [json.loads(line) for line in f] == [
+                _train_entry(sample) for sample in SAMPLES
+            ]
+
+    def test_empty(self, tmp_path):
+        with self._writer(tmp_path):
+            pass
+        assert utils.jload(str(tmp_path / "generated_run.json")) == []
+        assert (tmp_path / "train.jsonl").read_bytes() == b""
+
+    def test_write_test(self, tmp_path):
+        test_data = [_train_entry(sample) for sample in SAMPLES]
+        with self._writer(tmp_path) as writer:
+            writer.write_test(test_data)
+        with open(tmp_path / "test.jsonl", encoding="utf-8") as f:
+            assert [json.loads(line) for line in f] == test_data
+
+    def test_checkpoint_readable(self, tmp_path):
+        output_path = str(tmp_path / "generated_run.json")
+        writer = self._writer(tmp_path, checkpoint_interval=3600)
+        for sample in SAMPLES[:3]:
+            writer.append(sample)
+        writer.checkpoint()
+        assert not utils.jload(manifest_path(output_path))["complete"]
+        assert utils.jload(output_path) == SAMPLES[:3]
+        # samples after the last checkpoint are not committed yet
+        for sample in SAMPLES[3:]:
+            writer.append(sample)
+        writer.commit()
+        assert load_generated(output_path) == SAMPLES[:3]
+        writer.close()
+        assert load_generated(output_path) == SAMPLES
+
+    def test_failed_run_not_complete(self, tmp_path):
+        output_path = str(tmp_path / "generated_run.json")
+        with pytest.raises(RuntimeError):
+            with self._writer(tmp_path, checkpoint_interval=3600) as writer:
+                for sample in SAMPLES[:3]:
+                    writer.append(sample, _train_entry(sample))
+                writer.commit({"request_idx": 3})
+                raise RuntimeError("teacher went away")
+        manifest = utils.jload(manifest_path(output_path))
+        assert not manifest["complete"]
+        assert manifest["state"] == {"request_idx": 3}
+        assert load_generated(output_path) == SAMPLES[:3]
+
+    def test_resume(self, tmp_path):
+        output_path = str(tmp_path / "generated_run.json")
+        writer = self._writer(tmp_path, checkpoint_interval=3600)
+        for i, sample in enumerate(SAMPLES[:3]):
+            writer.append(sample, _train_entry(sample), [str(i)])
+        writer.commit({"request_idx": 3})
+        writer.checkpoint()
+        # lost when the run dies before the next checkpoint
+        writer.append(SAMPLES[3], _train_entry(SAMPLES[3]), ["3"])
+        writer.commit({"request_idx": 4})
+
+        manifest_file = find_manifest(str(tmp_path))
+        assert manifest_file == manifest_path(output_path)
+        manifest, samples, tokens = load_checkpoint(manifest_file)
+        assert samples == SAMPLES[:3]
+        assert tokens == [["0"], ["1"], ["2"]]
+        assert manifest["state"] == {"request_idx": 3}
+
+        with self._writer(tmp_path, manifest=manifest) as resumed:
+            resumed.append(SAMPLES[4], _train_entry(SAMPLES[4]), ["4"])
+        expected = SAMPLES[:3] + SAMPLES[4:]
+        assert utils.jload(output_path) == expected
+        assert utils.jload(tokens_path(output_path)) == [["0"], ["1"], ["2"], ["4"]]
+        with open(tmp_path / "train.jsonl", encoding="utf-8") as f:
+            assert [json.loads(line) for line in f] == [
+                _train_entry(sample) for sample in expected
+            ]
+
+    def test_documents_interned(self, tmp_path):
+        output_path = str(tmp_path / "generated_run.json")
+        chunks = ["first chunk", "second chunk"]
+        samples = [dict(sample, document=chunks) for sample in SAMPLES[:3]]
+        samples.append(dict(SAMPLES[3], document=None))
+        writer = self._writer(tmp_path, checkpoint_interval=3600)
+        writer.write_seeds({"seed_instruction_data": [samples[0]]})
+        for i, sample in enumerate(samples[:2]):
+            writer.append(sample, _train_entry(sample), [str(i)])
+        writer.checkpoint()
+
+        # the chunks are stored once and referenced by content hash
+        (ref,) = utils.jload(documents_path(output_path))
+        assert utils.jload(documents_path(output_path))[ref] == chunks
+        assert utils.jload(seeds_path(output_path))["seed_instruction_data"] == [
+            dict(samples[0], document=ref)
+        ]
+        assert [s["document"] for s in utils.jload(output_path)] == [ref, ref]
+        # the samples in memory are left alone
+        assert samples[0]["document"] is chunks
+
+        manifest, loaded, _ = load_checkpoint(manifest_path(output_path))
+        assert loaded == samples[:2]
+        assert loaded[0]["document"] is loaded[1]["document"]
+
+        with self._writer(tmp_path, manifest=manifest) as resumed:
+            for sample in samples[2:]:
+                resumed.append(sample)
+        assert load_generated(output_path) == samples
+        unresolved = load_generated(output_path, resolve_documents=False)
+        assert [s["document"] for s in unresolved] == [ref, ref, ref, None]
+        table = DocumentTable(documents_path(output_path))
+        assert table.resolve(unresolved[0]) == samples[0]
+
+    def test_regen(self, tmp_path):
+        chunks = ["first chunk", "second chunk"]
+        samples = [dict(sample, document=chunks) for sample in SAMPLES[:2]]
+        with self._writer(tmp_path) as writer:
+            for sample in samples:
+                writer.append(sample)
+        # the documented way to resume copies only the generated file
+        regen_path = tmp_path / "regen.json"
+        regen_path.write_bytes((tmp_path / "generated_run.json").read_bytes())
+        regen = load_regen(str(regen_path))
+        assert regen == samples
+
+        # the documents of the new run hold the documents of the copied samples
+        new = GenerateOutputWriter(
+            str(tmp_path), "generated_new.json", "train_new.jsonl", "test_new.jsonl"
+        )
+        with new:
+            for sample in regen:
+                new.append(sample)
+        (tmp_path / "generated_run.documents.json").unlink()
+        assert load_generated(str(tmp_path / "generated_new.json")) == samples
+
+        (tmp_path / "generated_new.documents.json").unlink()
+        with pytest.raises(GenerateException):
+            load_regen(str(regen_path))
+
+    def test_parquet(self, tmp_path):
+        def writer(**kwargs):
+            return GenerateOutputWriter(
+                str(tmp_path),
+                "generated_run.json",
+                "train.parquet",
+                "test.parquet",
+                output_format=OUTPUT_FORMAT_PARQUET,
+                **kwargs,
+            )
+
+        test_data = [_train_entry(sample) for sample in SAMPLES[3:]]
+        with writer(checkpoint_interval=0) as first:
+            first.write_test(test_data)
+            for sample in SAMPLES[:3]:
+                first.append(sample, _train_entry(sample))
+                first.commit()
+        assert read_train_file(str(tmp_path / "test.parquet")) == test_data
+        expected = [_train_entry(sample) for sample in SAMPLES[:3]]
+        assert read_train_file(str(tmp_path / "train.parquet")) == expected
+
+        manifest, samples, _ = load_checkpoint(find_manifest(str(tmp_path)))
+        assert manifest["output_format"] == OUTPUT_FORMAT_PARQUET
+        with pytest.raises(GenerateException):
+            writer(manifest=manifest)
+        # the parquet file is written again from the resumed entries
+        with writer(
+            manifest=manifest, train_entries=[_train_entry(s) for s in samples]
+        ) as resumed:
+            resumed.append(SAMPLES[3], _train_entry(SAMPLES[3]))
+        assert read_train_file(str(tmp_path / "train.parquet")) == [
+            _train_entry(sample) for sample in SAMPLES[:4]
+        ]
+        assert load_generated(str(tmp_path / "generated_run.json")) == SAMPLES[:4]
@@ -0,0 +1,55 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from collections import Counter
+import random
+
+# Third Party
+import pytest
+
+# First Party
+from instructlab.generator.pools import TaxonomyPools
+
+
+def _examples(path, count):
+    return [{"taxonomy_path": path, "instruction": f"{path} {i}"} for i in range(count)]
+
+
+class TestTaxonomyPools:
+    def test_round_robin(self):
+        seeds = _examples("a", 1) + _examples("b", 5)
+        pools = TaxonomyPools(["a", "b"], seeds)
+        assert [pools.select(idx) for idx in range(1, 5)] == ["b", "a", "b", "a"]
+
+    def test_weighted(self):
+        seeds = _examples("a", 1) + _examples("b", 3) + _examples("c", 2)
+        pools = TaxonomyPools(["a", "b", "c"], seeds, schedule="weighted")
+        selected = [pools.select(idx) for idx in range(60)]
+        assert Counter(selected) == {"a": 10, "b": 30, "c": 20}
+        # the paths are interleaved, not picked in runs
+        assert selected[:6].count("b") == 3
+
+    def test_pool_matches_filter(self):
+        seeds = _examples("a", 3) + _examples("b", 2)
+        pools = TaxonomyPools(["a", "b"], seeds)
+        machine = _examples("a", 2) + _examples("b", 1)
+        for example in machine:
+            pools.add(example)
+        for path in ("a", "b"):
+            expected = [e for e in seeds + machine if e["taxonomy_path"] == path]
+            assert list(pools.snapshot(path)) == expected
+
+    def test_snapshot_ignores_later_additions(self):
+        pools = TaxonomyPools(["a"], _examples("a", 3))
+        snapshot = pools.snapshot("a")
+        pools.add({"taxonomy_path": "a", "instruction": "new"})
+        assert len(snapshot) == 3
+        assert len(pools.snapshot("a")) == 4
+        assert all(e["instruction"] != "new" for e in snapshot)
+        assert len(random.Random(0).sample(snapshot, 3)) == 3
+        with pytest.raises(ValueError):
+            random.Random(0).sample(snapshot, 4)
+
+    def test_unknown_schedule(self):
+        with pytest.raises(ValueError):
+            TaxonomyPools(["a"], _examples("a", 1), schedule="random")
@@ -0,0 +1,93 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from types import SimpleNamespace
+import json
+import re
+
+# First Party
+from instructlab.generator import generate_data
+
+NUM_PROMPT_INSTRUCTIONS = 2
+
+
+def _load_responses():
+    with open("tests/testdata/teacher_responses.jsonl", encoding="utf-8") as f:
+        return [
+            SimpleNamespace(
+                message=SimpleNamespace(content=json.loads(line)["content"])
+            )
+            for line in f
+        ]
+
+
+def _reference_denied(inst):
+    # one pattern per word, as post-processing used to do it
+    return any(
+        re.compile(r"\b({0})\b".format(word), flags=re.IGNORECASE).search(inst)
+        for word in generate_data._WORD_DENYLIST
+    )
+
+
+class TestPostProcess:
+    def test_corpus(self, tmp_path):
+        discarded_file = tmp_path / "discarded.log"
+        responses = _load_responses()
+        instructions, discarded = generate_data.post_process_gpt3_responses(
+            NUM_PROMPT_INSTRUCTIONS, responses + [None], str(discarded_file)
+        )
+        assert instructions
+        assert discarded
+        with open(discarded_file, encoding="utf-8") as f:
+            assert len(f.readlines()) == discarded
+        assert not any(_reference_denied(i["instruction"]) for i in instructions)
+
+        # the batch gives the same results as one response at a time
+        expected = []
+        expected_discarded = 0
+        for response in responses:
+            result, result_discarded = generate_data.post_process_gpt3_response(
+                NUM_PROMPT_INSTRUCTIONS, response, str(tmp_path / "single.log")
+            )
+            expected += result
+            expected_discarded += result_discarded
+        assert instructions == expected
+        assert discarded == expected_discarded
+
+    def test_denylist(self):
+        for inst in (
+            "Draw a cat on a piece of paper",
+            "Describe the IMAGE in this message",
+            "Go to the store and buy milk",
+            "Summarize the attached Files quickly",
+        ):
+            assert generate_data._WORD_DENYLIST_RE.search(inst)
+            assert _reference_denied(inst)
+        for inst in (
+            "Describe the mapping between keys and values",
+            "Explain why the profile was filed twice",
+            "Name the musical instruments of an orchestra",
+        ):
+            assert not generate_data._WORD_DENYLIST_RE.search(inst)
+            assert not _reference_denied(inst)
+
+    def test_no_discarded_file_without_discards(self, tmp_path):
+        discarded_file = tmp_path / "discarded.log"
+        response = SimpleNamespace(
+            message=SimpleNamespace(
+                content="** Instruction\nExplain why the sky is blue.\n"
+                "** Input\n<noinput>\n** Output\nScattering.\n"
+            )
+        )
+        instructions, discarded = generate_data.post_process_gpt3_responses(
+            NUM_PROMPT_INSTRUCTIONS, [response], str(discarded_file)
+        )
+        assert instructions == [
+            {
+                "instruction": "Explain why the sky is blue.",
+                "input": "",
+                "output": "Scattering.",
+            }
+        ]
+        assert discarded == 0
+        assert not discarded_file.exists()
@@ -25,8 +25,10 @@ class TestLabDiff:
     """Test collection for `ilab diff` command."""
 
     @pytest.fixture(autouse=True)
-    def _init_taxonomy(self, taxonomy_dir):
+    def _init_taxonomy(self, taxonomy_dir, tmp_path, monkeypatch):
         self.taxonomy = taxonomy_dir
+        # the on-disk caches of the checks and documents stay out of ~/.cache
+        monkeypatch.setattr(lab.config, "DEFAULT_CACHE_DIR", str(tmp_path / "cache"))
 
     def test_diff(self):
         untracked_file = "compositional_skills/new/qna.yaml"
@@ -231,6 +231,7 @@ class TestLabGenerate:
                     "generated_my-model*.json",
                     "train_my-model*.jsonl",
                     "test_my-model*.jsonl",
+                    "metrics_my-model*.jsonl",
                 ]
                 for f in os.listdir("generated"):
                     assert any(
@@ -277,6 +278,7 @@ class TestLabGenerate:
                     "generated_my-model*.json",
                     "train_my-model*.jsonl",
                     "test_my-model*.jsonl",
+                    "metrics_my-model*.jsonl",
                 ]
                 for f in os.listdir("generated"):
                     assert any(
@@ -0,0 +1,98 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Third Party
+from llama_cpp.server.settings import ModelSettings
+import pytest
+
+# First Party
+from instructlab.model_cache import ModelCache, ModelSlot, Timings, UnslottedModels
+
+
+class FakeLlama:
+    def __init__(self, settings):
+        self.model_path = settings.model
+        self.chat_handler = None
+
+
+def _measure(_llama):
+    # weights of 100 bytes, context of 10 bytes per instance
+    return 100, 10
+
+
+def _cache(tmp_path, memory_budget=0):
+    models = []
+    for name in ("base.gguf", "trained.gguf"):
+        path = tmp_path / name
+        path.write_bytes(b"0" * 100)
+        models.append(ModelSettings(model=str(path), model_alias=str(path)))
+    return ModelCache(
+        models,
+        chat_handlers={models[1].model: "trained-handler"},
+        memory_budget=memory_budget,
+        load=FakeLlama,
+        measure=_measure,
+        timings=lambda llama: Timings(0, 0.0, 0, 0.0),
+    )
+
+
+class TestModelCache:
+    def test_resolve(self, tmp_path):
+        cache = _cache(tmp_path)
+        base, trained = list(cache)
+        assert cache.resolve(trained) == trained
+        assert cache.resolve("trained.gguf") == trained
+        assert cache.resolve("trained") == trained
+        assert cache.resolve("gpt-4") == base
+        assert cache.resolve(None) == base
+
+    def test_instances(self, tmp_path):
+        cache = _cache(tmp_path)
+        slots = [ModelSlot(cache, 0), ModelSlot(cache, 1)]
+        base = slots[0]("base")
+        assert slots[0]("base") is base
+        assert slots[1]("base") is not base
+        trained = slots[0]("trained")
+        assert trained.chat_handler == "trained-handler"
+        assert base.chat_handler is None
+        # the weights are counted once per model
+        assert cache.memory() == 2 * 100 + 3 * 10
+        assert set(cache.load_times) == set(cache)
+        assert list(slots[0]) == list(cache)
+
+    def test_memory_budget(self, tmp_path):
+        cache = _cache(tmp_path, memory_budget=225)
+        base, trained = list(cache)
+        cache.get("base", 0)
+        cache.get("base", 1)
+        assert cache.loaded() == [(base, 0), (base, 1)]
+        cache.get("base", 0)
+        # the least recently used instance is unloaded first
+        cache.get("trained", 0)
+        assert cache.loaded() == [(base, 0), (trained, 0)]
+        assert cache.memory() == 220
+
+        cache.memory_budget = 50
+        cache.get("base", 1)
+        # a single instance over the budget is still served
+        assert cache.loaded() == [(base, 1)]
+
+    def test_unslotted(self, tmp_path):
+        cache = _cache(tmp_path)
+        base, trained = list(cache)
+        slots = [ModelSlot(cache, 0), ModelSlot(cache, 1)]
+        unslotted = UnslottedModels(cache, 2)
+        first = slots[0]("base")
+        second = slots[1]("base")
+        # the most recently used instance, the order of unloading is unchanged
+        assert unslotted("base") is second
+        cache.get("base", 0)
+        assert unslotted("base") is first
+        assert cache.loaded() == [(base, 1), (base, 0)]
+        # a model no slot loaded is loaded for the slot past the server's
+        assert unslotted("trained") is cache.get("trained", 2)
+        assert unslotted.take_usage() is None
+        assert (trained, 0) not in cache.loaded()
+
+    def test_no_models(self):
+        with pytest.raises(ValueError):
+            ModelCache([])
@@ -0,0 +1,70 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import multiprocessing
+import time
+
+# Third Party
+import pytest
+
+# First Party
+from instructlab.server import SERVER_READY, ServerException, wait_for_server
+
+
+def _ready(queue, delay):
+    time.sleep(delay)
+    queue.put((SERVER_READY, 1234))
+    time.sleep(5)
+
+
+def _fail(queue):
+    queue.put(ValueError("no model"))
+    queue.close()
+    queue.join_thread()
+
+
+def _exit(queue):  # pylint: disable=unused-argument
+    raise SystemExit(3)
+
+
+def _hang(queue):  # pylint: disable=unused-argument
+    time.sleep(60)
+
+
+def _start(target, *args):
+    mpctx = multiprocessing.get_context("spawn")
+    queue = mpctx.Queue()
+    process = mpctx.Process(target=target, args=(queue, *args))
+    process.start()
+    return process, queue
+
+
+class TestWaitForServer:
+    def test_ready(self):
+        process, queue = _start(_ready, 0.5)
+        try:
+            start = time.monotonic()
+            assert wait_for_server(process, queue, timeout=30) == 1234
+            # returns once the server is ready, not after a fixed delay
+            assert time.monotonic() - start < 10
+            assert process.is_alive()
+        finally:
+            process.terminate()
+            process.join()
+
+    def test_failed(self):
+        process, queue = _start(_fail)
+        with pytest.raises(ValueError, match="no model"):
+            wait_for_server(process, queue, timeout=30)
+        assert not process.is_alive()
+
+    def test_exited(self):
+        process, queue = _start(_exit)
+        with pytest.raises(ServerException, match="exited with code 3"):
+            wait_for_server(process, queue, timeout=30)
+
+    def test_timeout(self):
+        process, queue = _start(_hang)
+        with pytest.raises(ServerException, match="not ready after 0.5s"):
+            wait_for_server(process, queue, timeout=0.5)
+        assert not process.is_alive()
@@ -0,0 +1,106 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Third Party
+from llama_cpp.server.settings import ModelSettings
+
+# First Party
+from instructlab.model_cache import ModelCache, ModelSlot, Timings, UnslottedModels
+from instructlab.server_metrics import ServerMetrics, format_stats
+from instructlab.slots import SlotPool
+
+
+class FakeLlama:
+    def __init__(self, settings):
+        self.model_path = settings.model
+        self.n_tokens = 0
+        self.timings = Timings(0, 0.0, 0, 0.0)
+
+    def n_ctx(self):
+        return 100
+
+    def run(self, prompt_tokens, completion_tokens):
+        t = self.timings
+        self.timings = Timings(
+            t.prompt_tokens + prompt_tokens,
+            t.prompt_seconds + prompt_tokens / 1000,
+            t.completion_tokens + completion_tokens,
+            t.completion_seconds + completion_tokens / 10,
+        )
+        self.n_tokens = prompt_tokens + completion_tokens
+
+
+def _metrics(tmp_path):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(b"0" * 100)
+    cache = ModelCache(
+        [ModelSettings(model=str(path), model_alias=str(path))],
+        load=FakeLlama,
+        measure=lambda llama: (100, 10),
+        timings=lambda llama: llama.timings,
+    )
+    slots = [ModelSlot(cache, 0), ModelSlot(cache, 1)]
+    return (
+        ServerMetrics(cache, SlotPool(slots)),
+        slots + [UnslottedModels(cache, 2)],
+        str(path),
+    )
+
+
+class TestServerMetrics:
+    def test_stats(self, tmp_path):
+        metrics, slots, path = _metrics(tmp_path)
+        for prompt_tokens in (50, 10):
+            llama = slots[0]("model")
+            llama.run(prompt_tokens, 20)
+            metrics.request_done("/v1/chat/completions", 200, 0.0, slots[0])
+        # a request rejected by the route before getting its model
+        metrics.request_done("/v1/chat/completions", 422, 0.0, slots[1])
+        metrics.request_rejected("/v1/chat/completions")
+
+        stats = metrics.stats()
+        assert stats["requests"] == 4
+        assert stats["requests_by_status"] == {"200": 2, "422": 1, "503": 1}
+        assert stats["slots"] == 2
+        assert stats["queue_depth"] == 0
+        model = stats["models"][path]
+        assert model["requests"] == 2
+        assert model["prompt_tokens"] == 60
+        assert model["completion_tokens"] == 40
+        assert model["prompt_tokens_per_sec"] == 1000
+        assert model["completion_tokens_per_sec"] == 10
+        assert model["context_utilization"]["p95"] == 0.7
+        assert model["loaded_slots"] == 1
+        assert model["memory_bytes"] == 110
+        # the arrival is long before the slot got its model
+        assert model["ttft"]["p50"] > 0.01
+
+        text = metrics.prometheus()
+        assert (
+            'ilab_serve_requests_total{path="/v1/chat/completions",status="503"} 1'
+            in text
+        )
+        assert f'ilab_serve_prompt_tokens_total{{model="{path}"}} 60' in text
+        assert "# TYPE ilab_serve_ttft_seconds summary" in text
+
+        line = format_stats(stats)
+        assert line.startswith("4 requests (1 rejected), 0/2 slots busy, 0 queued")
+        assert "1000.0 prompt tokens/s, 10.0 completion tokens/s" in line
+
+    def test_tokenize_between_completions(self, tmp_path):
+        metrics, slots, path = _metrics(tmp_path)
+        unslotted = slots[2]
+        llama = slots[0]("model")
+        llama.run(50, 20)
+        metrics.request_done("/v1/chat/completions", 200, 0.0, slots[0])
+        # a tokenize request shares the instance without taking the slot
+        assert unslotted("model") is llama
+        llama = slots[0]("model")
+        # llama.cpp reset the timings of the context during the request
+        llama.timings = Timings(0, 0.0, 0, 0.0)
+        llama.run(10, 5)
+        metrics.request_done("/v1/chat/completions", 200, 0.0, slots[0])
+
+        model = metrics.stats()["models"][path]
+        assert model["requests"] == 2
+        assert model["prompt_tokens"] == 50
+        assert model["completion_tokens"] == 20
@@ -0,0 +1,75 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import random
+
+# Third Party
+from rouge_score import rouge_scorer
+import pytest
+
+# First Party
+from instructlab.generator.similarity import (
+    IndexedRougeSimilarity,
+    RougeSimilarity,
+    get_similarity_backend,
+)
+
+
+def _corpus(count, seed=0):
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(50)]
+    return [
+        [rng.choice(words) for _ in range(rng.randint(3, 12))] for _ in range(count)
+    ]
+
+
+def _brute_force(tokens, corpus):
+    return max(rouge_scorer._score_lcs(tokens, other).fmeasure for other in corpus)
+
+
+class TestRougeSimilarity:
+    """Test collection for the ROUGE-L similarity engine."""
+
+    @pytest.mark.parametrize("num_workers", [1, 2])
+    def test_matches_brute_force(self, num_workers):
+        corpus = _corpus(40)
+        candidates = _corpus(10, seed=1)
+        with RougeSimilarity(corpus[:30], num_workers=num_workers) as engine:
+            for tokens in corpus[30:]:
+                engine.add(tokens)
+            assert len(engine) == len(corpus)
+            for tokens in candidates:
+                assert engine.max_score(tokens) == _brute_force(tokens, corpus)
+
+    def test_exact_duplicate(self):
+        corpus = _corpus(5)
+        with RougeSimilarity(corpus, num_workers=2) as engine:
+            assert engine.max_score(corpus[3]) == 1.0
+
+
+class TestIndexedRougeSimilarity:
+    """Test collection for the inverted index similarity backend."""
+
+    @pytest.mark.parametrize("threshold", [-0.1, 0.0, 0.3, 0.5, 0.7, 0.9, 1.0])
+    def test_same_decisions_as_brute_force(self, threshold):
+        corpus = _corpus(200)
+        rng = random.Random(2)
+        candidates = _corpus(50, seed=3) + [[]]
+        for tokens in corpus[:50]:
+            mutated = list(tokens)
+            mutated[rng.randrange(len(mutated))] = "novel"
+            candidates.append(mutated)
+        engine = IndexedRougeSimilarity(corpus)
+        for tokens in candidates:
+            expected = _brute_force(tokens, corpus) > threshold
+            assert engine.is_duplicate(tokens, threshold) == expected
+
+    def test_empty_corpus(self):
+        engine = IndexedRougeSimilarity()
+        assert not engine.is_duplicate(["a", "b"], 0.5)
+        engine.add(["a", "b"])
+        assert engine.is_duplicate(["a", "b"], 0.5)
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            get_similarity_backend("minhash")
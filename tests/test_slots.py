@@ -0,0 +1,169 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import asyncio
+
+# Third Party
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+import httpx
+import pytest
+
+# First Party
+from instructlab.slots import QueueFullException, SlotMiddleware, SlotPool
+
+
+async def _hold(pool, order, name, priority=0, started=None):
+    async with pool.slot(priority) as slot:
+        order.append(name)
+        if started is not None:
+            started.set()
+        await asyncio.sleep(0.01)
+        return slot
+
+
+class TestSlotPool:
+    @pytest.mark.asyncio
+    async def test_fifo_and_priority(self):
+        pool = SlotPool(["slot"], max_queue=10)
+        order = []
+        started = asyncio.Event()
+        first = asyncio.create_task(_hold(pool, order, "first", started=started))
+        await started.wait()
+        tasks = [asyncio.create_task(_hold(pool, order, f"low{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(_hold(pool, order, "high", priority=1)))
+        await asyncio.gather(first, *tasks)
+        assert order == ["first", "high", "low0", "low1", "low2"]
+        assert pool.free == 1
+        assert pool.waiting == 0
+
+    @pytest.mark.asyncio
+    async def test_parallel_slots(self):
+        pool = SlotPool(["a", "b"], max_queue=0)
+        order = []
+        slots = await asyncio.gather(
+            _hold(pool, order, "one"), _hold(pool, order, "two")
+        )
+        assert sorted(slots) == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_queue_full(self):
+        pool = SlotPool(["slot"], max_queue=1)
+        slot = await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullException) as exc:
+            await pool.acquire()
+        assert exc.value.retry_after >= 1
+        pool.release(slot)
+        assert await waiter == slot
+
+    @pytest.mark.asyncio
+    async def test_timeout_and_cancel(self):
+        pool = SlotPool(["slot"], max_queue=5, queue_timeout=0.01)
+        slot = await pool.acquire()
+        with pytest.raises(QueueFullException):
+            await pool.acquire()
+        pool.queue_timeout = 10
+        cancelled = asyncio.create_task(pool.acquire())
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        # the slot skips the requests that gave up
+        pool.release(slot)
+        assert await waiter == slot
+        assert pool.waiting == 0
+
+
+class _Metrics:
+    def __init__(self):
+        self.done = []
+        self.rejected = []
+
+    def request_done(self, path, status, _arrival, slot):
+        self.done.append((path, status, slot))
+
+    def request_rejected(self, path):
+        self.rejected.append(path)
+
+
+def _app(pool, metrics=None):
+    async def complete(request: Request):
+        await asyncio.sleep(0.05)
+        return JSONResponse({"slot": request.state.slot})
+
+    async def stream(request: Request):
+        slot = request.state.slot
+
+        async def chunks():
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield f"{slot} {i} {pool.free}\n"
+
+        return StreamingResponse(chunks())
+
+    async def models(request: Request):
+        return JSONResponse({"slot": getattr(request.state, "slot", None)})
+
+    app = Starlette(
+        routes=[
+            Route("/v1/chat/completions", complete, methods=["POST"]),
+            Route("/v1/completions", stream, methods=["POST"]),
+            Route("/v1/models", models),
+        ]
+    )
+    app.add_middleware(SlotMiddleware, pool=pool, metrics=metrics)
+    return app
+
+
+class TestSlotMiddleware:
+    @pytest.mark.asyncio
+    async def test_backpressure(self):
+        pool = SlotPool(["a", "b"], max_queue=2)
+        transport = httpx.ASGITransport(app=_app(pool))
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            responses = await asyncio.gather(
+                *[client.post("/v1/chat/completions") for _ in range(6)]
+            )
+            statuses = sorted(r.status_code for r in responses)
+            assert statuses == [200] * 4 + [503] * 2
+            rejected = next(r for r in responses if r.status_code == 503)
+            assert int(rejected.headers["retry-after"]) >= 1
+            assert rejected.json()["error"]["type"] == "server_overloaded"
+
+            # requests not running the model don't take a slot
+            response = await client.get("/v1/models")
+            assert response.json() == {"slot": None}
+
+    @pytest.mark.asyncio
+    async def test_slot_held_while_streaming(self):
+        pool = SlotPool(["a"], max_queue=0)
+        transport = httpx.ASGITransport(app=_app(pool))
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            response = await client.post("/v1/completions")
+            assert response.text.splitlines() == ["a 0 0", "a 1 0", "a 2 0"]
+            assert pool.free == 1
+
+    @pytest.mark.asyncio
+    async def test_metrics(self):
+        pool = SlotPool(["a"], max_queue=0)
+        metrics = _Metrics()
+        transport = httpx.ASGITransport(app=_app(pool, metrics))
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            await asyncio.gather(
+                client.post("/v1/chat/completions"), client.post("/v1/completions")
+            )
+            await client.get("/v1/models")
+        assert len(metrics.done) == 1
+        assert metrics.done[0][1:] == (200, "a")
+        assert len(metrics.rejected) == 1
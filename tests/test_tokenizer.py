@@ -0,0 +1,111 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from unittest.mock import Mock
+
+# Third Party
+from tokenizers import Tokenizer as HFTokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+import pytest
+
+# First Party
+from instructlab import utils
+from instructlab.client import ClientException, ClientSession
+from instructlab.generator.generate_data import fit_prompt
+from instructlab.tokenizer import (
+    HeuristicTokenizer,
+    ServerTokenizer,
+    Tokenizer,
+    TokenizerException,
+    get_tokenizer,
+)
+
+# Local
+from .testdata import testdata
+
+
+@pytest.fixture(name="word_tokenizer")
+def fixture_word_tokenizer(tmp_path):
+    """A tokenizer.json that counts one token per word or punctuation mark."""
+    tokenizer = HFTokenizer(WordLevel({"[UNK]": 0}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    path = tmp_path / "tokenizer.json"
+    tokenizer.save(str(path))
+    return str(path)
+
+
+class TestTokenizer:
+    def test_abstract(self):
+        with pytest.raises(TypeError):
+            Tokenizer()  # pylint: disable=abstract-class-instantiated
+
+    def test_heuristic(self):
+        tokenizer = get_tokenizer("heuristic")
+        assert tokenizer.count("x" * 41) == utils.num_tokens_from_chars(41)
+
+    def test_hugging_face(self, word_tokenizer, tmp_path):
+        tokenizer = get_tokenizer(word_tokenizer)
+        assert tokenizer.count("one two, three") == 4
+        # a directory holding a tokenizer.json works as well
+        assert get_tokenizer(str(tmp_path)).count("one two") == 2
+
+    def test_hugging_face_missing(self, tmp_path):
+        with pytest.raises(TokenizerException):
+            get_tokenizer(str(tmp_path / "missing" / "tokenizer.json"))
+
+    def test_server_cached(self):
+        session = Mock(spec=ClientSession)
+        session.count_tokens.return_value = 7
+        tokenizer = ServerTokenizer(session, "my-model")
+        assert tokenizer.count("some text") == 7
+        assert tokenizer.count("some text") == 7
+        session.count_tokens.assert_called_once_with("some text", "my-model")
+
+    def test_server_error(self):
+        session = Mock(spec=ClientSession)
+        session.count_tokens.side_effect = ClientException("Connection Error")
+        with pytest.raises(TokenizerException):
+            get_tokenizer("server", session=session).count("some text")
+
+    def test_server_needs_session(self):
+        with pytest.raises(TokenizerException):
+            get_tokenizer("server")
+
+
+class TestTokenBudget:
+    def test_chunk_document_tokens(self, word_tokenizer):
+        tokenizer = get_tokenizer(word_tokenizer)
+        chunk_words = 50
+        chunks = utils.chunk_document(
+            documents=testdata.documents,
+            server_ctx_size=4096,
+            chunk_word_count=chunk_words,
+            tokenizer=tokenizer,
+        )
+        assert len(chunks) > 1
+        max_tokens = utils.num_tokens_from_words(chunk_words)
+        for chunk in chunks:
+            assert tokenizer.count(chunk) <= max_tokens
+
+    def test_max_seed_example_tokens(self):
+        assert utils.max_seed_example_tokens(4096, 4000) == (4096 - 1024 - 1000) // 2
+        assert (
+            utils.max_seed_example_tokens(4096, 4000, prompt_num_tokens=72)
+            == (4096 - 1024 - 72) // 2
+        )
+
+    def test_fit_prompt(self):
+        tokenizer = HeuristicTokenizer()
+        example = {
+            "instruction": "What is the answer?",
+            "input": "",
+            "output": "42",
+            "taxonomy_path": "knowledge",
+            "task_description": "",
+            "document": ["x" * 4000, "short document"],
+        }
+        prompt = fit_prompt([example, example], "{{document}}\n", tokenizer, 100)
+        assert prompt.startswith("short document")
+        assert tokenizer.count(prompt) <= 100
+        assert fit_prompt([example, example], "{{document}}\n", tokenizer, 10) is None
@@ -57,6 +57,32 @@ class TestUtils:
         for chunk in chunks:
             assert len(chunk) <= max_chars
 
+    def test_iter_chunks(self):
+        documents = iter(["one two three four\n\nfive six\nseven", "", "eight"])
+        chunks = utils.iter_chunks(documents, chunk_size=10, chunk_overlap=4)
+        assert next(chunks) == "one two"
+        assert list(chunks) == [
+            "two three",
+            "four",
+            "five six",
+            "seven",
+            "eight",
+        ]
+
+    def test_iter_chunks_length_function(self):
+        chunks = utils.iter_chunks(
+            ["aaaa bbbb cccc dddd eeee"],
+            chunk_size=2,
+            chunk_overlap=1,
+            length_function=lambda text: len(text.split()),
+        )
+        assert list(chunks) == [
+            "aaaa bbbb",
+            "bbbb cccc",
+            "cccc dddd",
+            "dddd eeee",
+        ]
+
     @patch(
         "instructlab.utils.git_clone_checkout",
         return_value=Mock(spec=git.Repo, working_dir="tests/testdata/temp_repo"),
@@ -72,3 +98,76 @@ class TestUtils:
             )
             git_clone_checkout.assert_called_once()
             assert len(documents) == 2
+
+    def test_get_taxonomy_diff(self, taxonomy_dir):
+        repo = git.Repo(taxonomy_dir.root)
+        taxonomy_dir.add_tracked("compositional_skills/on_main/qna.yaml")
+        repo.git.checkout("-b", "feature")
+        for i in range(3):
+            taxonomy_dir.add_tracked(f"compositional_skills/tracked{i}/qna.yaml")
+        taxonomy_dir.create_untracked("compositional_skills/untracked/qna.yaml")
+        taxonomy_dir.create_untracked("compositional_skills/notes.txt", b"notes")
+        taxonomy_dir.remove_file("compositional_skills/tracked0/qna.yaml")
+        (taxonomy_dir.root / "compositional_skills/on_main/qna.yaml").write_text(
+            "edited", encoding="utf-8"
+        )
+
+        assert utils.get_taxonomy_diff(taxonomy_dir.root, "main") == [
+            "compositional_skills/on_main/qna.yaml",
+            "compositional_skills/tracked1/qna.yaml",
+            "compositional_skills/tracked2/qna.yaml",
+            "compositional_skills/untracked/qna.yaml",
+        ]
+        # a commit as base diffs from that commit
+        assert utils.get_taxonomy_diff(taxonomy_dir.root, "HEAD~1") == [
+            "compositional_skills/on_main/qna.yaml",
+            "compositional_skills/tracked2/qna.yaml",
+            "compositional_skills/untracked/qna.yaml",
+        ]
+
+    def test_get_taxonomy_diff_unknown_base(self, taxonomy_dir):
+        with pytest.raises(SystemExit, match="taxonomy git ref"):
+            utils.get_taxonomy_diff(taxonomy_dir.root, "no-such-ref")
+        with pytest.raises(SystemExit, match="taxonomy base branch"):
+            utils.get_taxonomy_diff(taxonomy_dir.root, "origin/main")
+
+    def test_read_taxonomy_parallel(self, taxonomy_dir, caplog, monkeypatch):
+        for i, name in enumerate(
+            [
+                "skill_valid_answer.yaml",
+                "skill_incomplete.yaml",
+                "skill_invalid_answer.yaml",
+                "skill_too_long_answer.yaml",
+            ]
+        ):
+            with open(f"tests/testdata/{name}", "rb") as f:
+                taxonomy_dir.create_untracked(
+                    f"compositional_skills/skill{i}/qna.yaml", f.read()
+                )
+        taxonomy_dir.create_untracked(
+            "compositional_skills/empty/qna.yaml", b"# empty\n"
+        )
+        taxonomy_dir.create_untracked(
+            "compositional_skills/lint/qna.yaml", b"version: 2\na: 1   \n"
+        )
+
+        def read():
+            caplog.clear()
+            with pytest.raises(SystemExit):
+                utils.read_taxonomy(
+                    logging.getLogger("_test_"), taxonomy_dir.root, "main", None
+                )
+            return [
+                (r.levelno, r.getMessage())
+                for r in caplog.records
+                if r.name == "_test_"
+            ]
+
+        with caplog.at_level(logging.DEBUG):
+            serial = read()
+            monkeypatch.setattr(utils, "DEFAULT_PARALLEL_TAXONOMY_FILES", 2)
+            parallel = read()
+        assert serial == parallel
+        assert [message for _, message in serial if "Problems found" in message]
+        assert [message for _, message in serial if "Validation error" in message]
+        assert [message for _, message in serial if "Skipping" in message]
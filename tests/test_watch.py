@@ -0,0 +1,119 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import logging
+import pathlib
+import sys
+
+# Third Party
+import git
+import pytest
+
+# First Party
+from instructlab import watch
+
+# Local
+from .taxonomy import TEST_VALID_COMPOSITIONAL_SKILL_YAML
+
+INVALID_SKILL_YAML = TEST_VALID_COMPOSITIONAL_SKILL_YAML.replace(
+    "task_description: 'This is a task'\n", ""
+)
+
+
+@pytest.fixture(
+    name="monitor_cls",
+    params=[
+        pytest.param(
+            watch.InotifyMonitor,
+            marks=pytest.mark.skipif(
+                not sys.platform.startswith("linux"), reason="inotify is Linux only"
+            ),
+        ),
+        lambda root: watch.PollingMonitor(root, interval=0.01),
+    ],
+)
+def fixture_monitor_cls(request):
+    return request.param
+
+
+class TestMonitor:
+    def test_changes(self, taxonomy_dir, monitor_cls):
+        path = "compositional_skills/skill/qna.yaml"
+        monitor = monitor_cls(str(taxonomy_dir.root))
+        try:
+            assert not monitor.wait(timeout=0.05)
+
+            taxonomy_dir.create_untracked(path)
+            changes = monitor.wait(timeout=1)
+            assert path in changes.paths
+            assert not changes.rescan
+
+            taxonomy_dir.remove_file(path)
+            assert path in monitor.wait(timeout=1).paths
+
+            taxonomy_dir.add_tracked(path)
+            changes = monitor.wait(timeout=1)
+            while not changes.rescan:
+                changes = monitor.wait(timeout=1)
+                assert changes
+        finally:
+            monitor.close()
+
+
+class TestTaxonomyWatcher:
+    def test_update(self, taxonomy_dir):
+        watcher = watch.TaxonomyWatcher(
+            logging.getLogger("_test_"), str(taxonomy_dir.root), "main"
+        )
+        taxonomy_dir.create_untracked("compositional_skills/valid/qna.yaml")
+        path = "compositional_skills/skill/qna.yaml"
+        taxonomy_dir.create_untracked(path, INVALID_SKILL_YAML.encode("utf-8"))
+        assert len(watcher.rescan()) == 2
+        assert watcher.files_with_errors == [path]
+
+        # unchanged files are not read again
+        assert not watcher.rescan()
+        assert not watcher.update([path, "README.md"])
+
+        taxonomy_dir.create_untracked(path)
+        assert watcher.update([path]) == [path]
+        assert not watcher.errors
+
+        taxonomy_dir.remove_file(path)
+        assert watcher.update([path]) == [path]
+        assert list(watcher.results) == ["compositional_skills/valid/qna.yaml"]
+
+        # files committed to the base are dropped
+        repo = git.Repo(taxonomy_dir.root)
+        repo.index.add(["compositional_skills/valid/qna.yaml"])
+        repo.index.commit("add skill")
+        assert watcher.rescan() == ["compositional_skills/valid/qna.yaml"]
+        assert not watcher.results
+
+    def test_documents_not_found(self, taxonomy_dir, tmp_path):
+        watcher = watch.TaxonomyWatcher(
+            logging.getLogger("_test_"), str(taxonomy_dir.root), "main"
+        )
+        doc_repo = git.Repo.init(tmp_path / "docs")
+        (tmp_path / "docs" / "notes.txt").write_text("no markdown", encoding="utf-8")
+        doc_repo.index.add(["notes.txt"])
+        commit = doc_repo.index.commit("add notes").hexsha
+        knowledge = pathlib.Path("tests/testdata/knowledge_valid.yaml").read_text(
+            encoding="utf-8"
+        )
+        knowledge = knowledge.replace(
+            "https://github.com/example-org/example-repo", str(tmp_path / "docs")
+        ).replace("a0c3c8e", commit)
+        knowledge += "\n"
+        # a repository without documents, and one that does not exist
+        no_documents = "knowledge/no_documents/qna.yaml"
+        taxonomy_dir.create_untracked(no_documents, knowledge.encode("utf-8"))
+        no_repo = "knowledge/no_repo/qna.yaml"
+        taxonomy_dir.create_untracked(
+            no_repo,
+            knowledge.replace(str(tmp_path / "docs"), str(tmp_path / "nowhere")).encode(
+                "utf-8"
+            ),
+        )
+        assert len(watcher.rescan()) == 2
+        assert watcher.files_with_errors == [no_documents, no_repo]